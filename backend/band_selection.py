@@ -0,0 +1,144 @@
+"""
+读取时的波段裁剪：wl_min / wl_max 波长范围、bands 波段下标、step 步长
+每条波长轴只解析一次（单调轴用二分查找），之后对每行做数组切片；
+只有范围和步长时得到 slice，numpy 切片是视图，不复制数据
+"""
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+import numpy as np
+from fastapi import HTTPException, Query, status
+
+Selector = Union[slice, np.ndarray]
+
+MAX_BANDS = 65536  # bands 参数最多展开的下标个数
+
+
+class BandSelection(NamedTuple):
+    wl_min: Optional[float] = None
+    wl_max: Optional[float] = None
+    bands: Optional[Tuple[int, ...]] = None
+    step: int = 1
+
+    def resolve(self, axis: Sequence[float]) -> Selector:
+        """把条件解析为这条波长轴上的下标"""
+        axis = np.asarray(axis, dtype=np.float64)
+        lo, hi = 0, len(axis)
+        if self.wl_min is not None or self.wl_max is not None:
+            diffs = np.diff(axis)
+            if np.all(diffs >= 0):
+                lo, hi = self._search(axis)
+            elif np.all(diffs <= 0):
+                # 递减的轴（例如波数）：在反转后的视图上查找再换算回来
+                r_lo, r_hi = self._search(axis[::-1])
+                lo, hi = len(axis) - r_hi, len(axis) - r_lo
+            else:
+                mask = np.ones(len(axis), dtype=bool)
+                if self.wl_min is not None:
+                    mask &= axis >= self.wl_min
+                if self.wl_max is not None:
+                    mask &= axis <= self.wl_max
+                index = np.flatnonzero(mask)
+                if self.bands is not None:
+                    index = index[np.isin(index, self.bands)]
+                return index[::self.step]
+
+        if self.bands is None:
+            return slice(lo, max(lo, hi), self.step)
+        index = np.asarray(self.bands, dtype=np.intp)
+        return index[(index >= lo) & (index < hi)][::self.step]
+
+    def _search(self, ascending: np.ndarray) -> Tuple[int, int]:
+        lo = 0 if self.wl_min is None else int(np.searchsorted(ascending, self.wl_min, side="left"))
+        hi = len(ascending) if self.wl_max is None else int(np.searchsorted(ascending, self.wl_max, side="right"))
+        return lo, hi
+
+
+class AxisSlicer:
+    """
+    一次请求内按波长轴缓存解析结果：共享波长轴的数据集只解析一次，
+    不等长数据集按 wavelength_grid_id 缓存，没有 grid 的旧行逐行解析
+    """
+
+    def __init__(self, selection: BandSelection):
+        self.selection = selection
+        self._cache: Dict[int, Selector] = {}
+
+    def selector(self, wavelengths, grid_id: Optional[int] = None) -> Selector:
+        if grid_id is None:
+            return self.selection.resolve(wavelengths)
+        if grid_id not in self._cache:
+            self._cache[grid_id] = self.selection.resolve(wavelengths)
+        return self._cache[grid_id]
+
+    def axis(self, axis, grid_id: Optional[int] = None) -> np.ndarray:
+        axis = np.asarray(axis, dtype=np.float64)
+        return axis[self.selector(axis, grid_id)]
+
+    def row(self, wavelengths, values, grid_id: Optional[int] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """裁剪一行，返回 (wavelengths, values) 数组；values 为 None 时只裁剪波长"""
+        wavelengths = np.asarray(wavelengths if wavelengths is not None else [], dtype=np.float64)
+        index = self.selector(wavelengths, grid_id)
+        if values is None:
+            return wavelengths[index], None
+        values = np.asarray(values, dtype=np.float64)
+        if isinstance(index, np.ndarray):
+            index = index[index < min(len(wavelengths), len(values))]
+        return wavelengths[index], values[index]
+
+    def matrix(self, axis, matrix: np.ndarray, grid_id: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """裁剪共享波长轴的矩阵 (n x bands)，返回 (axis, matrix)"""
+        axis = np.asarray(axis, dtype=np.float64)
+        index = self.selector(axis, grid_id)
+        return axis[index], matrix[:, index]
+
+
+def slicer(selection: Optional[BandSelection]) -> Optional[AxisSlicer]:
+    return AxisSlicer(selection) if selection is not None else None
+
+
+def _parse_bands(value: str) -> Tuple[int, ...]:
+    """逗号分隔的下标，也接受 a-b 闭区间"""
+    bands: List[int] = []
+    try:
+        for part in value.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            start, sep, end = part.partition("-")
+            if sep:
+                start, end = int(start), int(end)
+                # 先检查区间长度，避免展开 0-1000000000000 这样的区间
+                if end - start + 1 > MAX_BANDS - len(bands):
+                    raise ValueError
+                bands.extend(range(start, end + 1))
+            else:
+                bands.append(int(part))
+            if len(bands) > MAX_BANDS:
+                raise ValueError
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"bands must be at most {MAX_BANDS} comma-separated band indices or ranges like 10-20"
+        )
+    if any(b < 0 for b in bands):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Band indices must not be negative"
+        )
+    return tuple(sorted(set(bands)))
+
+
+def band_query(
+    wl_min: Optional[float] = Query(None, description="Keep bands at or above this wavelength"),
+    wl_max: Optional[float] = Query(None, description="Keep bands at or below this wavelength"),
+    bands: Optional[str] = Query(None, description="Band indices to keep, e.g. 0,5,10-20"),
+    step: int = Query(1, ge=1, description="Keep every step-th band of the selection"),
+) -> Optional[BandSelection]:
+    """FastAPI 依赖：没有任何裁剪参数时返回 None"""
+    if wl_min is not None and wl_max is not None and wl_min > wl_max:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="wl_min must not be greater than wl_max"
+        )
+    if wl_min is None and wl_max is None and bands is None and step == 1:
+        return None
+    return BandSelection(wl_min, wl_max, _parse_bands(bands) if bands is not None else None, step)
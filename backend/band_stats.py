@@ -0,0 +1,294 @@
+"""
+逐波段统计量的增量维护
+每次 append_samples 写入一批样本时，先算出这一批的逐波段计数、均值、M2（离差平方和）、最小值和最大值，
+再用 Chan 等人的并行合并公式并入 dataset_band_stats 中已有的结果（Welford 算法的批量形式），
+按标签分组的计数和均值同样合并；读取摘要只需解码一行，耗时与样本数无关
+
+统计只针对数据集第一批样本的波长轴；其他轴上的样本（不等长样本）计入 excluded_samples
+NaN / inf 不参与统计，因此每个波段有自己的计数
+旧数据集没有统计行时，第一次读取摘要会遍历样本重建一次
+"""
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from config import settings
+from models import Dataset, DatasetBandStats, SpectralSample
+import spectral_storage
+import wavelength_grids
+
+COUNT_DTYPE = np.dtype("<i8")
+VALUE_DTYPE = np.dtype("<f8")
+
+_REBUILD_BATCH = 1000
+
+
+def _batch_moments(matrix: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """一批样本 (n x bands) 的逐波段 (计数, 均值, M2, 最小值, 最大值)，忽略非有限值"""
+    finite = np.isfinite(matrix)
+    counts = finite.sum(axis=0).astype(COUNT_DTYPE)
+    sums = np.where(finite, matrix, 0.0).sum(axis=0)
+    mean = np.divide(sums, counts, out=np.zeros(matrix.shape[1]), where=counts > 0)
+    deviations = np.where(finite, matrix - mean, 0.0)
+    m2 = (deviations * deviations).sum(axis=0)
+    minimum = np.where(finite, matrix, np.inf).min(axis=0)
+    maximum = np.where(finite, matrix, -np.inf).max(axis=0)
+    return counts, mean, m2, minimum, maximum
+
+
+def _merge(n_a, mean_a, m2_a, n_b, mean_b, m2_b) -> Tuple[np.ndarray, ...]:
+    """Chan 等人的合并公式：两组各自的 (n, mean, M2) 合并为整体的结果"""
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    weight = np.divide(n_b, n, out=np.zeros(n.shape), where=n > 0)
+    mean = mean_a + delta * weight
+    m2 = m2_a + m2_b + delta * delta * n_a * weight
+    return n, mean, m2
+
+
+def _decode(data: Optional[bytes], dtype: np.dtype, shape) -> np.ndarray:
+    if not data:
+        return np.zeros(shape, dtype=dtype)
+    return np.frombuffer(data, dtype=dtype).reshape(shape).copy()
+
+
+def _label_key(label) -> Optional[str]:
+    return None if label is None or label == "" else str(label)
+
+
+def _get_stats(db: Session, dataset: Dataset) -> Optional[DatasetBandStats]:
+    query = db.query(DatasetBandStats).filter(DatasetBandStats.dataset_id == dataset.id)
+    if db.get_bind().dialect.name == "postgresql":
+        # 同一数据集的并发上传依次合并
+        query = query.with_for_update()
+    return query.first()
+
+
+def _new_stats(db: Session, dataset: Dataset, grid_id: int, num_bands: int) -> DatasetBandStats:
+    """
+    新建统计行；数据集中已经保存的样本（先导入的不等长样本、没有统计行的旧数据）都不在统计里，
+    计入 excluded_samples，否则 value_range 会把部分统计当作完整的
+    """
+    stored = db.query(func.count(SpectralSample.id)).filter(SpectralSample.dataset_id == dataset.id).scalar()
+    stats = DatasetBandStats(
+        dataset_id=dataset.id,
+        wavelength_grid_id=grid_id,
+        num_bands=num_bands,
+        num_samples=0,
+        excluded_samples=stored or 0,
+        counts=np.zeros(num_bands, dtype=COUNT_DTYPE).tobytes(),
+        mean=np.zeros(num_bands, dtype=VALUE_DTYPE).tobytes(),
+        m2=np.zeros(num_bands, dtype=VALUE_DTYPE).tobytes(),
+        min=np.full(num_bands, np.inf, dtype=VALUE_DTYPE).tobytes(),
+        max=np.full(num_bands, -np.inf, dtype=VALUE_DTYPE).tobytes(),
+        labels=[],
+    )
+    db.add(stats)
+    db.flush()
+    return stats
+
+
+def update(
+    db: Session,
+    dataset: Dataset,
+    wavelengths: Sequence[float],
+    intensities: np.ndarray,
+    sample_labels: Sequence[Optional[str]],
+):
+    """把一批共享波长轴的样本并入数据集的统计量（不提交事务）"""
+    matrix = np.asarray(intensities, dtype=np.float64)
+    num_rows, num_bands = matrix.shape
+    if num_rows == 0:
+        return
+
+    grid_id = wavelength_grids.get_or_create_grid(db, wavelengths).id
+    stats = _get_stats(db, dataset)
+    if stats is None:
+        stats = _new_stats(db, dataset, grid_id, num_bands)
+    elif stats.wavelength_grid_id != grid_id:
+        stats.excluded_samples = (stats.excluded_samples or 0) + num_rows
+        return
+
+    # 全部样本
+    counts, mean, m2, minimum, maximum = _batch_moments(matrix)
+    n, mean, m2 = _merge(
+        _decode(stats.counts, COUNT_DTYPE, num_bands), _decode(stats.mean, VALUE_DTYPE, num_bands),
+        _decode(stats.m2, VALUE_DTYPE, num_bands), counts, mean, m2
+    )
+    stats.counts = n.astype(COUNT_DTYPE).tobytes()
+    stats.mean = mean.astype(VALUE_DTYPE).tobytes()
+    stats.m2 = m2.astype(VALUE_DTYPE).tobytes()
+    stats.min = np.minimum(_decode(stats.min, VALUE_DTYPE, num_bands), minimum).tobytes()
+    stats.max = np.maximum(_decode(stats.max, VALUE_DTYPE, num_bands), maximum).tobytes()
+    stats.num_samples = (stats.num_samples or 0) + num_rows
+
+    _update_labels(stats, matrix, sample_labels)
+
+
+def _update_labels(stats: DatasetBandStats, matrix: np.ndarray, sample_labels: Sequence[Optional[str]]):
+    """
+    按标签合并计数和均值
+    标签种类超过 BAND_STATS_MAX_LABELS 时（例如标签就是样本名）不再按标签统计，labels 置为 None
+    """
+    if stats.labels is None:
+        return
+    num_bands = matrix.shape[1]
+    labels = [list(entry) for entry in stats.labels]
+    shape = (len(labels), num_bands)
+    label_counts = _decode(stats.label_counts, COUNT_DTYPE, shape)
+    label_means = _decode(stats.label_means, VALUE_DTYPE, shape)
+    index = {entry[0]: i for i, entry in enumerate(labels)}
+
+    keys = [_label_key(label) for label in sample_labels]
+    distinct = dict.fromkeys(keys)
+    if len(index) + sum(1 for key in distinct if key not in index) > settings.BAND_STATS_MAX_LABELS:
+        stats.labels = None
+        stats.label_counts = None
+        stats.label_means = None
+        return
+
+    for key in distinct:
+        rows = matrix[[i for i, k in enumerate(keys) if k == key]]
+        if key not in index:
+            index[key] = len(labels)
+            labels.append([key, 0])
+            label_counts = np.vstack([label_counts, np.zeros((1, num_bands), dtype=COUNT_DTYPE)])
+            label_means = np.vstack([label_means, np.zeros((1, num_bands), dtype=VALUE_DTYPE)])
+        i = index[key]
+        finite = np.isfinite(rows)
+        batch_counts = finite.sum(axis=0)
+        batch_sums = np.where(finite, rows, 0.0).sum(axis=0)
+        total = label_counts[i] + batch_counts
+        label_means[i] += np.divide(
+            batch_sums - batch_counts * label_means[i], total,
+            out=np.zeros(num_bands), where=total > 0
+        )
+        label_counts[i] = total
+        labels[i][1] += len(rows)
+
+    stats.labels = labels
+    stats.label_counts = label_counts.astype(COUNT_DTYPE).tobytes()
+    stats.label_means = label_means.astype(VALUE_DTYPE).tobytes()
+
+
+def exclude(db: Session, dataset: Dataset, num_rows: int):
+    """记录不在统计轴上的样本（不等长样本）"""
+    stats = _get_stats(db, dataset)
+    if stats is not None:
+        stats.excluded_samples = (stats.excluded_samples or 0) + num_rows
+    # 还没有统计行时，之后第一批共享轴的样本创建统计行时会把这些样本计入 excluded_samples
+
+
+def rebuild(db: Session, dataset: Dataset) -> Optional[DatasetBandStats]:
+    """遍历数据集的全部样本重新计算统计量（不提交事务）；excluded_samples 最后按遍历结果设置"""
+    stats = _get_stats(db, dataset)
+    if stats is not None:
+        db.delete(stats)
+        db.flush()
+
+    excluded = 0
+    axis: Optional[List[float]] = None
+    rows: List[List[float]] = []
+    labels: List[Optional[str]] = []
+
+    def flush():
+        if rows:
+            update(db, dataset, axis, np.asarray(rows, dtype=np.float64), labels)
+            db.flush()
+            rows.clear()
+            labels.clear()
+
+    for sample in spectral_storage.iter_samples(db, dataset, _REBUILD_BATCH):
+        wavelengths = sample.get("wavelengths")
+        intensities = sample.get("intensities")
+        if not wavelengths or not intensities or len(wavelengths) != len(intensities):
+            excluded += 1
+            continue
+        if axis is None:
+            axis = wavelengths
+        elif wavelengths != axis:
+            excluded += 1
+            continue
+        rows.append(intensities)
+        labels.append(sample.get("sample_label"))
+        if len(rows) >= _REBUILD_BATCH:
+            flush()
+    flush()
+
+    stats = _get_stats(db, dataset)
+    if stats is not None:
+        stats.excluded_samples = excluded
+    return stats
+
+
+def value_range(db: Session, dataset: Dataset) -> Optional[Tuple[float, float]]:
+    """统计量覆盖全部样本时返回所有波段的 (最小值, 最大值)，否则返回 None"""
+    stats = _get_stats(db, dataset)
+    if stats is None or stats.excluded_samples or not stats.num_samples:
+        return None
+    minimum = _decode(stats.min, VALUE_DTYPE, stats.num_bands)
+    maximum = _decode(stats.max, VALUE_DTYPE, stats.num_bands)
+    finite = np.isfinite(minimum) & np.isfinite(maximum)
+    if not finite.any():
+        return None
+    return float(minimum[finite].min()), float(maximum[finite].max())
+
+
+def _finite_or_none(values: np.ndarray) -> List[Optional[float]]:
+    return [float(v) if np.isfinite(v) else None for v in values]
+
+
+def summary(db: Session, dataset: Dataset) -> dict:
+    """数据集的逐波段摘要；没有统计行但已有样本时先重建（调用方负责 commit）"""
+    stats = _get_stats(db, dataset)
+    if stats is None and (dataset.num_samples or 0) > 0:
+        stats = rebuild(db, dataset)
+
+    if stats is None:
+        return {
+            "dataset_id": dataset.id,
+            "num_samples": 0,
+            "excluded_samples": 0,
+            "wavelengths": [],
+            "count": [],
+            "mean": [],
+            "std": [],
+            "min": [],
+            "max": [],
+            "labels_tracked": True,
+            "labels": [],
+        }
+
+    num_bands = stats.num_bands
+    counts = _decode(stats.counts, COUNT_DTYPE, num_bands)
+    mean = _decode(stats.mean, VALUE_DTYPE, num_bands)
+    m2 = _decode(stats.m2, VALUE_DTYPE, num_bands)
+    # 样本标准差 (n - 1)，只有一个值的波段为 0
+    std = np.sqrt(np.divide(m2, counts - 1, out=np.zeros(num_bands), where=counts > 1))
+    has_data = counts > 0
+
+    labels = stats.labels or []
+    shape = (len(labels), num_bands)
+    label_counts = _decode(stats.label_counts, COUNT_DTYPE, shape)
+    label_means = _decode(stats.label_means, VALUE_DTYPE, shape)
+
+    return {
+        "dataset_id": dataset.id,
+        "num_samples": stats.num_samples or 0,
+        "excluded_samples": stats.excluded_samples or 0,
+        "wavelengths": wavelength_grids.load_grid(db, stats.wavelength_grid_id) or [],
+        "count": counts.tolist(),
+        "mean": _finite_or_none(np.where(has_data, mean, np.nan)),
+        "std": _finite_or_none(np.where(has_data, std, np.nan)),
+        "min": _finite_or_none(_decode(stats.min, VALUE_DTYPE, num_bands)),
+        "max": _finite_or_none(_decode(stats.max, VALUE_DTYPE, num_bands)),
+        "labels_tracked": stats.labels is not None,
+        "labels": [
+            {
+                "label": label,
+                "num_samples": num_samples,
+                "mean": _finite_or_none(np.where(label_counts[i] > 0, label_means[i], np.nan)),
+            }
+            for i, (label, num_samples) in enumerate(labels)
+        ],
+    }
@@ -0,0 +1,87 @@
+"""
+SpectralSample 批量写入
+绕过 ORM 的 unit-of-work，按 INGEST_BATCH_ROWS 一批写入：
+PostgreSQL 使用 COPY FROM STDIN，其他数据库使用 Core insert() executemany
+写入走 Session 当前的连接和事务，由调用方 commit，一次上传只有一个事务
+"""
+from typing import Iterable, List, Optional
+from datetime import datetime
+import io
+import json
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from config import settings
+from models import SpectralSample
+
+# 批量写入的列，顺序即 COPY 的列顺序
+SAMPLE_COLUMNS = (
+    "dataset_id",
+    "sample_name",
+    "sample_label",
+    "row_index",
+    "wavelength_grid_id",
+    "intensities",
+    "created_at",
+)
+
+
+def _batches(rows: List[dict], size: int) -> Iterable[List[dict]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _copy_field(value) -> str:
+    """COPY csv 格式：未加引号的空字段是 NULL，字符串一律加引号以区分空字符串"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return _copy_field(json.dumps(value))
+    return str(value)
+
+
+def _copy_samples(db: Session, rows: List[dict]):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(_copy_field(row.get(column)) for column in SAMPLE_COLUMNS))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    # 使用 Session 持有的 DBAPI 连接，COPY 与其余写入在同一个事务里
+    dbapi_connection = db.connection().connection.driver_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {SpectralSample.__tablename__} ({', '.join(SAMPLE_COLUMNS)}) "
+            f"FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+
+def insert_samples(db: Session, rows: List[dict], batch_size: Optional[int] = None) -> int:
+    """
+    写入样本行（字典的键为 SAMPLE_COLUMNS 的子集），返回写入的行数
+    不经过 ORM，写入的行不会出现在 Session 的 identity map 中
+    """
+    if not rows:
+        return 0
+    batch_size = max(1, batch_size or settings.INGEST_BATCH_ROWS)
+    use_copy = db.get_bind().dialect.name == "postgresql"
+
+    now = datetime.utcnow()
+    for row in rows:
+        row.setdefault("created_at", now)
+
+    for batch in _batches(rows, batch_size):
+        if use_copy:
+            _copy_samples(db, batch)
+            continue
+        # executemany 要求每组参数的键相同；不传的列保持 SQL NULL（JSON 列传 None 会写成 'null'）
+        groups = {}
+        for row in batch:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        for group in groups.values():
+            db.execute(insert(SpectralSample), group)
+    return len(rows)
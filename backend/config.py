@@ -16,6 +16,35 @@ class Settings(BaseSettings):
     # 上传配置
     UPLOAD_DIR: str = "./uploads"
     MAX_UPLOAD_SIZE: int = 104857600  # 100MB
+    UPLOAD_CHUNK_SIZE: int = 8388608  # default chunk size of resumable uploads (8MB)
+    UPLOAD_CHUNK_SIZE_MAX: int = 67108864  # largest chunk a client may request (64MB)
+    UPLOAD_PARTIAL_DIR: str = "./partial"  # in-progress chunked uploads; not under the public /uploads, same filesystem as UPLOAD_DIR
+    UPLOAD_SESSION_TTL: int = 86400  # open upload sessions without a new chunk for this long (seconds) are aborted
+    
+    # 光谱存储配置
+    SPECTRAL_STORAGE: str = "json"  # new datasets: 'json' (per-row JSON), 'columnar' (packed chunks) or 'mmap' (.npy files); migrate_storage.py converts existing ones
+    SPECTRA_DIR: str = "./spectra"  # mmap spectra files (.npy); not under the public /uploads
+    SPECTRAL_DTYPE: str = "float64"  # 'float32' halves storage at ~7 significant digits
+    SPECTRAL_CHUNK_ROWS: int = 1024  # samples per packed chunk
+    SPECTRAL_CODEC: str = "raw"  # raw, shuffle-zlib, delta-lzma, float16, int16 (columnar only)
+    SAMPLE_BULK_BATCH_ROWS: int = 4096  # samples read per step by the streaming /samples/bulk endpoint
+    CSV_EXPORT_CHUNK_SIZE: int = 65536  # bytes of CSV buffered before each write of a streamed download
+    EXPORT_DIR: str = "./exports"  # cached export files (CSV, Parquet, NPZ); not under the public /uploads
+    EXPORT_CACHE_MAX_BYTES: int = 10737418240  # least recently downloaded exports are evicted above this (10GB)
+    EXPORT_ACCEL_REDIRECT: str = ""  # e.g. '/_exports/': nginx internal location aliasing EXPORT_DIR sends cached files
+    LOD_MIN_BANDS: int = 4096  # spectra with at least this many points get min/max pyramids at ingest
+    
+    # 样本导入配置
+    INGEST_READ_SIZE: int = 1048576  # bytes read from the upload per step
+    INGEST_BATCH_ROWS: int = 1000  # samples per flush and per bulk INSERT / COPY statement
+    INGEST_PARSE_PROCESSES: int = 0  # processes parsing batch uploads, 0 = one per CPU
+    BAND_STATS_MAX_LABELS: int = 256  # per-label mean curves are dropped once a dataset has more distinct labels
+    
+    # 后台导入任务配置
+    INGEST_WORKERS: int = 1  # worker processes started with the app, 0 = run workers separately
+    INGEST_POLL_INTERVAL: float = 1.0  # seconds an idle worker waits before checking the queue again
+    INGEST_HEARTBEAT_INTERVAL: float = 30.0  # seconds between heartbeats of a running job
+    INGEST_JOB_TIMEOUT: int = 600  # running jobs without a heartbeat for this long (seconds) are marked failed
     
     # CORS 配置
     ALLOWED_ORIGINS: str = "http://localhost:5173,http://localhost:3000"
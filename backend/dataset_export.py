@@ -0,0 +1,542 @@
+"""
+数据集导出文件 (CSV / CSV.gz / CSV.zst / Parquet / NPZ) 及其磁盘缓存
+样本按存储顺序分批读取（json 数据集通过 yield_per 使用服务端游标），内存占用与数据集大小无关
+
+每个导出文件对应 (数据版本 Dataset.data_version, 波段裁剪, 格式)，同一组合的内容逐字节相同，
+ETag 由这三者决定；文件保存在 EXPORT_DIR，旁边的 .meta 记录重建所需的信息：
+
+    dataset_{id}_v{version}_{selection}.{csv|csv.gz|csv.zst|parquet|npz}
+    dataset_{id}_v{version}_{selection}.{...}.meta     {"artifact", "selection", "rows", "ragged"}
+
+- 第一次下载 CSV 时边发送边写入临时文件，完整结束后改名为正式文件，之后的下载直接发送文件
+- 数据集只会追加样本：新版本的 CSV 复制上一版本的文件再追加新样本的行，
+  压缩版本由新的 CSV 文件压缩得到，都不需要重新读取已有样本
+- 上传完成后在后台按新版本重建上一版本已缓存的导出文件
+- 总大小超过 EXPORT_CACHE_MAX_BYTES 时按最近访问时间 (atime) 淘汰
+"""
+from typing import Iterator, List, Optional, Tuple
+import csv
+import glob
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+import zlib
+import numpy as np
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from config import settings
+from database import SessionLocal
+from models import Dataset, SpectralSample
+from band_selection import AxisSlicer, BandSelection
+import sample_transport
+import spectral_storage
+
+BOM = "\ufeff".encode("utf-8")  # UTF-8 BOM 以便 Excel 正确识别中文
+
+CSV = "csv"
+CSV_GZIP = "csv.gz"
+CSV_ZSTD = "csv.zst"
+PARQUET = "parquet"
+NPZ = "npz"
+
+# 导出格式: Content-Type
+ARTIFACTS = {
+    CSV: "text/csv",
+    CSV_GZIP: "application/gzip",
+    CSV_ZSTD: "application/zstd",
+    PARQUET: "application/vnd.apache.parquet",
+    NPZ: "application/x-npz",
+}
+COMPRESSIONS = {"none": CSV, "gzip": CSV_GZIP, "zstd": CSV_ZSTD}
+STREAMABLE = (CSV, CSV_GZIP, CSV_ZSTD)  # 可以边生成边发送的格式
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+_COPY_SIZE = 1048576
+_NAME = re.compile(r"^dataset_(\d+)_v(\d+)_([0-9a-z]+)\.(csv|csv\.gz|csv\.zst|parquet|npz)$")
+
+
+def has_samples(db: Session, dataset: Dataset) -> bool:
+    return db.query(SpectralSample.id).filter(SpectralSample.dataset_id == dataset.id).first() is not None
+
+
+def artifact_for(format: str, compression: str) -> str:
+    """下载参数 format / compression 对应的导出格式"""
+    if format == CSV:
+        return COMPRESSIONS[compression]
+    if compression != "none":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="compression only applies to format=csv"
+        )
+    return format
+
+
+def _require_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail="zstd downloads require the 'zstandard' package on the server; use compression=gzip"
+        )
+    return zstandard
+
+
+def check_available(artifact: str):
+    """在开始发送响应之前检查可选依赖"""
+    if artifact == CSV_ZSTD:
+        _require_zstandard()
+    elif artifact == PARQUET:
+        sample_transport.require_pyarrow()
+
+
+# ---------------------------------------------------------------------------
+# CSV
+# ---------------------------------------------------------------------------
+
+def iter_csv(
+    db: Session, dataset: Dataset, selection: Optional[BandSelection] = None,
+    skip: int = 0, progress: Optional[dict] = None
+) -> Iterator[bytes]:
+    """
+    逐块产出 CSV 字节，第一块为 BOM 和表头
+    共享波长轴的数据集每个样本一行，不等长数据集使用长表格式（每个波长点一行）
+    skip > 0 时只产出前 skip 个样本之后的行（不含 BOM 和表头），用于追加到已有的导出文件；
+    progress["rows"] 记录已写出的样本数
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    progress = progress if progress is not None else {}
+    progress["rows"] = skip
+    if not skip:
+        yield BOM
+    ragged = dataset.is_ragged
+    first = not skip
+    for sample in spectral_storage.iter_samples(db, dataset, selection=selection, skip=skip):
+        name = sample["sample_name"] or f"sample_{sample['id']}"
+        label = sample["sample_label"] or ""
+        if ragged:
+            if first:
+                writer.writerow(["sample_name", "label", "wavelength", "intensity"])
+            for w, v in zip(sample["wavelengths"], sample["intensities"]):
+                writer.writerow([name, label, w, v])
+        else:
+            if first and sample["wavelengths"]:
+                writer.writerow(["sample_name", "label"] + [str(w) for w in sample["wavelengths"]])
+            writer.writerow([name, label] + sample["intensities"])
+        progress["rows"] += 1
+
+        if first or buffer.tell() >= settings.CSV_EXPORT_CHUNK_SIZE:
+            # 表头单独发送，客户端立即收到第一个字节
+            yield flush()
+        first = False
+
+    if buffer.tell():
+        yield flush()
+
+
+def _compress(chunks: Iterator[bytes], artifact: str) -> Iterator[bytes]:
+    """gzip 头部不含时间戳；压缩结果只取决于输入内容，与输入的分块方式无关"""
+    if artifact == CSV_GZIP:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    else:
+        compressor = _require_zstandard().ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _read_file(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(_COPY_SIZE)
+            if not data:
+                return
+            yield data
+
+
+# ---------------------------------------------------------------------------
+# Parquet / NPZ
+# ---------------------------------------------------------------------------
+
+def _shared_axis(
+    db: Session, dataset: Dataset, selection: Optional[BandSelection]
+) -> Optional[Tuple[Optional[int], List[float]]]:
+    """稠密数据集的 (wavelength_grid_id, wavelengths)，裁剪后 grid_id 为 None"""
+    if not spectral_storage.is_dense(dataset):
+        return None
+    axis = spectral_storage.get_axis(db, dataset)
+    if selection is None:
+        return dataset.wavelength_grid_id, axis
+    return None, AxisSlicer(selection).axis(axis).tolist()
+
+
+def _iter_arrays(db: Session, dataset: Dataset, selection: Optional[BandSelection]):
+    return spectral_storage.iter_sample_arrays(
+        db, dataset, batch_size=settings.SAMPLE_BULK_BATCH_ROWS, selection=selection
+    )
+
+
+def _write_parquet(db: Session, dataset: Dataset, selection: Optional[BandSelection], path: str) -> int:
+    """与 /samples/bulk 的 Arrow 流相同的列，强度为 float64；每批样本一个 row group"""
+    pa = sample_transport.require_pyarrow()
+    import pyarrow.parquet as pq
+    shared = _shared_axis(db, dataset, selection)
+    if shared is not None:
+        grid_id, axis = shared
+        schema = sample_transport.arrow_schema(pa, dataset.id, len(axis), grid_id, axis)
+    else:
+        schema = sample_transport.arrow_schema(pa, dataset.id, None)
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for arrays in _iter_arrays(db, dataset, selection):
+            writer.write_batch(sample_transport.arrow_batch(pa, schema, arrays))
+            rows += len(arrays.ids)
+    return rows
+
+
+class _Column:
+    """逐批追加到临时文件的数值数组，最后作为一个 .npy 条目写入 npz"""
+
+    def __init__(self, directory: str, dtype: str, width: Optional[int] = None):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.length = 0
+
+    def append(self, values: np.ndarray):
+        self.file.write(np.ascontiguousarray(values, dtype=self.dtype).tobytes())
+        self.length += len(values)
+
+    @property
+    def shape(self) -> tuple:
+        return (self.length,) if self.width is None else (self.length, self.width)
+
+
+def _npz_entry(archive: zipfile.ZipFile, name: str, dtype: np.dtype, shape: tuple, source):
+    """不压缩、固定时间戳的 .npy 条目；source 为数组或 _Column 的临时文件"""
+    info = zipfile.ZipInfo(f"{name}.npy", date_time=(1980, 1, 1, 0, 0, 0))
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {"descr": dtype.str, "fortran_order": False, "shape": shape})
+    with archive.open(info, "w", force_zip64=True) as entry:
+        entry.write(header.getvalue())
+        if isinstance(source, np.ndarray):
+            entry.write(np.ascontiguousarray(source, dtype=dtype).tobytes())
+        else:
+            source.seek(0)
+            shutil.copyfileobj(source, entry, _COPY_SIZE)
+
+
+def _write_npz(db: Session, dataset: Dataset, selection: Optional[BandSelection], path: str) -> int:
+    """
+    稠密数据集: ids, sample_names, sample_labels, wavelengths, intensities (n x bands)
+    其他数据集: intensities 为所有样本拼接，第 i 个样本为 [offsets[i], offsets[i+1])，
+    row_wavelengths 与之对齐
+    """
+    shared = _shared_axis(db, dataset, selection)
+    directory = os.path.dirname(path)
+    ids = _Column(directory, "<i8")
+    intensities = _Column(directory, "<f8", None if shared is None else len(shared[1]))
+    row_wavelengths = _Column(directory, "<f8")
+    names, labels, offsets = [], [], [0]
+    try:
+        for arrays in _iter_arrays(db, dataset, selection):
+            ids.append(arrays.ids)
+            names += [name or "" for name in arrays.names]
+            labels += [label or "" for label in arrays.labels]
+            if shared is not None:
+                intensities.append(arrays.matrix)
+                continue
+            arrays = sample_transport.as_ragged(arrays)
+            intensities.append(arrays.values)
+            row_wavelengths.append(arrays.row_wavelengths)
+            offsets += (arrays.offsets[1:] + offsets[-1]).tolist()
+
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            _npz_entry(archive, "ids", ids.dtype, ids.shape, ids.file)
+            for name, values in (("sample_names", names), ("sample_labels", labels)):
+                array = np.array(values, dtype=str) if values else np.zeros(0, dtype="<U1")
+                _npz_entry(archive, name, array.dtype, array.shape, array)
+            _npz_entry(archive, "intensities", intensities.dtype, intensities.shape, intensities.file)
+            if shared is not None:
+                axis = np.asarray(shared[1], dtype="<f8")
+                _npz_entry(archive, "wavelengths", axis.dtype, axis.shape, axis)
+            else:
+                bounds = np.asarray(offsets, dtype="<i8")
+                _npz_entry(archive, "offsets", bounds.dtype, bounds.shape, bounds)
+                _npz_entry(archive, "row_wavelengths", row_wavelengths.dtype, row_wavelengths.shape, row_wavelengths.file)
+    finally:
+        for column in (ids, intensities, row_wavelengths):
+            column.file.close()
+    return len(names)
+
+
+# ---------------------------------------------------------------------------
+# EXPORT_DIR 中的缓存文件
+# ---------------------------------------------------------------------------
+
+def _selection_key(selection: Optional[BandSelection]) -> str:
+    if selection is None:
+        return "all"
+    return hashlib.sha1(repr(tuple(selection)).encode()).hexdigest()[:12]
+
+
+def _dump_selection(selection: Optional[BandSelection]) -> Optional[list]:
+    if selection is None:
+        return None
+    return [selection.wl_min, selection.wl_max, list(selection.bands) if selection.bands is not None else None, selection.step]
+
+
+def _load_selection(value: Optional[list]) -> Optional[BandSelection]:
+    if value is None:
+        return None
+    wl_min, wl_max, bands, step = value
+    return BandSelection(wl_min, wl_max, tuple(bands) if bands is not None else None, step)
+
+
+def _version(dataset: Dataset) -> int:
+    return dataset.data_version or 0
+
+
+def export_etag(dataset: Dataset, selection: Optional[BandSelection], artifact: str) -> str:
+    """强 ETag：数据版本相同时导出内容逐字节相同"""
+    return f'"{dataset.id}-{_version(dataset)}-{_selection_key(selection)}-{artifact}"'
+
+
+def export_path(dataset: Dataset, selection: Optional[BandSelection], artifact: str) -> str:
+    name = f"dataset_{dataset.id}_v{_version(dataset)}_{_selection_key(selection)}.{artifact}"
+    return os.path.join(settings.EXPORT_DIR, name)
+
+
+def _meta_path(path: str) -> str:
+    return path + ".meta"
+
+
+def _read_meta(path: str) -> Optional[dict]:
+    try:
+        with open(_meta_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _cached_files(dataset_id: Optional[int] = None) -> List[Tuple[str, re.Match]]:
+    """缓存中的导出文件 (路径, 文件名匹配结果)，不含 .meta 和临时文件"""
+    pattern = f"dataset_{dataset_id}_v*" if dataset_id is not None else "dataset_*"
+    result = []
+    for path in glob.glob(os.path.join(settings.EXPORT_DIR, pattern)):
+        match = _NAME.match(os.path.basename(path))
+        if match:
+            result.append((path, match))
+    return result
+
+
+def _remove(path: str):
+    for name in (path, _meta_path(path)):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+
+def _touch(path: str):
+    """记录访问时间供 LRU 淘汰使用；mtime 不变（Last-Modified 不受影响）"""
+    try:
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except OSError:
+        pass
+
+
+class _Sink:
+    """写入临时文件，commit 时先写 .meta 再原子地改名为正式文件；中途失败时删除临时文件"""
+
+    def __init__(self, path: str, open_file: bool = True):
+        os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+        self.path = path
+        self.tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        self.file = open(self.tmp, "wb") if open_file else None
+        self.done = False
+
+    def commit(self, meta: dict):
+        if self.file is not None:
+            self.file.close()
+        meta_tmp = self.tmp + ".meta"
+        with open(meta_tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_tmp, _meta_path(self.path))
+        os.replace(self.tmp, self.path)
+        self.done = True
+
+    def discard(self):
+        if self.done:
+            return
+        if self.file is not None:
+            self.file.close()
+        for name in (self.tmp, self.tmp + ".meta"):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+
+def _tee(chunks: Iterator[bytes], sink: _Sink) -> Iterator[bytes]:
+    for chunk in chunks:
+        sink.file.write(chunk)
+        yield chunk
+
+
+def _previous_csv(dataset: Dataset, selection: Optional[BandSelection]) -> Optional[Tuple[str, dict]]:
+    """同一裁剪条件下较早版本的 CSV，布局（是否不等长）相同时新版本可以在它后面追加"""
+    key = _selection_key(selection)
+    candidates = []
+    for path, match in _cached_files(dataset.id):
+        version = int(match.group(2))
+        if match.group(3) == key and match.group(4) == CSV and version < _version(dataset):
+            candidates.append((version, path))
+    for _, path in sorted(candidates, reverse=True):
+        meta = _read_meta(path)
+        if meta and meta.get("rows") is not None and meta.get("ragged") == bool(dataset.is_ragged):
+            return path, meta
+    return None
+
+
+def _finish(dataset: Dataset, selection: Optional[BandSelection], artifacts: List[str]):
+    """删除同一裁剪条件和格式的旧版本文件，再按缓存大小上限淘汰"""
+    key = _selection_key(selection)
+    written = []
+    for artifact in artifacts:
+        written.append(export_path(dataset, selection, artifact))
+        for path, match in _cached_files(dataset.id):
+            if match.group(3) == key and match.group(4) == artifact and int(match.group(2)) < _version(dataset):
+                _remove(path)
+    evict(keep=written)
+
+
+def evict(keep: Optional[List[str]] = None):
+    """总大小超过 EXPORT_CACHE_MAX_BYTES 时删除最久没有访问的文件（keep 中的除外）"""
+    files = []
+    for path, _ in _cached_files():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((stat.st_atime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= settings.EXPORT_CACHE_MAX_BYTES:
+            break
+        if keep and path in keep:
+            continue
+        _remove(path)
+        total -= size
+
+
+def stream(db: Session, dataset: Dataset, selection: Optional[BandSelection], artifact: str) -> Iterator[bytes]:
+    """
+    产出 CSV 系列导出文件的内容，同时写入缓存；压缩版本需要的 CSV 不在缓存中时一并生成
+    CSV 优先从缓存读取，其次复制上一版本的文件并追加新样本，最后才完整读取所有样本
+    """
+    meta = {"selection": _dump_selection(selection), "ragged": bool(dataset.is_ragged)}
+    csv_path = export_path(dataset, selection, CSV)
+    progress = {}
+    sinks = []
+    try:
+        if os.path.exists(csv_path):
+            source = _read_file(csv_path)
+            progress["rows"] = (_read_meta(csv_path) or {}).get("rows")
+        else:
+            previous = _previous_csv(dataset, selection)
+            if previous is not None:
+                path, previous_meta = previous
+                source = itertools.chain(
+                    _read_file(path),
+                    iter_csv(db, dataset, selection, skip=previous_meta["rows"], progress=progress)
+                )
+            else:
+                source = iter_csv(db, dataset, selection, progress=progress)
+            sinks.append((CSV, _Sink(csv_path)))
+            source = _tee(source, sinks[-1][1])
+        if artifact != CSV:
+            sinks.append((artifact, _Sink(export_path(dataset, selection, artifact))))
+            source = _tee(_compress(source, artifact), sinks[-1][1])
+
+        yield from source
+        for kind, sink in sinks:
+            sink.commit({**meta, "artifact": kind, "rows": progress.get("rows")})
+    finally:
+        # 客户端中途断开时生成器在 yield 处关闭，未完成的临时文件在这里删除
+        for _, sink in sinks:
+            sink.discard()
+    _finish(dataset, selection, [kind for kind, _ in sinks])
+
+
+def materialize(db: Session, dataset: Dataset, selection: Optional[BandSelection], artifact: str) -> str:
+    """返回导出文件的路径，不在缓存中时先生成"""
+    path = export_path(dataset, selection, artifact)
+    if os.path.exists(path):
+        _touch(path)
+        return path
+    if artifact in STREAMABLE:
+        for _ in stream(db, dataset, selection, artifact):
+            pass
+        return path
+
+    sink = _Sink(path, open_file=False)
+    try:
+        writer = _write_parquet if artifact == PARQUET else _write_npz
+        rows = writer(db, dataset, selection, sink.tmp)
+        sink.commit({"selection": _dump_selection(selection), "ragged": bool(dataset.is_ragged),
+                     "artifact": artifact, "rows": rows})
+    finally:
+        sink.discard()
+    _finish(dataset, selection, [artifact])
+    return path
+
+
+def warm(db: Session, dataset: Dataset):
+    """按新版本重建上一版本已缓存的导出文件（CSV 先于压缩版本，便于直接压缩新的 CSV）"""
+    previous = []
+    for path, match in _cached_files(dataset.id):
+        meta = _read_meta(path)
+        if meta and int(match.group(2)) < _version(dataset):
+            previous.append((meta["artifact"] != CSV, meta["artifact"], meta["selection"]))
+    for _, artifact, selection in sorted(previous, key=lambda item: (item[0], item[1])):
+        materialize(db, dataset, _load_selection(selection), artifact)
+
+
+def warm_dataset(dataset_id: int):
+    """上传完成后的后台任务，使用自己的 session；失败不影响上传结果，下载时会再生成"""
+    db = SessionLocal()
+    try:
+        dataset = db.get(Dataset, dataset_id)
+        if dataset is not None:
+            warm(db, dataset)
+    except Exception as e:
+        print(f"⚠️  Could not rebuild the cached exports of dataset {dataset_id}: {e}")
+    finally:
+        db.close()
+
+
+def delete_exports(dataset_id: int):
+    """删除数据集时调用；临时文件由写入它的下载自己清理"""
+    for path, _ in _cached_files(dataset_id):
+        _remove(path)
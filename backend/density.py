@@ -0,0 +1,178 @@
+"""
+数据集概览用的密度图：波长分箱 x 强度分箱的二维直方图
+遍历一次全部样本得到计数，按 (宽, 高, 标签) 缓存在 dataset_densities 表；
+Dataset.data_version 变化（追加了样本）后缓存失效，下次请求时重新计算
+后台导入任务完成后预先计算默认尺寸，详情页第一次打开时不需要等待
+
+强度范围优先取 band_stats 的全局最小/最大值（按标签的密度图也使用同一范围，便于比较）；
+不等长数据集或没有统计量时先遍历一次求范围
+"""
+from typing import Optional, Tuple
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import Dataset, DatasetDensity
+import band_stats
+import spectral_storage
+
+DEFAULT_WIDTH = 200
+DEFAULT_HEIGHT = 100
+MAX_SIZE = 1024
+
+COUNT_DTYPE = np.dtype("<u4")
+
+_BATCH = 1000
+
+
+def _label_rows(arrays: spectral_storage.SampleArrays, label: Optional[str]) -> Optional[np.ndarray]:
+    """属于 label 的行号；label 为 None 表示全部样本"""
+    if label is None:
+        return None
+    return np.array([i for i, value in enumerate(arrays.labels) if value == label], dtype=np.intp)
+
+
+def _flat_values(arrays: spectral_storage.SampleArrays, rows: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """把一批样本展开为一一对应的 (波长, 强度) 一维数组"""
+    if arrays.dense:
+        matrix = arrays.matrix if rows is None else arrays.matrix[rows]
+        return np.broadcast_to(arrays.wavelengths, matrix.shape).ravel(), np.asarray(matrix).ravel()
+    if rows is None:
+        return arrays.row_wavelengths, arrays.values
+    spans = [np.arange(arrays.offsets[i], arrays.offsets[i + 1]) for i in rows]
+    index = np.concatenate(spans) if spans else np.zeros(0, dtype=np.intp)
+    return arrays.row_wavelengths[index], arrays.values[index]
+
+
+def _iter_values(db: Session, dataset: Dataset, label: Optional[str]):
+    for arrays in spectral_storage.iter_sample_arrays(db, dataset, batch_size=_BATCH):
+        rows = _label_rows(arrays, label)
+        if rows is not None and not len(rows):
+            continue
+        wavelengths, values = _flat_values(arrays, rows)
+        finite = np.isfinite(wavelengths) & np.isfinite(values)
+        yield len(arrays.ids) if rows is None else len(rows), wavelengths[finite], values[finite]
+
+
+def _scan_ranges(db: Session, dataset: Dataset, label: Optional[str]):
+    x_lo = y_lo = np.inf
+    x_hi = y_hi = -np.inf
+    for _, wavelengths, values in _iter_values(db, dataset, label):
+        if len(values):
+            x_lo, x_hi = min(x_lo, wavelengths.min()), max(x_hi, wavelengths.max())
+            y_lo, y_hi = min(y_lo, values.min()), max(y_hi, values.max())
+    if not np.isfinite(x_lo):
+        return None
+    return (float(x_lo), float(x_hi)), (float(y_lo), float(y_hi))
+
+
+def _widen(lo: float, hi: float) -> Tuple[float, float]:
+    """只有一个值时给出宽度为 1 的范围，避免除以 0"""
+    return (lo, hi) if hi > lo else (lo - 0.5, hi + 0.5)
+
+
+def _bins(values: np.ndarray, lo: float, hi: float, size: int) -> np.ndarray:
+    index = np.floor((values - lo) / (hi - lo) * size).astype(np.intp)
+    return np.clip(index, 0, size - 1)
+
+
+def compute(db: Session, dataset: Dataset, width: int, height: int, label: Optional[str] = None) -> dict:
+    """遍历样本计算密度图，返回 DatasetDensity 的字段"""
+    dense = spectral_storage.is_dense(dataset)
+    value_range = band_stats.value_range(db, dataset)
+    if dense and value_range is not None:
+        axis = spectral_storage.get_axis(db, dataset)
+        ranges = (min(axis), max(axis)), value_range
+    else:
+        ranges = _scan_ranges(db, dataset, label)
+
+    counts = np.zeros(width * height, dtype=np.int64)
+    num_samples = 0
+    x_lo = x_hi = y_lo = y_hi = None
+    if ranges is not None:
+        (x_lo, x_hi), (y_lo, y_hi) = _widen(*ranges[0]), _widen(*ranges[1])
+        for rows, wavelengths, values in _iter_values(db, dataset, label):
+            num_samples += rows
+            cells = _bins(values, y_lo, y_hi, height) * width + _bins(wavelengths, x_lo, x_hi, width)
+            counts += np.bincount(cells, minlength=width * height)
+
+    return {
+        "num_samples": num_samples,
+        "wavelength_min": x_lo,
+        "wavelength_max": x_hi,
+        "intensity_min": y_lo,
+        "intensity_max": y_hi,
+        "counts": np.minimum(counts, np.iinfo(COUNT_DTYPE).max).astype(COUNT_DTYPE).tobytes(),
+    }
+
+
+def clamp_width(db: Session, dataset: Dataset, width: int) -> int:
+    """共享波长轴的数据集波段数少于宽度时按波段数分箱，避免出现空列"""
+    if dataset.wavelength_grid_id is not None and not dataset.is_ragged:
+        num_bands = len(spectral_storage.get_axis(db, dataset))
+        if num_bands:
+            return min(width, num_bands)
+    return width
+
+
+def _find(db: Session, dataset: Dataset, width: int, height: int, label_key: str) -> Optional[DatasetDensity]:
+    return db.query(DatasetDensity).filter(
+        DatasetDensity.dataset_id == dataset.id,
+        DatasetDensity.width == width,
+        DatasetDensity.height == height,
+        DatasetDensity.label == label_key,
+    ).first()
+
+
+def get_density(
+    db: Session, dataset: Dataset, width: int, height: int, label: Optional[str] = None
+) -> DatasetDensity:
+    """返回缓存的密度图，不存在或已过期时重新计算（不提交事务）"""
+    version = dataset.data_version or 0
+    label_key = label or ""
+    density = _find(db, dataset, width, height, label_key)
+    if density is not None and density.data_version == version:
+        return density
+
+    values = compute(db, dataset, width, height, label)
+    if density is not None:
+        for key, value in values.items():
+            setattr(density, key, value)
+        density.data_version = version
+        return density
+
+    density = DatasetDensity(
+        dataset_id=dataset.id, width=width, height=height, label=label_key, data_version=version, **values
+    )
+    try:
+        # 并发的第一次请求只有一个能插入，另一个直接使用它的结果（两者相同）
+        with db.begin_nested():
+            db.add(density)
+            db.flush()
+    except IntegrityError:
+        density = _find(db, dataset, width, height, label_key)
+    return density
+
+
+def warm(db: Session, dataset: Dataset):
+    """预先计算默认尺寸的密度图并提交（后台导入任务完成后调用）"""
+    if not dataset.num_samples:
+        return
+    get_density(db, dataset, clamp_width(db, dataset, DEFAULT_WIDTH), DEFAULT_HEIGHT)
+    db.commit()
+
+
+def to_response(dataset: Dataset, density: DatasetDensity) -> dict:
+    counts = np.frombuffer(density.counts, dtype=COUNT_DTYPE).reshape(density.height, density.width)
+    return {
+        "dataset_id": dataset.id,
+        "width": density.width,
+        "height": density.height,
+        "label": density.label or None,
+        "num_samples": density.num_samples or 0,
+        "wavelength_min": density.wavelength_min,
+        "wavelength_max": density.wavelength_max,
+        "intensity_min": density.intensity_min,
+        "intensity_max": density.intensity_max,
+        "max_count": int(counts.max()) if counts.size else 0,
+        "counts": counts.tolist(),
+    }
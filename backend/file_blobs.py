@@ -0,0 +1,153 @@
+"""
+按内容寻址的上传文件存储
+上传时边写边计算 SHA-256，文件以 UPLOAD_DIR/blobs/<前两位>/<sha256><扩展名> 保存一份，
+file_blobs 表记录引用它的数据集和排队中的提取任务个数；Dataset.file_path 指向 blob 的相对路径
+引用数降到 0 时删除 blob 行，事务提交后再删除磁盘文件
+
+解析结果（CSV 行数、仪器格式的导入结果）缓存在 blob 上，相同内容再次上传时不再解析
+"""
+from typing import Optional, Tuple
+import hashlib
+import os
+import uuid
+from fastapi import UploadFile
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from config import settings
+from models import Dataset, FileBlob
+
+
+def blobs_dir() -> str:
+    return os.path.join(settings.UPLOAD_DIR, "blobs")
+
+
+def blob_relpath(sha256: str, extension: str) -> str:
+    """相对 UPLOAD_DIR 的路径，也是 /uploads 下的下载路径"""
+    return f"blobs/{sha256[:2]}/{sha256}{extension.lower()}"
+
+
+def blob_abspath(blob: FileBlob) -> str:
+    return os.path.join(settings.UPLOAD_DIR, *blob.path.split("/"))
+
+
+def temp_path() -> str:
+    os.makedirs(os.path.join(blobs_dir(), "tmp"), exist_ok=True)
+    return os.path.join(blobs_dir(), "tmp", f"upload_{uuid.uuid4().hex}")
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def save_upload(file: UploadFile) -> Tuple[str, int, str]:
+    """
+    把上传文件写入临时文件并同时计算 SHA-256，返回 (临时路径, 字节数, sha256)
+    超过 MAX_UPLOAD_SIZE 时删除临时文件并抛出 ValueError
+    """
+    path = temp_path()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = await file.read(settings.INGEST_READ_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.MAX_UPLOAD_SIZE:
+                    raise ValueError(f"File too large. Maximum size is {settings.MAX_UPLOAD_SIZE} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        _remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
+
+def store_file(db: Session, source_path: str, sha256: str, size: int, extension: str) -> Tuple[FileBlob, bool]:
+    """
+    把已计算好哈希的文件放入 blob 存储（移动，不复制），返回 (blob, 是否为新内容)
+    内容已存在时删除 source_path；不提交事务
+    """
+    blob = db.query(FileBlob).filter(FileBlob.sha256 == sha256).first()
+    if blob is not None:
+        if os.path.exists(blob_abspath(blob)):
+            _remove(source_path)
+        else:
+            # 磁盘文件丢失时用这次上传的内容补回
+            os.makedirs(os.path.dirname(blob_abspath(blob)), exist_ok=True)
+            os.replace(source_path, blob_abspath(blob))
+        return blob, False
+
+    blob = FileBlob(sha256=sha256, size=size, path=blob_relpath(sha256, extension), ref_count=0)
+    target = blob_abspath(blob)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(source_path, target)
+    try:
+        # 并发上传相同内容时只有一个能插入成功，另一个回到查询（两者的文件内容相同）
+        with db.begin_nested():
+            db.add(blob)
+            db.flush()
+    except IntegrityError:
+        blob = db.query(FileBlob).filter(FileBlob.sha256 == sha256).one()
+        if blob_abspath(blob) != target:
+            _remove(target)
+        return blob, False
+    return blob, True
+
+
+def retain(db: Session, blob_id: int):
+    """增加一个引用（例如排队中的提取任务读取这个 blob）"""
+    db.execute(update(FileBlob).where(FileBlob.id == blob_id).values(ref_count=FileBlob.ref_count + 1))
+
+
+def release_blob(db: Session, blob_id: int) -> Optional[str]:
+    """
+    减少一个引用；引用数降到 0 时删除 blob 行并返回磁盘路径，
+    由调用方在提交后调用 remove_file
+    """
+    db.flush()  # refresh below must not drop pending changes to the blob
+    db.execute(update(FileBlob).where(FileBlob.id == blob_id).values(ref_count=FileBlob.ref_count - 1))
+    blob = db.get(FileBlob, blob_id)
+    if blob is None:
+        return None
+    db.refresh(blob)
+    if blob.ref_count > 0:
+        return None
+    path = blob_abspath(blob)
+    db.delete(blob)
+    return path
+
+
+def release(db: Session, dataset: Dataset) -> Optional[str]:
+    """解除数据集对当前 blob 的引用，返回值同 release_blob"""
+    blob_id = dataset.file_blob_id
+    if blob_id is None:
+        return None
+    dataset.file_blob_id = None
+    return release_blob(db, blob_id)
+
+
+def attach(db: Session, dataset: Dataset, blob: FileBlob) -> Optional[str]:
+    """
+    让数据集引用 blob，返回需要在提交后删除的旧 blob 路径（如果有）
+    数据集已经引用同一个 blob 时不改变引用数
+    """
+    if dataset.file_blob_id == blob.id:
+        return None
+    orphan = release(db, dataset)
+    db.flush()
+    retain(db, blob.id)
+    db.refresh(blob)
+    dataset.file_blob_id = blob.id
+    dataset.file_path = blob.path
+    return orphan
+
+
+def remove_file(path: Optional[str]):
+    if path:
+        _remove(path)
@@ -0,0 +1,117 @@
+"""
+读取接口的条件请求 (ETag / Last-Modified / 304) 和 Cache-Control 策略
+校验值由廉价的版本信息得到（表的行数和最大 updated_at），不需要先查询和序列化完整响应；
+新增、修改、删除都会改变行数或最大 updated_at 之一
+
+浏览量、下载量用 increment_counter 更新，不触发 updated_at 的 onupdate；
+列表、详情和统计的响应里带有这些计数，所以它们的 ETag 另外包含计数（列表为各数据集计数之和），
+计数没有修改时间，这些接口只用 ETag，不返回 Last-Modified
+
+X-Accel-Expires 只给 nginx 的 proxy_cache 使用（nginx 不会转发给浏览器），
+浏览器按 Cache-Control 每次带 If-None-Match 重新验证
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from fastapi import Request, Response, status
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from models import Category, Dataset
+
+# 每个接口的缓存策略
+DATASET_LIST = {"Cache-Control": "public, no-cache", "X-Accel-Expires": "10"}
+DATASET_DETAIL = {"Cache-Control": "private, no-cache"}  # 每次请求都要计浏览量，nginx 不缓存
+CATEGORY_TREE = {"Cache-Control": "public, no-cache", "X-Accel-Expires": "60"}
+STATS = {"Cache-Control": "public, max-age=60"}
+
+Version = Tuple[int, Optional[datetime]]
+DatasetsVersion = Tuple[int, Optional[datetime], int, int]
+
+
+def _utc(value: datetime) -> datetime:
+    """数据库里的时间是不带时区的 UTC (datetime.utcnow)"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _stamp(value: Optional[datetime]) -> str:
+    return str(int(_utc(value).timestamp() * 1000000)) if value is not None else "0"
+
+
+def datasets_version(db: Session) -> DatasetsVersion:
+    """datasets 表的 (行数, 最大 updated_at, 浏览量之和, 下载量之和)；计数只增不减，任何一次计数都会改变总和"""
+    count, latest, views, downloads = db.query(
+        func.count(Dataset.id),
+        func.max(func.coalesce(Dataset.updated_at, Dataset.created_at)),
+        func.coalesce(func.sum(Dataset.view_count), 0),
+        func.coalesce(func.sum(Dataset.download_count), 0),
+    ).one()
+    return count, latest, int(views), int(downloads)
+
+
+def categories_version(db: Session) -> Version:
+    """分类树的 (行数, 最大 updated_at)；迁移前已有的分类没有 updated_at，用 created_at"""
+    count, latest = db.query(
+        func.count(Category.id), func.max(func.coalesce(Category.updated_at, Category.created_at))
+    ).one()
+    return count, latest
+
+
+def weak_etag(name: str, *parts) -> str:
+    """由版本信息拼出弱 ETag，例如 W/"datasets-12-1700000000000000" """
+    values = [_stamp(part) if isinstance(part, datetime) or part is None else str(part) for part in parts]
+    return 'W/"' + "-".join([name] + values) + '"'
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否包含 etag（弱比较）"""
+    if not header:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or opaque in tags or f"W/{opaque}" in tags
+
+
+def _not_modified_since(header: Optional[str], last_modified: Optional[datetime]) -> bool:
+    if not header or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    # Last-Modified 只精确到秒
+    return _utc(last_modified).replace(microsecond=0) <= _utc(since)
+
+
+def conditional(
+    request: Request,
+    response: Response,
+    etag: str,
+    last_modified: Optional[datetime],
+    policy: Dict[str, str]
+) -> Optional[Response]:
+    """
+    给响应加上 ETag / Last-Modified 和缓存策略；请求的版本仍然有效时返回 304 响应，否则返回 None
+    同时带 If-None-Match 和 If-Modified-Since 时只看 If-None-Match
+    """
+    headers = {"ETag": etag, **policy}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_utc(last_modified), usegmt=True)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = etag_matches(if_none_match, etag)
+    else:
+        fresh = _not_modified_since(request.headers.get("if-modified-since"), last_modified)
+    if fresh:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
+
+
+def increment_counter(db: Session, dataset: Dataset, column):
+    """计数器加一（不提交事务）；显式保留 updated_at，计数变化不让条件请求的缓存失效"""
+    db.execute(
+        update(Dataset)
+        .where(Dataset.id == dataset.id)
+        .values({column: column + 1, Dataset.updated_at: Dataset.updated_at})
+    )
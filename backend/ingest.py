@@ -0,0 +1,511 @@
+"""
+流式 CSV 样本导入
+按 INGEST_READ_SIZE 分块读取上传文件，增量解码，每块完整的行交给 numpy 的 C 解析器
+一次性转换为 float64 矩阵，每累积 INGEST_BATCH_ROWS 个样本就写入存储并 flush，
+内存占用与文件大小无关
+"""
+from typing import AsyncIterator, BinaryIO, Callable, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import codecs
+import csv
+import multiprocessing
+import sys
+import threading
+import time
+import numpy as np
+from fastapi import UploadFile
+from sqlalchemy.orm import Session
+from config import settings
+from models import Dataset, SpectralSample
+import spectral_storage
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """进程的常驻内存峰值（Linux 上 ru_maxrss 单位为 KB，macOS 为字节）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class IngestStats:
+    """导入过程的吞吐量统计，on_progress 在每批写入后调用"""
+
+    def __init__(self, on_progress: Optional[Callable[["IngestStats"], None]] = None):
+        self.started = time.perf_counter()
+        self.bytes_read = 0
+        self.rows_parsed = 0
+        self.rows_inserted = 0
+        self.rows_skipped = 0
+        self.on_progress = on_progress
+
+    def report(self):
+        if self.on_progress is not None:
+            self.on_progress(self)
+
+    def summary(self) -> dict:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "bytes_read": self.bytes_read,
+            "rows_parsed": self.rows_parsed,
+            "rows_inserted": self.rows_inserted,
+            "rows_skipped": self.rows_skipped,
+            "elapsed_seconds": round(elapsed, 3),
+            "bytes_per_second": round(self.bytes_read / elapsed),
+            "rows_per_second": round(self.rows_parsed / elapsed),
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+
+
+class LocalFile:
+    """让磁盘上的文件提供与 UploadFile 相同的异步 read 接口"""
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+
+    async def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+
+async def iter_line_blocks(file: UploadFile, stats: IngestStats) -> AsyncIterator[List[str]]:
+    """按读取块产出完整的非空行，自动去掉 UTF-8 BOM"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+
+    while True:
+        chunk = await file.read(settings.INGEST_READ_SIZE)
+        final = not chunk
+        stats.bytes_read += len(chunk)
+        text = pending + decoder.decode(chunk, final=final)
+
+        lines = text.splitlines()
+        # 最后一行可能不完整，留到下一块
+        pending = ""
+        if not final and lines and not text.endswith(("\n", "\r")):
+            pending = lines.pop()
+
+        lines = [line for line in lines if line]
+        if lines:
+            yield lines
+
+        if final:
+            return
+
+
+class CSVBlockReader:
+    """先读出表头，再按块产出其余数据行"""
+
+    def __init__(self, file: UploadFile, stats: IngestStats):
+        self._blocks = iter_line_blocks(file, stats)
+        self._rest: List[str] = []
+
+    async def header(self) -> Optional[List[str]]:
+        async for lines in self._blocks:
+            self._rest = lines[1:]
+            return next(csv.reader(lines[:1]))
+        return None
+
+    async def blocks(self) -> AsyncIterator[List[str]]:
+        if self._rest:
+            yield self._rest
+            self._rest = []
+        async for lines in self._blocks:
+            yield lines
+
+
+def count_csv_records(path: str) -> int:
+    """
+    逐行统计 CSV 的数据行数（不含表头和空行），内存占用与文件大小无关
+    与导入时的分行规则一致：一行一个样本
+    """
+    records = 0
+    with open(path, "rb", buffering=settings.INGEST_READ_SIZE) as f:
+        for line in f:
+            if line.strip():
+                records += 1
+    return max(0, records - 1)
+
+
+def parse_block(
+    lines: List[str],
+    value_cols: Optional[List[int]] = None,
+    label_col: Optional[int] = None,
+) -> Tuple[np.ndarray, Optional[List[str]]]:
+    """
+    把一块 CSV 行解析为 (n x bands 的 float64 矩阵, 标签列)
+    numpy.loadtxt 的 C 实现与 float() 逐位一致；列数不一致或有非数值时抛出 ValueError
+    """
+    options = dict(delimiter=",", quotechar='"', comments=None, encoding=None)
+    matrix = np.loadtxt(lines, dtype=np.float64, usecols=value_cols, ndmin=2, **options)
+    labels = None
+    if label_col is not None:
+        labels = np.loadtxt(lines, dtype=str, usecols=[label_col], ndmin=1, **options).tolist()
+    return matrix, labels
+
+
+def parse_rows(lines: List[str], num_bands: int, stats: IngestStats) -> List[Tuple[int, List[float]]]:
+    """逐行解析并跳过无效行，返回 (块内行号, 强度) 列表；parse_block 失败时使用"""
+    parsed = []
+    for idx, row in enumerate(csv.reader(lines)):
+        try:
+            intensities = [float(val) for val in row]
+        except Exception as e:
+            print(f"Skipping row {idx}: {e}")
+            stats.rows_skipped += 1
+            continue
+        if len(intensities) != num_bands:
+            stats.rows_skipped += 1
+            continue
+        parsed.append((idx, intensities))
+    return parsed
+
+
+def parse_labeled_block(lines: List[str], num_bands: int, stats: IngestStats) -> Tuple[np.ndarray, List[int]]:
+    """
+    解析一块所有列都是波长的行，返回 (矩阵, 有效行在块内的位置)
+    整块向量化解析失败时才逐行解析并跳过无效行
+    """
+    try:
+        matrix, _ = parse_block(lines)
+        if matrix.shape[1] != num_bands:
+            raise ValueError(f"expected {num_bands} columns, got {matrix.shape[1]}")
+        return matrix, list(range(len(matrix)))
+    except ValueError:
+        parsed = parse_rows(lines, num_bands, stats)
+        matrix = np.array([values for _, values in parsed], dtype=np.float64).reshape(len(parsed), num_bands)
+        return matrix, [pos for pos, _ in parsed]
+
+
+class SampleBatcher:
+    """
+    把解析出的样本攒成批次写入存储，每批之后 flush 释放 Python 对象
+    有 checkpoint 时每批之后改为调用 checkpoint(已写入的行数)，由它提交事务（后台导入任务）
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        dataset: Dataset,
+        wavelengths: Sequence[float],
+        codec: Optional[str] = None,
+        stats: Optional[IngestStats] = None,
+        checkpoint: Optional[Callable[[int], None]] = None,
+    ):
+        self.db = db
+        self.stats = stats
+        self.checkpoint = checkpoint
+        self.dataset = dataset
+        self.wavelengths = list(wavelengths)
+        self.codec = codec
+        self.batch_rows = max(1, settings.INGEST_BATCH_ROWS)
+        self.names: List[str] = []
+        self.labels: List[Optional[str]] = []
+        self.matrices: List[np.ndarray] = []
+        self.pending = 0
+        self.written = 0
+
+    def add(self, name: str, label: Optional[str], values: List[float]):
+        self.add_matrix([name], [label], np.asarray([values], dtype=np.float64))
+
+    def add_matrix(self, names: List[str], labels: List[Optional[str]], matrix: np.ndarray):
+        """按行追加一块已解析的矩阵，超过批大小时按批切开写入"""
+        matrix = np.asarray(matrix, dtype=np.float64).reshape(len(names), len(self.wavelengths))
+        start = 0
+        while start < len(names):
+            take = min(self.batch_rows - self.pending, len(names) - start)
+            self.names.extend(names[start:start + take])
+            self.labels.extend(labels[start:start + take])
+            self.matrices.append(matrix[start:start + take])
+            self.pending += take
+            start += take
+            if self.pending >= self.batch_rows:
+                self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        matrix = self.matrices[0] if len(self.matrices) == 1 else np.concatenate(self.matrices)
+        written = spectral_storage.append_samples(
+            self.db, self.dataset, self.wavelengths, matrix,
+            self.names, self.labels, self.codec
+        )
+        self.written += written
+        if self.stats is not None:
+            self.stats.rows_inserted += written
+        if self.checkpoint is not None:
+            self.checkpoint(self.written)
+        else:
+            self.db.flush()
+        self.names, self.labels, self.matrices = [], [], []
+        self.pending = 0
+        if self.stats is not None:
+            self.stats.report()
+
+
+def _label_column(header: List[str]) -> Optional[int]:
+    """Identify the label/name column"""
+    for name in ("sample_name", "label", "name"):
+        if name in header:
+            return header.index(name)
+    return None
+
+
+async def ingest_samples_csv(
+    db: Session,
+    dataset: Dataset,
+    file: UploadFile,
+    codec: Optional[str] = None,
+    stats: Optional[IngestStats] = None,
+    checkpoint: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """
+    导入样本 CSV：列为波长，行为样本，可以带 sample_name / label / name 列
+    不提交事务，由调用方 commit（checkpoint 见 SampleBatcher）；返回上传接口的响应内容
+    """
+    stats = stats or IngestStats()
+    reader = CSVBlockReader(file, stats)
+    header = await reader.header()
+    if header is None:
+        raise ValueError("CSV file must have at least header and one data row")
+
+    label_col_idx = _label_column(header)
+    if label_col_idx is not None:
+        wavelength_cols = [i for i in range(len(header)) if i != label_col_idx]
+    else:
+        wavelength_cols = list(range(len(header)))
+
+    try:
+        wavelengths = [float(header[i]) for i in wavelength_cols]
+    except ValueError as e:
+        raise ValueError(f"Column headers (except label columns) must be numeric wavelengths. Error: {str(e)}")
+
+    # Parse each block of rows in one vectorized call, write in bounded batches
+    batcher = SampleBatcher(db, dataset, wavelengths, codec, stats, checkpoint)
+    idx = 0
+    async for lines in reader.blocks():
+        if label_col_idx is not None:
+            matrix, names = parse_block(lines, wavelength_cols, label_col_idx)
+            labels = names
+        else:
+            matrix, _ = parse_block(lines)
+            names = [f"sample_{idx + i}" for i in range(len(matrix))]
+            labels = [None] * len(matrix)
+
+        batcher.add_matrix(names, labels, matrix)
+        stats.rows_parsed += len(matrix)
+        idx += len(matrix)
+    batcher.flush()
+    samples_created = batcher.written
+
+    if samples_created == 0:
+        raise ValueError("CSV file must have at least header and one data row")
+
+    dataset.num_samples = samples_created
+    dataset.num_bands = len(wavelengths)
+
+    db.flush()
+    storage = spectral_storage.storage_report(db, dataset)
+    return {
+        "message": f"Successfully uploaded {samples_created} samples",
+        "num_samples": samples_created,
+        "num_bands": len(wavelengths),
+        "codec": storage["codec"],
+        "compression_ratio": storage["compression_ratio"],
+        "ingest": stats.summary()
+    }
+
+
+async def ingest_labeled_csv(
+    db: Session,
+    dataset: Dataset,
+    file: UploadFile,
+    label: str,
+    codec: Optional[str] = None,
+    stats: Optional[IngestStats] = None,
+    checkpoint: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """
+    导入所有样本同属一个标签的 CSV（所有列都是波长），无效行跳过
+    不提交事务，由调用方 commit（checkpoint 见 SampleBatcher）；返回上传接口的响应内容
+    """
+    stats = stats or IngestStats()
+    reader = CSVBlockReader(file, stats)
+    header = await reader.header()
+    if header is None:
+        raise ValueError("CSV file must have at least header and one data row")
+
+    try:
+        wavelengths = [float(h) for h in header]
+    except ValueError:
+        raise ValueError("All column headers must be numeric wavelengths")
+
+    # Parse each block in one vectorized call, skipping invalid rows
+    batcher = SampleBatcher(db, dataset, wavelengths, codec, stats, checkpoint)
+    idx = 0
+    async for lines in reader.blocks():
+        matrix, positions = parse_labeled_block(lines, len(wavelengths), stats)
+        if positions:
+            batcher.add_matrix(
+                [f"{label}_{idx + pos + 1}" for pos in positions],
+                [label] * len(positions),
+                matrix
+            )
+            stats.rows_parsed += len(positions)
+        idx += len(lines)
+    batcher.flush()
+    samples_created = batcher.written
+
+    total_samples = db.query(SpectralSample).filter(
+        SpectralSample.dataset_id == dataset.id
+    ).count()
+    dataset.num_samples = total_samples
+    dataset.num_bands = len(wavelengths)
+
+    storage = spectral_storage.storage_report(db, dataset)
+    return {
+        "message": f"Successfully uploaded {samples_created} samples with label '{label}'",
+        "num_samples": samples_created,
+        "label": label,
+        "total_dataset_samples": total_samples,
+        "codec": storage["codec"],
+        "compression_ratio": storage["compression_ratio"],
+        "ingest": stats.summary()
+    }
+
+
+# ---------------------------------------------------------------------------
+# 批量带标签上传：多个文件在进程池中并行解析，主进程在一个事务里写入
+# ---------------------------------------------------------------------------
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=settings.INGEST_PARSE_PROCESSES or None,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_pool
+
+
+def shutdown_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False, cancel_futures=True)
+            _parse_pool = None
+
+
+def parse_labeled_bytes(data: bytes, label: str) -> dict:
+    """
+    在子进程中解析一个带标签的 CSV 文件（所有列都是波长），无效行跳过
+    样本命名与 /labeled 接口一致：{label}_{行号}
+    """
+    stats = IngestStats()
+    stats.bytes_read = len(data)
+    lines = [line for line in data.decode("utf-8-sig").splitlines() if line]
+    if not lines:
+        raise ValueError("CSV file must have at least header and one data row")
+
+    header = next(csv.reader(lines[:1]))
+    try:
+        wavelengths = [float(h) for h in header]
+    except ValueError:
+        raise ValueError("All column headers must be numeric wavelengths")
+
+    names: List[str] = []
+    matrices = [np.empty((0, len(wavelengths)), dtype=np.float64)]
+    block_rows = max(1, settings.INGEST_BATCH_ROWS)
+    for start in range(1, len(lines), block_rows):
+        matrix, positions = parse_labeled_block(lines[start:start + block_rows], len(wavelengths), stats)
+        names.extend(f"{label}_{start + pos}" for pos in positions)
+        matrices.append(matrix)
+        stats.rows_parsed += len(positions)
+
+    return {
+        "wavelengths": wavelengths,
+        "names": names,
+        "matrix": np.concatenate(matrices),
+        "bytes_read": stats.bytes_read,
+        "rows_parsed": stats.rows_parsed,
+        "rows_skipped": stats.rows_skipped,
+    }
+
+
+async def ingest_labeled_batch(
+    db: Session,
+    dataset: Dataset,
+    files: List[UploadFile],
+    labels: List[str],
+    codec: Optional[str] = None,
+) -> dict:
+    """
+    并行解析多个带标签的 CSV，按文件顺序写入；任何文件出错时整批失败
+    不提交事务，由调用方 commit；num_samples / num_bands 只更新一次
+    """
+    if len(files) != len(labels):
+        raise ValueError(f"Got {len(files)} files but {len(labels)} labels")
+
+    stats = IngestStats()
+    loop = asyncio.get_running_loop()
+    pool = get_parse_pool()
+    futures = []
+    for file, label in zip(files, labels):
+        data = await file.read()
+        futures.append(loop.run_in_executor(pool, parse_labeled_bytes, data, label))
+    results = await asyncio.gather(*futures, return_exceptions=True)
+
+    for file, result in zip(files, results):
+        if isinstance(result, Exception):
+            raise ValueError(f"{file.filename}: {result}")
+
+    # 相邻且波长轴相同的文件共用一个批次，减少小块
+    batcher = None
+    per_file = []
+    for file, label, result in zip(files, labels, results):
+        if batcher is None or batcher.wavelengths != result["wavelengths"]:
+            if batcher is not None:
+                batcher.flush()
+            batcher = SampleBatcher(db, dataset, result["wavelengths"], codec, stats)
+        batcher.add_matrix(result["names"], [label] * len(result["names"]), result["matrix"])
+        stats.bytes_read += result["bytes_read"]
+        stats.rows_parsed += result["rows_parsed"]
+        stats.rows_skipped += result["rows_skipped"]
+        per_file.append({
+            "filename": file.filename,
+            "label": label,
+            "num_samples": result["rows_parsed"],
+            "rows_skipped": result["rows_skipped"],
+        })
+    if batcher is not None:
+        batcher.flush()
+    samples_created = stats.rows_inserted
+
+    total_samples = db.query(SpectralSample).filter(
+        SpectralSample.dataset_id == dataset.id
+    ).count()
+    dataset.num_samples = total_samples
+    if results:
+        dataset.num_bands = len(results[-1]["wavelengths"])
+
+    storage = spectral_storage.storage_report(db, dataset)
+    return {
+        "message": f"Successfully uploaded {samples_created} samples from {len(files)} files",
+        "num_samples": samples_created,
+        "num_files": len(files),
+        "files": per_file,
+        "total_dataset_samples": total_samples,
+        "codec": storage["codec"],
+        "compression_ratio": storage["compression_ratio"],
+        "ingest": stats.summary()
+    }
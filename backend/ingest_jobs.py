@@ -0,0 +1,546 @@
+"""
+后台导入任务
+上传接口把文件保存到 UPLOAD_DIR/jobs 并写入 ingest_jobs 表，立即返回任务 id；
+worker 进程从表中原子地领取任务（条件 UPDATE），每写入一批样本（INGEST_BATCH_ROWS 行）提交一次：
+同一个事务里用条件 UPDATE（仍为 running 且属于本 worker）刷新 heartbeat_at 和进度计数，
+数据库写锁只在一批之内持有，SQLite 上 Web 进程的写入不会被整个任务阻塞
+失败的任务保留已提交的批次，rows_inserted 为已写入的行数
+
+一批之内（解析大块、写入）另开连接每 INGEST_HEARTBEAT_INTERVAL 秒刷新 heartbeat_at，
+超过 INGEST_JOB_TIMEOUT 没有心跳的任务由其它 worker 标记为失败；之后原 worker 的提交和结束时的
+条件 UPDATE 都不再匹配，未提交的一批被放弃，输入文件的引用只释放一次
+upload_dataset 的延迟提取任务直接读取 blob 存储中的数据集文件（params.keep_file），完成后不删除
+
+没有外部依赖时 worker 按 INGEST_POLL_INTERVAL 轮询数据库；
+设置 REDIS_URL 后入队时额外向 Redis 列表推送任务 id，空闲的 worker 通过 BRPOP 立即被唤醒
+（任务本身仍在数据库中领取，Redis 不可用时退回轮询）
+
+运行中的进度写在 UPLOAD_DIR/jobs/job_{id}.progress.json，不占用数据库写锁
+
+用法（单独运行 worker，Web 进程设置 INGEST_WORKERS=0）:
+    python ingest_jobs.py --workers 2
+"""
+from typing import Optional
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from fastapi import UploadFile
+from sqlalchemy import update, exists, func
+from sqlalchemy.orm import Session, aliased
+from config import settings
+from database import SessionLocal
+from models import Dataset, IngestJob, FileBlob, SpectralSample
+import dataset_export
+import density
+import file_blobs
+import ingest
+import spectral_formats
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+KIND_SAMPLES = "samples"
+KIND_LABELED = "labeled"
+KIND_FORMAT = "format"  # HDF5 / MATLAB / JCAMP-DX / SPC file, see spectral_formats
+
+REDIS_QUEUE_KEY = "spectranet:ingest_jobs"
+
+# 进度文件最多每隔这么多秒改写一次
+_PROGRESS_INTERVAL = 0.5
+
+
+def jobs_dir() -> str:
+    return os.path.join(settings.UPLOAD_DIR, "jobs")
+
+
+def progress_path(job_id: int) -> str:
+    return os.path.join(jobs_dir(), f"job_{job_id}.progress.json")
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _redis_client():
+    """REDIS_URL 未设置或未安装 redis 包时返回 None"""
+    if not settings.REDIS_URL:
+        return None
+    try:
+        import redis
+    except ImportError:
+        print("⚠️  REDIS_URL is set but the redis package is not installed, polling the database instead")
+        return None
+    return redis.Redis.from_url(settings.REDIS_URL)
+
+
+# ---------------------------------------------------------------------------
+# 入队（Web 进程）
+# ---------------------------------------------------------------------------
+
+async def save_upload(file: UploadFile) -> tuple:
+    """把上传文件分块写入 jobs 目录，超过 MAX_UPLOAD_SIZE 时删除并抛出 ValueError"""
+    os.makedirs(jobs_dir(), exist_ok=True)
+    path = os.path.join(jobs_dir(), f"upload_{uuid.uuid4().hex}.csv")
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = await file.read(settings.INGEST_READ_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.MAX_UPLOAD_SIZE:
+                    raise ValueError(f"File too large. Maximum size is {settings.MAX_UPLOAD_SIZE} bytes")
+                out.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, size
+
+
+def enqueue_job(
+    db: Session,
+    dataset: Dataset,
+    owner_id: int,
+    kind: str,
+    file_path: str,
+    total_bytes: int,
+    params: Optional[dict] = None,
+) -> IngestJob:
+    """写入任务并提交，然后通知 Redis（如果配置了）"""
+    job = IngestJob(
+        dataset_id=dataset.id,
+        owner_id=owner_id,
+        kind=kind,
+        file_path=file_path,
+        params=params or {},
+        status=JOB_QUEUED,
+        total_bytes=total_bytes,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    client = _redis_client()
+    if client is not None:
+        try:
+            client.lpush(REDIS_QUEUE_KEY, job.id)
+        except Exception as e:
+            print(f"⚠️  Could not notify Redis about ingest job {job.id}: {e}")
+    return job
+
+
+def job_status(job: IngestJob) -> dict:
+    """任务状态；运行中的任务从进度文件读取最新计数"""
+    counters = {
+        "bytes_read": job.bytes_read or 0,
+        "rows_parsed": job.rows_parsed or 0,
+        "rows_inserted": job.rows_inserted or 0,
+        "rows_skipped": job.rows_skipped or 0,
+    }
+    if job.status == JOB_RUNNING:
+        try:
+            with open(progress_path(job.id)) as f:
+                progress = json.load(f)
+            counters.update({key: progress[key] for key in counters if key in progress})
+        except (OSError, ValueError):
+            pass
+
+    elapsed = None
+    bytes_per_second = rows_per_second = None
+    if job.started_at is not None:
+        elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+        bytes_per_second = round(counters["bytes_read"] / max(elapsed, 1e-9))
+        rows_per_second = round(counters["rows_inserted"] / max(elapsed, 1e-9))
+
+    return {
+        "id": job.id,
+        "dataset_id": job.dataset_id,
+        "kind": job.kind,
+        "status": job.status,
+        "total_bytes": job.total_bytes or 0,
+        **counters,
+        "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+        "bytes_per_second": bytes_per_second,
+        "rows_per_second": rows_per_second,
+        "error": job.error,
+        "result": job.result,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+# ---------------------------------------------------------------------------
+# 领取与执行（worker 进程）
+# ---------------------------------------------------------------------------
+
+def _sync_num_samples(db: Session, dataset_id: int):
+    """失败的任务可能已提交了部分批次，按实际行数更新 num_samples（不提交事务）"""
+    dataset = db.get(Dataset, dataset_id)
+    if dataset is not None:
+        dataset.num_samples = db.query(func.count(SpectralSample.id)).filter(
+            SpectralSample.dataset_id == dataset_id
+        ).scalar()
+
+
+def fail_stale_jobs(db: Session) -> int:
+    """
+    超过 INGEST_JOB_TIMEOUT 没有心跳的运行中任务视为 worker 已退出（未提交的一批已回滚），标记为失败
+    条件 UPDATE 与 run_job 每批提交和结束时的条件 UPDATE 只有一个会成功，输入文件的引用只释放一次
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.INGEST_JOB_TIMEOUT)
+    last_seen = func.coalesce(IngestJob.heartbeat_at, IngestJob.started_at)
+    candidates = db.query(IngestJob.id).filter(
+        IngestJob.status == JOB_RUNNING, last_seen < cutoff
+    ).all()
+    db.rollback()
+
+    failed = 0
+    for (job_id,) in candidates:
+        result = db.execute(
+            update(IngestJob)
+            .where(IngestJob.id == job_id, IngestJob.status == JOB_RUNNING, last_seen < cutoff)
+            .values(status=JOB_FAILED, error="Job timed out", finished_at=datetime.utcnow())
+        )
+        if result.rowcount != 1:
+            db.rollback()
+            continue
+        job = db.get(IngestJob, job_id)
+        _sync_num_samples(db, job.dataset_id)
+        orphan = _release_input(db, job)
+        db.commit()
+        _cleanup(job)
+        file_blobs.remove_file(orphan)
+        failed += 1
+    return failed
+
+
+def claim_job(db: Session, worker_id: str) -> Optional[int]:
+    """
+    领取最早的排队任务，返回任务 id
+    条件 UPDATE 保证同一任务只会被一个 worker 领到；同一数据集同时只运行一个任务
+    """
+    running = aliased(IngestJob)
+    dataset_busy = exists().where(
+        running.dataset_id == IngestJob.dataset_id,
+        running.status == JOB_RUNNING
+    )
+    candidates = db.query(IngestJob.id).filter(
+        IngestJob.status == JOB_QUEUED, ~dataset_busy
+    ).order_by(IngestJob.id).limit(10).all()
+    db.rollback()
+
+    for (job_id,) in candidates:
+        now = datetime.utcnow()
+        result = db.execute(
+            update(IngestJob)
+            .where(IngestJob.id == job_id, IngestJob.status == JOB_QUEUED, ~dataset_busy)
+            .values(status=JOB_RUNNING, worker_id=worker_id, started_at=now, heartbeat_at=now)
+        )
+        db.commit()
+        if result.rowcount == 1:
+            return job_id
+    return None
+
+
+def _release_input(db: Session, job: IngestJob) -> Optional[str]:
+    """直接读取 blob 的任务在结束时释放对它的引用，返回需要在提交后删除的文件"""
+    blob_id = (job.params or {}).get("blob_id")
+    if blob_id is None:
+        return None
+    return file_blobs.release_blob(db, blob_id)
+
+
+def _cleanup(job: IngestJob):
+    """删除任务的输入文件和进度文件；keep_file 的输入是上传的数据集文件本身，保留"""
+    if not (job.params or {}).get("keep_file"):
+        _remove(job.file_path)
+    _remove(progress_path(job.id))
+
+
+def _import_format(
+    db: Session, dataset: Dataset, file_path: str, params: dict,
+    stats: ingest.IngestStats, checkpoint: "_Checkpoint"
+) -> dict:
+    imported = spectral_formats.import_file(
+        db, dataset, file_path, params["format"], params.get("codec"), params.get("filename"), checkpoint
+    )
+    stats.bytes_read = os.path.getsize(file_path)
+    stats.rows_parsed = stats.rows_inserted = imported["num_samples"]
+    dataset.num_samples = db.query(SpectralSample).filter(SpectralSample.dataset_id == dataset.id).count()
+    dataset.num_bands = imported["num_bands"]
+    return {"message": f"Successfully imported {imported['num_samples']} samples", **imported}
+
+
+def _progress_writer(job_id: int):
+    last = [0.0]
+
+    def write(stats: ingest.IngestStats):
+        now = time.monotonic()
+        if now - last[0] < _PROGRESS_INTERVAL:
+            return
+        last[0] = now
+        path = progress_path(job_id)
+        try:
+            os.makedirs(jobs_dir(), exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(stats.summary(), f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            # 进度只用于展示，写不了不影响导入
+            print(f"⚠️  Could not write progress of ingest job {job_id}: {e}")
+
+    return write
+
+
+class _JobLost(Exception):
+    """任务已被 fail_stale_jobs 标记为失败，不再属于本 worker"""
+
+
+class _Checkpoint:
+    """
+    每写入一批样本后调用：在同一个事务里确认任务仍属于本 worker，刷新心跳和进度计数，然后提交
+    任务已不属于本 worker 时回滚这一批并抛出 _JobLost
+    """
+
+    def __init__(self, db: Session, job_id: int, worker_id: str, stats: ingest.IngestStats):
+        self.db = db
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.stats = stats
+        self.rows_committed = 0
+
+    def __call__(self, rows_written: int):
+        owned = _update_owned(self.db, self.job_id, self.worker_id, {
+            "heartbeat_at": datetime.utcnow(),
+            "bytes_read": self.stats.bytes_read,
+            "rows_parsed": self.stats.rows_parsed,
+            "rows_inserted": rows_written,
+            "rows_skipped": self.stats.rows_skipped,
+        })
+        if not owned:
+            self.db.rollback()
+            raise _JobLost()
+        self.db.commit()
+        self.rows_committed = rows_written
+
+
+class _Heartbeat:
+    """一批之内（解析大块、写入）在单独的连接里定期刷新 heartbeat_at"""
+
+    def __init__(self, job_id: int, worker_id: str):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(settings.INGEST_HEARTBEAT_INTERVAL):
+            db = SessionLocal()
+            try:
+                db.execute(
+                    update(IngestJob)
+                    .where(
+                        IngestJob.id == self.job_id,
+                        IngestJob.status == JOB_RUNNING,
+                        IngestJob.worker_id == self.worker_id
+                    )
+                    .values(heartbeat_at=datetime.utcnow())
+                )
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️  Could not refresh the heartbeat of ingest job {self.job_id}: {e}")
+            finally:
+                db.close()
+
+
+def _update_owned(db: Session, job_id: int, worker_id: str, values: dict) -> bool:
+    """更新任务（不提交事务）；任务已不属于本 worker（被判定超时）时不修改并返回 False"""
+    result = db.execute(
+        update(IngestJob)
+        .where(IngestJob.id == job_id, IngestJob.status == JOB_RUNNING, IngestJob.worker_id == worker_id)
+        .values(**values)
+    )
+    return result.rowcount == 1
+
+
+def run_job(job_id: int, worker_id: str):
+    """执行一个已领取的任务；每批样本单独提交，任务结果在最后一个事务里写入"""
+    db = SessionLocal()
+    stats = ingest.IngestStats(on_progress=_progress_writer(job_id))
+    checkpoint = _Checkpoint(db, job_id, worker_id, stats)
+    job = db.get(IngestJob, job_id)
+    if job is None:
+        db.close()
+        return
+    dataset_id = job.dataset_id
+    kind = job.kind
+    file_path = job.file_path
+    params = job.params or {}
+    status, result, error = JOB_DONE, None, None
+    with _Heartbeat(job_id, worker_id):
+        try:
+            dataset = db.get(Dataset, dataset_id)
+            if dataset is None:
+                raise ValueError("Dataset not found")
+
+            if kind == KIND_FORMAT:
+                result = _import_format(db, dataset, file_path, params, stats, checkpoint)
+            elif kind in (KIND_SAMPLES, KIND_LABELED):
+                with open(file_path, "rb") as f:
+                    source = ingest.LocalFile(f)
+                    if kind == KIND_LABELED:
+                        result = asyncio.run(ingest.ingest_labeled_csv(
+                            db, dataset, source, params["label"], params.get("codec"), stats, checkpoint
+                        ))
+                    else:
+                        result = asyncio.run(ingest.ingest_samples_csv(
+                            db, dataset, source, params.get("codec"), stats, checkpoint
+                        ))
+            else:
+                raise ValueError(f"Unknown ingest job kind '{kind}'")
+
+            if params.get("blob_id") is not None:
+                # 同一内容再次上传到这个数据集时不再提取
+                blob = db.get(FileBlob, params["blob_id"])
+                if blob is not None:
+                    blob.import_info = result
+        except _JobLost:
+            status = None
+        except Exception as e:
+            traceback.print_exc()
+            db.rollback()
+            status, result, error = JOB_FAILED, None, str(e)
+
+    owned = status is not None and _update_owned(db, job_id, worker_id, {
+        "status": status,
+        "result": result,
+        "error": error,
+        "bytes_read": stats.bytes_read,
+        "rows_parsed": stats.rows_parsed,
+        "rows_inserted": stats.rows_inserted if status == JOB_DONE else checkpoint.rows_committed,
+        "rows_skipped": stats.rows_skipped,
+        "finished_at": datetime.utcnow(),
+    })
+    if not owned:
+        # 已被 fail_stale_jobs 标记为失败并释放了输入，放弃未提交的部分
+        db.rollback()
+        db.close()
+        print(f"⚠️  Ingest job {job_id} was marked failed while running, discarding its last batch")
+        return
+    if status == JOB_FAILED and checkpoint.rows_committed:
+        _sync_num_samples(db, dataset_id)
+    job = db.get(IngestJob, job_id)
+    orphan = _release_input(db, job)
+    db.commit()
+    _cleanup(job)
+    file_blobs.remove_file(orphan)
+    if status == JOB_DONE:
+        _warm_density(db, dataset_id)
+        dataset_export.warm_dataset(dataset_id)
+    db.close()
+
+
+def _warm_density(db: Session, dataset_id: int):
+    """导入完成后预先计算概览密度图；失败不影响任务结果，请求时会再计算"""
+    try:
+        dataset = db.get(Dataset, dataset_id)
+        if dataset is not None:
+            density.warm(db, dataset)
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️  Could not precompute the density map of dataset {dataset_id}: {e}")
+
+
+def _wait_for_job(client, stop_event):
+    """空闲时等待：有 Redis 时阻塞在 BRPOP 上，否则按轮询间隔休眠"""
+    timeout = max(settings.INGEST_POLL_INTERVAL, 0.1)
+    if client is not None:
+        try:
+            client.brpop(REDIS_QUEUE_KEY, timeout=max(1, int(timeout)))
+            return
+        except Exception as e:
+            print(f"⚠️  Redis wait failed, polling the database instead: {e}")
+    stop_event.wait(timeout)
+
+
+def worker_main(stop_event):
+    """worker 进程入口"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    client = _redis_client()
+    print(f"Ingest worker {worker_id} started")
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            fail_stale_jobs(db)
+            job_id = claim_job(db, worker_id)
+        except Exception as e:
+            print(f"❌ Ingest worker {worker_id} could not claim a job: {e}")
+            job_id = None
+        finally:
+            db.close()
+
+        if job_id is None:
+            _wait_for_job(client, stop_event)
+            continue
+        print(f"Ingest worker {worker_id} running job {job_id}")
+        run_job(job_id, worker_id)
+
+
+def start_workers(count: int) -> tuple:
+    """启动 count 个 worker 进程，返回 (stop_event, processes)"""
+    context = multiprocessing.get_context("spawn")
+    stop_event = context.Event()
+    processes = []
+    for _ in range(max(0, count)):
+        process = context.Process(target=worker_main, args=(stop_event,), daemon=True)
+        process.start()
+        processes.append(process)
+    return stop_event, processes
+
+
+def stop_workers(workers: tuple, timeout: float = 10.0):
+    """通知 worker 在当前任务结束后退出，超时仍未退出的强制结束（其事务会回滚）"""
+    stop_event, processes = workers
+    stop_event.set()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            process.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background ingest workers")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    workers = start_workers(args.workers)
+    try:
+        for process in workers[1]:
+            process.join()
+    except KeyboardInterrupt:
+        stop_workers(workers)
@@ -0,0 +1,225 @@
+"""
+缩放图表用的多分辨率 (LOD) 最小/最大值金字塔
+第 l 层把光谱按 2^l 个点一组分箱，每箱保存最小值、最大值和一个顺序标记（最小值是否在最大值之前），
+由下一层两两合并得到；画图时每个像素最多两个点，形状与原始曲线一致
+
+导入时对点数不少于 LOD_MIN_BANDS 的样本计算金字塔，每个样本一行 spectral_lods，从第 2 层开始
+保存到箱数不超过 _TOP_BINS 的一层（约为原始数据的一半大小）；可见点数不超过 2 x pixels 时直接返回原始数据，
+因此不会用到第 1 层；较短的光谱和旧数据在请求时由原始数据计算
+
+data 按层依次拼接：float32 最小值[n_l]、float32 最大值[n_l]、uint8 顺序标记[n_l]，全是 NaN 的箱为 NaN
+"""
+from typing import List, Optional, Sequence, Tuple
+import math
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from band_selection import BandSelection
+from config import settings
+from models import Dataset, SpectralLOD, SpectralSample
+import spectral_storage
+import wavelength_grids
+
+FIRST_LEVEL = 2
+_TOP_BINS = 256
+_BUILD_VALUES = 1 << 22  # values per build step, bounds the temporary arrays of a large batch
+
+VALUE_DTYPE = np.dtype("<f4")
+FLAG_DTYPE = np.dtype("u1")
+
+
+def _level_bins(num_bands: int, level: int) -> int:
+    return -(-num_bands // (1 << level))
+
+
+def _merge(minimum: np.ndarray, maximum: np.ndarray, min_first: np.ndarray):
+    """相邻两箱合并为一箱；输入的最后一维是箱，NaN 以 +inf / -inf 表示"""
+    if minimum.shape[-1] % 2:
+        pad = [(0, 0)] * (minimum.ndim - 1) + [(0, 1)]
+        minimum = np.pad(minimum, pad, constant_values=np.inf)
+        maximum = np.pad(maximum, pad, constant_values=-np.inf)
+        min_first = np.pad(min_first, pad, constant_values=True)
+    shape = minimum.shape[:-1] + (minimum.shape[-1] // 2, 2)
+    minimum, maximum, min_first = minimum.reshape(shape), maximum.reshape(shape), min_first.reshape(shape)
+
+    min_left = minimum[..., 0] <= minimum[..., 1]
+    max_left = maximum[..., 0] >= maximum[..., 1]
+    # 最小值和最大值来自不同的子箱时由子箱的先后决定顺序，否则沿用该子箱的标记
+    order = np.where(min_left, min_first[..., 0], min_first[..., 1])
+    order = np.where(min_left & ~max_left, True, np.where(~min_left & max_left, False, order))
+    return (
+        np.where(min_left, minimum[..., 0], minimum[..., 1]),
+        np.where(max_left, maximum[..., 0], maximum[..., 1]),
+        order,
+    )
+
+
+def _base(values: np.ndarray):
+    """原始数据作为第 0 层"""
+    values = np.asarray(values, dtype=np.float64)
+    missing = ~np.isfinite(values)
+    return (
+        np.where(missing, np.inf, values),
+        np.where(missing, -np.inf, values),
+        np.ones(values.shape, dtype=bool),
+    )
+
+
+def _reduce(levels, steps: int):
+    for _ in range(steps):
+        levels = _merge(*levels)
+    return levels
+
+
+def build(matrix: np.ndarray) -> Tuple[int, List[bytes]]:
+    """一批等长样本 (n x bands) 的金字塔，返回 (层数, 每个样本的数据)"""
+    levels = _reduce(_base(matrix), FIRST_LEVEL)
+    parts = [[] for _ in range(matrix.shape[0])]
+    num_levels = 0
+    while True:
+        minimum, maximum, min_first = levels
+        minimum = np.where(np.isinf(minimum), np.nan, minimum).astype(VALUE_DTYPE)
+        maximum = np.where(np.isinf(maximum), np.nan, maximum).astype(VALUE_DTYPE)
+        for i, part in enumerate(parts):
+            part += [minimum[i].tobytes(), maximum[i].tobytes(), min_first[i].astype(FLAG_DTYPE).tobytes()]
+        num_levels += 1
+        if minimum.shape[-1] <= _TOP_BINS:
+            break
+        levels = _merge(*levels)
+    return num_levels, [b"".join(part) for part in parts]
+
+
+def _insert(db: Session, rows: List[dict]):
+    for start in range(0, len(rows), settings.INGEST_BATCH_ROWS):
+        db.execute(insert(SpectralLOD), rows[start:start + settings.INGEST_BATCH_ROWS])
+
+
+def store_matrix(db: Session, dataset: Dataset, row_start: int, wavelengths: Sequence[float], matrix: np.ndarray):
+    """导入时为一批共享波长轴的样本保存金字塔（不提交事务）"""
+    num_rows, num_bands = matrix.shape
+    if num_bands < settings.LOD_MIN_BANDS or num_rows == 0:
+        return
+    grid_id = wavelength_grids.get_or_create_grid(db, wavelengths).id
+    step = max(1, _BUILD_VALUES // num_bands)
+    for lo in range(0, num_rows, step):
+        num_levels, blobs = build(matrix[lo:lo + step])
+        _insert(db, [
+            {
+                "dataset_id": dataset.id, "row_index": row_start + lo + i, "wavelength_grid_id": grid_id,
+                "num_bands": num_bands, "num_levels": num_levels, "data": blob,
+            }
+            for i, blob in enumerate(blobs)
+        ])
+
+
+def store_rows(
+    db: Session, dataset: Dataset, row_start: int,
+    wavelengths: Sequence[np.ndarray], values: Sequence[np.ndarray]
+):
+    """不等长样本逐行保存金字塔（不提交事务）"""
+    rows = []
+    grid_ids = {}
+    for i, (axis, row) in enumerate(zip(wavelengths, values)):
+        if len(row) < settings.LOD_MIN_BANDS:
+            continue
+        key = wavelength_grids.grid_hash(axis)
+        if key not in grid_ids:
+            grid_ids[key] = wavelength_grids.get_or_create_grid(db, axis).id
+        num_levels, (blob,) = build(np.asarray(row, dtype=np.float64).reshape(1, -1))
+        rows.append({
+            "dataset_id": dataset.id, "row_index": row_start + i, "wavelength_grid_id": grid_ids[key],
+            "num_bands": len(row), "num_levels": num_levels, "data": blob,
+        })
+    _insert(db, rows)
+
+
+def _decode_level(lod: SpectralLOD, level: int):
+    """读取保存的第 level 层，NaN 还原为 +inf / -inf 以便继续合并"""
+    offset = 0
+    for stored in range(FIRST_LEVEL, level):
+        offset += _level_bins(lod.num_bands, stored) * 9
+    n = _level_bins(lod.num_bands, level)
+    minimum = np.frombuffer(lod.data, VALUE_DTYPE, n, offset).astype(np.float64)
+    maximum = np.frombuffer(lod.data, VALUE_DTYPE, n, offset + 4 * n).astype(np.float64)
+    min_first = np.frombuffer(lod.data, FLAG_DTYPE, n, offset + 8 * n).astype(bool)
+    return (
+        np.where(np.isnan(minimum), np.inf, minimum),
+        np.where(np.isnan(maximum), -np.inf, maximum),
+        min_first,
+    )
+
+
+def _choose_level(num_points: int, pixels: int) -> int:
+    """可见范围内的点数不超过 2 x pixels 时返回原始数据（第 0 层）"""
+    if num_points <= 2 * pixels:
+        return 0
+    return math.ceil(math.log2(num_points / pixels))
+
+
+def sample_lod(
+    db: Session, dataset: Dataset, sample: SpectralSample,
+    wl_min: Optional[float], wl_max: Optional[float], pixels: int
+) -> dict:
+    """
+    一个样本在 [wl_min, wl_max] 范围内最多约 2 x pixels 个点的曲线
+    有保存的金字塔时较粗的层只读取这一行 spectral_lods，不读取原始光谱
+    """
+    lod = None
+    if sample.row_index is not None:
+        lod = db.query(SpectralLOD).filter(
+            SpectralLOD.dataset_id == dataset.id, SpectralLOD.row_index == sample.row_index
+        ).first()
+
+    values = None
+    if lod is not None:
+        axis = np.asarray(wavelength_grids.load_grid(db, lod.wavelength_grid_id), dtype=np.float64)
+    else:
+        axis, values = spectral_storage.read_sample_row(db, dataset, sample)
+        axis = np.asarray(axis, dtype=np.float64)
+
+    window = BandSelection(wl_min, wl_max).resolve(axis)
+    if isinstance(window, slice):
+        lo, hi = window.start, window.stop
+    elif len(window):
+        # 非单调的轴返回下标数组：取覆盖全部选中点的最小连续区间
+        lo, hi = int(window.min()), int(window.max()) + 1
+    else:
+        lo = hi = 0
+    level = _choose_level(hi - lo, pixels)
+
+    if level and lod is not None:
+        stored = min(level, FIRST_LEVEL + lod.num_levels - 1)
+        levels = _reduce(_decode_level(lod, stored), level - stored)
+    else:
+        if values is None:
+            _, values = spectral_storage.read_sample_row(db, dataset, sample)
+        values = np.asarray(values, dtype=np.float64)
+        if level == 0:
+            return _response(dataset, sample, 0, hi - lo, axis[lo:hi], values[lo:hi])
+        levels = _reduce(_base(values), level)
+
+    # 与可见范围相交的箱，每箱按原始顺序输出最小值和最大值两个点，横坐标为箱的首尾波长
+    size = 1 << level
+    first, last = lo >> level, (hi - 1) >> level
+    minimum, maximum, min_first = (a[first:last + 1] for a in levels)
+    starts = np.arange(first, last + 1) * size
+    x_start = axis[starts]
+    x_end = axis[np.minimum(starts + size, len(axis)) - 1]
+    keep = np.isfinite(minimum)
+    x = np.column_stack([x_start, x_end])[keep].ravel()
+    y = np.where(
+        min_first[:, None], np.column_stack([minimum, maximum]), np.column_stack([maximum, minimum])
+    )[keep].ravel()
+    return _response(dataset, sample, level, hi - lo, x, y)
+
+
+def _response(dataset: Dataset, sample: SpectralSample, level: int, total: int, x: np.ndarray, y: np.ndarray) -> dict:
+    return {
+        "dataset_id": dataset.id,
+        "sample_id": sample.id,
+        "level": level,
+        "bin_size": 1 << level,
+        "total_points": int(total),
+        "wavelengths": np.asarray(x, dtype=np.float64).tolist(),
+        "intensities": [float(v) if np.isfinite(v) else None for v in y],
+    }
@@ -2,13 +2,19 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
 import os
 from database import Base, engine, SessionLocal
 from models import User, Category
 from routes import auth_routes, dataset_routes, category_routes, upload_routes, stats_routes
 from config import settings
 from auth import get_password_hash
-from migrate_db import migrate_category_constraint, add_download_baseline
+from migrate_db import (
+    migrate_category_constraint, add_download_baseline, add_missing_columns,
+    make_sample_row_index_unique, move_private_files
+)
+import ingest
+import ingest_jobs
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
@@ -17,6 +23,9 @@ Base.metadata.create_all(bind=engine)
 print("正在检查数据库迁移...")
 migrate_category_constraint()
 add_download_baseline()
+add_missing_columns()
+make_sample_row_index_unique()
+move_private_files()
 
 # Auto-initialize database with default data on startup
 def auto_init_db():
@@ -99,10 +108,20 @@ auto_init_db()
 if not os.path.exists(settings.UPLOAD_DIR):
     os.makedirs(settings.UPLOAD_DIR)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动后台导入 worker 进程，关闭时等待当前任务结束
+    workers = ingest_jobs.start_workers(settings.INGEST_WORKERS)
+    yield
+    ingest_jobs.stop_workers(workers)
+    ingest.shutdown_parse_pool()
+
+
 app = FastAPI(
     title="SpectraNet API",
     description="Spectral Dataset Repository - Similar to ImageNet but for spectral data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -112,6 +131,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Mount static files (uploads)
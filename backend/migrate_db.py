@@ -1,8 +1,11 @@
 """n数据库迁移脚本
 自动修复分类唯一性约束
 """
-from sqlalchemy import text
-from database import engine
+from sqlalchemy import text, inspect
+from config import settings
+from database import engine, Base
+import os
+import shutil
 import traceback
 
 def migrate_category_constraint():
@@ -186,6 +189,101 @@ def add_download_baseline():
         traceback.print_exc()
         return False
 
+def add_missing_columns():
+    """为已存在的表补齐模型中新增的列和索引（create_all 不会修改已有表）"""
+    
+    print("\n" + "="*60)
+    print("检查新增列...")
+    print("="*60)
+    
+    try:
+        inspector = inspect(engine)
+        existing_tables = set(inspector.get_table_names())
+        
+        with engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                
+                existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing_columns:
+                        continue
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(
+                        f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                    ))
+                    print(f"✅ 已添加列 {table.name}.{column.name} ({column_type})")
+                
+                existing_indexes = {idx["name"] for idx in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing_indexes:
+                        index.create(bind=conn)
+                        print(f"✅ 已添加索引 {index.name}")
+        
+        return True
+    
+    except Exception as e:
+        print(f"\n❌ 补齐列失败: {e}")
+        traceback.print_exc()
+        return False
+
+def make_sample_row_index_unique():
+    """把 spectral_samples 的 (dataset_id, row_index) 索引改为唯一索引（旧数据库中是普通索引）"""
+    
+    name = "ix_spectral_samples_dataset_row"
+    try:
+        inspector = inspect(engine)
+        if "spectral_samples" not in inspector.get_table_names():
+            return True
+        indexes = {idx["name"]: idx for idx in inspector.get_indexes("spectral_samples")}
+        if name in indexes and indexes[name]["unique"]:
+            return True
+        
+        table = Base.metadata.tables["spectral_samples"]
+        index = next(idx for idx in table.indexes if idx.name == name)
+        with engine.begin() as conn:
+            if name in indexes:
+                conn.execute(text(f"DROP INDEX {name}"))
+            index.create(bind=conn)
+        print(f"✅ 索引 {name} 已改为唯一索引")
+        return True
+    
+    except Exception as e:
+        # 已有重复的 row_index 时创建失败，事务回滚后保留原索引
+        print(f"\n❌ 唯一索引 {name} 创建失败（可能存在重复的 row_index）: {e}")
+        traceback.print_exc()
+        return False
+
+def move_private_files():
+    """mmap 文件和分块上传的临时文件原来保存在公开的 UPLOAD_DIR 下，移到 SPECTRA_DIR / UPLOAD_PARTIAL_DIR"""
+    
+    moves = [
+        (os.path.join(settings.UPLOAD_DIR, "spectra"), settings.SPECTRA_DIR),
+        (os.path.join(settings.UPLOAD_DIR, "partial"), settings.UPLOAD_PARTIAL_DIR),
+    ]
+    try:
+        for old_dir, new_dir in moves:
+            if not os.path.isdir(old_dir) or os.path.abspath(old_dir) == os.path.abspath(new_dir):
+                continue
+            os.makedirs(new_dir, exist_ok=True)
+            for name in os.listdir(old_dir):
+                target = os.path.join(new_dir, name)
+                if not os.path.exists(target):
+                    shutil.move(os.path.join(old_dir, name), target)
+                    print(f"✅ 已移动 {name} 到 {new_dir}")
+            if not os.listdir(old_dir):
+                os.rmdir(old_dir)
+        return True
+    
+    except Exception as e:
+        print(f"\n❌ 移动文件失败: {e}")
+        traceback.print_exc()
+        return False
+
 if __name__ == "__main__":
     migrate_category_constraint()
     add_download_baseline()
+    add_missing_columns()
+    make_sample_row_index_unique()
+    move_private_files()
@@ -0,0 +1,85 @@
+"""
+样本存储迁移脚本
+把旧的 JSON 样本行转换为 mmap (.npy 文件) 或 columnar (数据库打包块) 存储
+
+用法:
+    python migrate_storage.py                  # 转换所有 json 数据集为 mmap
+    python migrate_storage.py --mode columnar  # 转换为数据库打包块
+    python migrate_storage.py --dataset 3      # 只转换指定数据集
+    python migrate_storage.py --mode columnar --codec shuffle-zlib
+    python migrate_storage.py --grids-only     # 保留 json 存储，只把波长数组移到 wavelength_grids
+"""
+import argparse
+import traceback
+from database import SessionLocal
+from models import Dataset, SpectralSample
+import spectral_storage
+import spectral_codecs
+
+
+def migrate_storage(
+    mode: str = spectral_storage.STORAGE_MMAP,
+    dataset_id: int = None,
+    codec: str = None,
+    grids_only: bool = False
+):
+    db = SessionLocal()
+    
+    try:
+        query = db.query(Dataset)
+        if dataset_id is not None:
+            query = query.filter(Dataset.id == dataset_id)
+        datasets = query.order_by(Dataset.id).all()
+        
+        for dataset in datasets:
+            if spectral_storage.get_storage_mode(dataset) != spectral_storage.STORAGE_JSON:
+                print(f"ℹ️  数据集 {dataset.id} 已使用 {dataset.storage_mode} 存储，跳过")
+                continue
+            
+            has_samples = db.query(SpectralSample.id).filter(
+                SpectralSample.dataset_id == dataset.id
+            ).first()
+            if not has_samples:
+                print(f"ℹ️  数据集 {dataset.id} 没有样本，跳过")
+                continue
+            
+            try:
+                if grids_only:
+                    updated = spectral_storage.dedupe_wavelengths(db, dataset)
+                    db.commit()
+                    print(f"✅ 数据集 {dataset.id} ({dataset.name}): {updated} 个样本改为引用共享波长轴")
+                    continue
+                
+                converted = spectral_storage.convert_dataset(db, dataset, mode, codec)
+                db.commit()
+                print(f"✅ 数据集 {dataset.id} ({dataset.name}): 已转换 {converted} 个样本为 {mode}")
+            except Exception as e:
+                db.rollback()
+                # 回滚后 mmap 文件中可能残留已写入的行；数据集仍是 json，不会读取这个文件，
+                # 重新转换时从第 0 行覆盖写入，文件只会变长，头部行数之外的多余字节不会被读取
+                print(f"❌ 数据集 {dataset.id} 转换失败: {e}")
+                traceback.print_exc()
+    
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSON spectral samples to packed storage")
+    parser.add_argument(
+        "--mode",
+        choices=[spectral_storage.STORAGE_MMAP, spectral_storage.STORAGE_COLUMNAR],
+        default=spectral_storage.STORAGE_MMAP
+    )
+    parser.add_argument("--dataset", type=int, default=None, help="Only convert this dataset id")
+    parser.add_argument(
+        "--codec", choices=spectral_codecs.CODECS, default=None,
+        help="Codec for columnar chunks (defaults to SPECTRAL_CODEC)"
+    )
+    parser.add_argument(
+        "--grids-only", action="store_true",
+        help="Keep JSON storage and only move per-row wavelengths into wavelength_grids"
+    )
+    args = parser.parse_args()
+    
+    migrate_storage(args.mode, args.dataset, args.codec, args.grids_only)
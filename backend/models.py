@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float, Boolean, JSON, UniqueConstraint
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float, Boolean, JSON, UniqueConstraint, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -17,6 +17,7 @@ class User(Base):
     is_superuser = Column(Boolean, default=False)
     is_admin = Column(Boolean, default=False)  # 管理员权限:可上传下载
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # owner info in dataset detail ETags
     
     datasets = relationship("Dataset", back_populates="owner")
     
@@ -29,6 +30,7 @@ class Category(Base):
     description = Column(Text)
     parent_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # versions the category tree for conditional GET
     
     # 添加组合唯一性约束：同一父分类下名称不能重复
     __table_args__ = (
@@ -39,6 +41,35 @@ class Category(Base):
     datasets = relationship("Dataset", back_populates="category")
 
 
+class WavelengthGrid(Base):
+    """A wavelength axis shared by every dataset and sample that uses it"""
+    __tablename__ = "wavelength_grids"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, index=True, nullable=False)  # SHA-256 of data
+    num_bands = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)  # little-endian float64 values
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class FileBlob(Base):
+    """An uploaded file stored once under UPLOAD_DIR/blobs by the SHA-256 of its content"""
+    __tablename__ = "file_blobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, index=True, nullable=False)
+    size = Column(Integer, nullable=False)
+    path = Column(String(500), nullable=False)  # relative to UPLOAD_DIR, e.g. 'blobs/ab/<sha256>.csv'
+    ref_count = Column(Integer, default=0, nullable=False)  # datasets whose file_path points here
+    
+    # Parse results cached per content so a re-upload is not parsed again
+    num_records = Column(Integer)  # CSV data rows
+    import_info = Column(JSON)  # spectral_formats.import_file result
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class Dataset(Base):
     __tablename__ = "datasets"
     
@@ -55,10 +86,19 @@ class Dataset(Base):
     num_samples = Column(Integer, default=0)
     num_bands = Column(Integer)  # Number of spectral bands
     
+    # Sample storage: 'json' (legacy per-row JSON) or 'columnar' (packed chunks)
+    storage_mode = Column(String(20))  # 首次写入样本时确定，旧数据为空表示 json
+    storage_dtype = Column(String(20))  # e.g., 'float32', 'float64'
+    storage_codec = Column(String(20))  # e.g., 'raw', 'shuffle-zlib', 'int16'
+    wavelength_grid_id = Column(Integer, ForeignKey("wavelength_grids.id"))  # Shared axis of packed storage
+    is_ragged = Column(Boolean, default=False)  # Some samples use a different axis / length
+    data_version = Column(Integer, default=0)  # bumped on every sample append; keys derived caches
+    
     # File information
     file_format = Column(String(50))  # e.g., 'csv', 'mat', 'hdf5'
     file_size = Column(Integer)  # in bytes
     file_path = Column(String(500))
+    file_blob_id = Column(Integer, ForeignKey("file_blobs.id"), index=True)  # NULL for files uploaded before deduplication
     
     # Additional metadata
     tags = Column(JSON)  # Array of tags
@@ -78,6 +118,12 @@ class Dataset(Base):
     category = relationship("Category", back_populates="datasets")
     owner = relationship("User", back_populates="datasets")
     samples = relationship("SpectralSample", back_populates="dataset", cascade="all, delete-orphan")
+    chunks = relationship("SpectralChunk", back_populates="dataset", cascade="all, delete-orphan")
+    ingest_jobs = relationship("IngestJob", back_populates="dataset", cascade="all, delete-orphan")
+    upload_sessions = relationship("UploadSession", cascade="all, delete-orphan")
+    band_stats = relationship("DatasetBandStats", back_populates="dataset", uselist=False, cascade="all, delete-orphan")
+    densities = relationship("DatasetDensity", back_populates="dataset", cascade="all, delete-orphan")
+    lods = relationship("SpectralLOD", back_populates="dataset", cascade="all, delete-orphan")
 
 
 class SpectralSample(Base):
@@ -88,9 +134,11 @@ class SpectralSample(Base):
     
     sample_name = Column(String(200))
     sample_label = Column(String(100))  # Classification label
+    row_index = Column(Integer)  # Position in the dataset's packed matrix
+    wavelength_grid_id = Column(Integer, ForeignKey("wavelength_grids.id"), index=True)
     
-    # Spectral data (stored as JSON array or reference to file)
-    wavelengths = Column(JSON)  # Array of wavelength values
+    # Spectral data (stored as JSON array, or NULL when the dataset is columnar)
+    wavelengths = Column(JSON)  # Legacy rows only; new rows reference wavelength_grid_id
     intensities = Column(JSON)  # Array of intensity/reflectance values
     
     # Additional properties
@@ -98,4 +146,176 @@ class SpectralSample(Base):
     
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        Index('ix_spectral_samples_dataset_row', 'dataset_id', 'row_index', unique=True),  # NULL for legacy json rows
+        Index('ix_spectral_samples_dataset_id_id', 'dataset_id', 'id'),  # keyset pages of json datasets
+    )
+    
     dataset = relationship("Dataset", back_populates="samples")
+
+
+class SpectralChunk(Base):
+    """A block of consecutive samples stored as one packed row-major matrix"""
+    __tablename__ = "spectral_chunks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    row_start = Column(Integer, nullable=False)  # row_index of the first sample
+    num_rows = Column(Integer, nullable=False)
+    num_bands = Column(Integer, nullable=False)  # ragged: total number of values in the chunk
+    dtype = Column(String(20), nullable=False)
+    codec = Column(String(20), default='raw')  # see spectral_codecs
+    data = Column(LargeBinary, nullable=False)  # encoded little-endian intensities
+    
+    # 'dense': num_rows x num_bands on the dataset's grid
+    # 'ragged': concatenated rows, row i is values[offsets[i]:offsets[i+1]]
+    layout = Column(String(10), default='dense')
+    offsets = Column(LargeBinary)  # ragged only: int64 (num_rows + 1)
+    wavelength_data = Column(LargeBinary)  # ragged only: concatenated float64 wavelengths
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint('dataset_id', 'chunk_index', name='uq_chunk_dataset_index'),
+    )
+    
+    dataset = relationship("Dataset", back_populates="chunks")
+
+
+class DatasetBandStats(Base):
+    """Per-band running statistics of a dataset, merged on every append"""
+    __tablename__ = "dataset_band_stats"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), unique=True, nullable=False)
+    wavelength_grid_id = Column(Integer, ForeignKey("wavelength_grids.id"))  # axis the statistics refer to
+    num_bands = Column(Integer, nullable=False)
+    num_samples = Column(Integer, default=0)
+    excluded_samples = Column(Integer, default=0)  # samples on another axis, not included
+    
+    # little-endian arrays of num_bands values (see band_stats)
+    counts = Column(LargeBinary, nullable=False)  # int64 finite values per band
+    mean = Column(LargeBinary, nullable=False)  # float64
+    m2 = Column(LargeBinary, nullable=False)  # float64 sum of squared deviations (Welford)
+    min = Column(LargeBinary, nullable=False)  # float64
+    max = Column(LargeBinary, nullable=False)  # float64
+    
+    # per label: [[label, num_samples], ...] and labels x bands matrices
+    labels = Column(JSON)
+    label_counts = Column(LargeBinary)  # int64
+    label_means = Column(LargeBinary)  # float64
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    dataset = relationship("Dataset", back_populates="band_stats")
+
+
+class DatasetDensity(Base):
+    """Cached wavelength x intensity histogram of a dataset for overview plots"""
+    __tablename__ = "dataset_densities"
+    __table_args__ = (
+        UniqueConstraint("dataset_id", "width", "height", "label", name="uq_dataset_density"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False, index=True)
+    width = Column(Integer, nullable=False)  # wavelength bins
+    height = Column(Integer, nullable=False)  # intensity bins
+    label = Column(String(100), nullable=False, default="")  # '' = all samples
+    data_version = Column(Integer, nullable=False)  # Dataset.data_version the counts were computed from
+    num_samples = Column(Integer, default=0)
+    wavelength_min = Column(Float)
+    wavelength_max = Column(Float)
+    intensity_min = Column(Float)
+    intensity_max = Column(Float)
+    counts = Column(LargeBinary, nullable=False)  # little-endian uint32, height x width, row 0 = lowest intensity
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    dataset = relationship("Dataset", back_populates="densities")
+
+
+class SpectralLOD(Base):
+    """Min/max decimation pyramid of one long spectrum for zoomable charts"""
+    __tablename__ = "spectral_lods"
+    __table_args__ = (
+        UniqueConstraint("dataset_id", "row_index", name="uq_spectral_lod_row"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False)
+    row_index = Column(Integer, nullable=False)  # SpectralSample.row_index
+    wavelength_grid_id = Column(Integer, ForeignKey("wavelength_grids.id"), nullable=False)  # axis of the sample
+    num_bands = Column(Integer, nullable=False)
+    num_levels = Column(Integer, nullable=False)  # stored levels, starting at lod.FIRST_LEVEL
+    data = Column(LargeBinary, nullable=False)  # per level: float32 min, float32 max, uint8 min-first flags
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    dataset = relationship("Dataset", back_populates="lods")
+
+
+class IngestJob(Base):
+    """A stored CSV upload waiting for (or processed by) a background ingest worker"""
+    __tablename__ = "ingest_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    kind = Column(String(20), nullable=False)  # 'samples' or 'labeled'
+    file_path = Column(String(500), nullable=False)  # stored upload under UPLOAD_DIR/jobs
+    params = Column(JSON)  # e.g. {"label": ..., "codec": ...}
+    
+    status = Column(String(20), default='queued', index=True)  # queued, running, done, failed
+    worker_id = Column(String(100))
+    total_bytes = Column(Integer, default=0)
+    bytes_read = Column(Integer, default=0)
+    rows_parsed = Column(Integer, default=0)
+    rows_inserted = Column(Integer, default=0)
+    rows_skipped = Column(Integer, default=0)
+    error = Column(Text)
+    result = Column(JSON)  # the response the inline upload would have returned
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)  # refreshed by the running worker; stale heartbeats mark the job failed
+    finished_at = Column(DateTime)
+    
+    dataset = relationship("Dataset", back_populates="ingest_jobs")
+
+
+class UploadSession(Base):
+    """A resumable dataset file upload assembled from numbered chunks"""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    filename = Column(String(255), nullable=False)
+    total_size = Column(Integer, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    num_chunks = Column(Integer, nullable=False)
+    sha256 = Column(String(64))  # optional checksum of the whole file, verified on completion
+    status = Column(String(20), default='open')  # open, complete, aborted
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+    
+    chunks = relationship("UploadChunk", back_populates="session", cascade="all, delete-orphan")
+
+
+class UploadChunk(Base):
+    """A chunk of an upload session that has been written to the partial file"""
+    __tablename__ = "upload_chunks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("upload_sessions.id"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    received_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint('session_id', 'chunk_index', name='uq_upload_chunk_index'),
+    )
+    
+    session = relationship("UploadSession", back_populates="chunks")
@@ -0,0 +1,46 @@
+"""
+键集（游标）分页
+游标是 base64url 编码的 {"s": 范围, "k": 上一页最后一行的排序键}，对客户端不透明；
+下一页用 WHERE key > :k ORDER BY key LIMIT n 走索引定位，不需要扫描并丢弃前面的行
+"""
+from typing import Any, Optional
+import base64
+import binascii
+import json
+from fastapi import HTTPException, Response, status
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(scope: str, key: Any) -> str:
+    payload = json.dumps({"s": scope, "k": key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, scope: str, key_type: type = int) -> Any:
+    """返回游标中的排序键；游标无效或属于别的列表时返回 400"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload["s"] == scope and isinstance(payload["k"], key_type):
+            return payload["k"]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        pass
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid pagination cursor"
+    )
+
+
+def check_paging(skip: int, after: Optional[str]):
+    if after is not None and skip:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either skip or after, not both"
+        )
+
+
+def set_next_cursor(response: Response, scope: str, key: Any):
+    """还有下一页时在响应头中返回游标"""
+    if key is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(scope, key)
@@ -0,0 +1,23 @@
+"""
+列表接口的字段投影（?fields=a,b,c）
+只查询请求的列，不先加载整行再裁剪；id 总是返回（同时也是分页游标的依据）
+"""
+from typing import List, Optional, Sequence
+from fastapi import HTTPException, status
+
+
+def parse_fields(value: Optional[str], allowed: Sequence[str]) -> Optional[List[str]]:
+    """解析逗号分隔的字段列表，未指定时返回 None；未知字段返回 400"""
+    if value is None:
+        return None
+    fields = list(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown or not fields:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+            if unknown else "fields must not be empty"
+        )
+    if "id" not in fields:
+        fields.insert(0, "id")
+    return fields
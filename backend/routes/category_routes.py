@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from database import get_db
 from models import Category, User
 from schemas import CategoryCreate, CategoryResponse
 from auth import get_current_active_user
+import http_cache
 
 router = APIRouter(prefix="/api/categories", tags=["categories"])
 
@@ -16,8 +17,15 @@ def get_categories(db: Session = Depends(get_db)):
 
 
 @router.get("/tree", response_model=List[dict])
-def get_category_tree(db: Session = Depends(get_db)):
-    """获取层级分类树结构"""
+def get_category_tree(request: Request, response: Response, db: Session = Depends(get_db)):
+    """获取层级分类树结构（分类没有变化时返回 304）"""
+    version = http_cache.categories_version(db)
+    not_modified = http_cache.conditional(
+        request, response, http_cache.weak_etag("categories", *version), version[1], http_cache.CATEGORY_TREE
+    )
+    if not_modified is not None:
+        return not_modified
+    
     def build_tree(parent_id=None):
         categories = db.query(Category).filter(Category.parent_id == parent_id).all()
         result = []
@@ -1,34 +1,70 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session, defer
 from sqlalchemy import func, or_
-from typing import List, Optional
-import io
-import csv
+from typing import Any, Dict, List, Optional, Union
+import os
 from urllib.parse import quote
-from database import get_db
-from models import Dataset, User, Category, SpectralSample
+from database import get_db, SessionLocal
+from models import Dataset, User, Category, SpectralSample, WavelengthGrid
 from schemas import (
     DatasetCreate, DatasetUpdate, DatasetResponse, 
     DatasetDetailResponse, DatasetFilter, DatasetStats,
-    SpectralSampleResponse
+    SpectralSampleResponse, DatasetStorageReport, WavelengthGridResponse, DatasetSummary,
+    SampleFieldsPage, DatasetDensityResponse, SampleLODResponse
 )
 from auth import get_current_active_user
+import spectral_storage
+import wavelength_grids
+import file_blobs
+import band_stats
+import dataset_export
+import density
+import http_cache
+import lod
+import pagination
+import projection
+import band_selection
+from band_selection import BandSelection
+import sample_transport
+from config import settings
 
 router = APIRouter(prefix="/api/datasets", tags=["datasets"])
 
+DATASET_FIELDS = tuple(DatasetResponse.model_fields)
 
-@router.get("/", response_model=List[DatasetResponse])
+
+@router.get("/", response_model=Union[List[DatasetResponse], List[Dict[str, Any]]])
 def get_datasets(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,name,num_samples"),
     search: Optional[str] = None,
     category_id: Optional[int] = None,
     spectral_type: Optional[str] = None,
     is_verified: Optional[bool] = None,
     db: Session = Depends(get_db)
 ):
-    query = db.query(Dataset).filter(Dataset.is_public == True)
+    # 数据集没有变化时直接返回 304，不执行列表查询
+    version = http_cache.datasets_version(db)
+    not_modified = http_cache.conditional(
+        request, response, http_cache.weak_etag("datasets", *version),
+        None,  # 列表里的计数没有修改时间，只用 ETag
+        http_cache.DATASET_LIST
+    )
+    if not_modified is not None:
+        return not_modified
+    
+    # 指定 fields 时只 SELECT 这些列（列表页通常不需要 extra_metadata 等 JSON 列）
+    selected = projection.parse_fields(fields, DATASET_FIELDS)
+    if selected is None:
+        query = db.query(Dataset)
+    else:
+        query = db.query(*[getattr(Dataset, f) for f in selected])
+    query = query.filter(Dataset.is_public == True)
     
     if search:
         query = query.filter(
@@ -47,12 +83,40 @@ def get_datasets(
     if is_verified is not None:
         query = query.filter(Dataset.is_verified == is_verified)
     
-    datasets = query.offset(skip).limit(limit).all()
+    # Keyset pagination on the primary key: each page is an index range scan
+    pagination.check_paging(skip, after)
+    if after is not None:
+        query = query.filter(Dataset.id > pagination.decode_cursor(after, "datasets"))
+    
+    datasets = query.order_by(Dataset.id).offset(skip).limit(limit).all()
+    if len(datasets) == limit:
+        pagination.set_next_cursor(response, "datasets", datasets[-1].id)
+    if selected is not None:
+        return [dict(row._mapping) for row in datasets]
     return datasets
 
 
+@router.get("/grids/{grid_id}", response_model=WavelengthGridResponse)
+def get_wavelength_grid(grid_id: int, response: Response, db: Session = Depends(get_db)):
+    """共享波长轴，内容不可变，客户端可以按 id 永久缓存"""
+    grid = db.query(WavelengthGrid).filter(WavelengthGrid.id == grid_id).first()
+    if not grid:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Wavelength grid not found"
+        )
+    
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return {
+        "id": grid.id,
+        "content_hash": grid.content_hash,
+        "num_bands": grid.num_bands,
+        "wavelengths": wavelength_grids.load_grid(db, grid.id)
+    }
+
+
 @router.get("/{dataset_id}", response_model=DatasetDetailResponse)
-def get_dataset(dataset_id: int, db: Session = Depends(get_db)):
+def get_dataset(dataset_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     print(f"\n=== GET DATASET {dataset_id} ===")
     dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
     print(f"Dataset found: {dataset is not None}")
@@ -67,6 +131,28 @@ def get_dataset(dataset_id: int, db: Session = Depends(get_db)):
     print(f"Dataset owner_id: {dataset.owner_id}")
     print(f"Dataset category_id: {dataset.category_id}")
     
+    # 响应里带有计数、所有者和分类，任何一项变化后都要重新返回
+    categories = http_cache.categories_version(db)
+    
+    def etag() -> str:
+        owner = dataset.owner
+        return http_cache.weak_etag(
+            "dataset", dataset_id, dataset.updated_at or dataset.created_at,
+            dataset.view_count, dataset.download_count,
+            dataset.owner_id, (owner.updated_at or owner.created_at) if owner else None,
+            *categories
+        )
+    
+    # 客户端缓存的版本仍然有效时返回 304，不计浏览量（否则每次重新验证都会让缓存的浏览量过期）
+    not_modified = http_cache.conditional(request, response, etag(), None, http_cache.DATASET_DETAIL)
+    if not_modified is not None:
+        return not_modified
+    
+    # Increment view count（不改变 updated_at），ETag 对应计数后的响应
+    http_cache.increment_counter(db, dataset, Dataset.view_count)
+    db.commit()
+    response.headers["ETag"] = etag()
+    
     # 确保加载 owner 和 category 关系
     if dataset.owner:
         _ = dataset.owner.username  # 触发加载
@@ -75,9 +161,6 @@ def get_dataset(dataset_id: int, db: Session = Depends(get_db)):
         _ = dataset.category.name  # 触发加载
         print(f"Category loaded: {dataset.category.name}")
     
-    # Increment view count
-    dataset.view_count += 1
-    db.commit()
     print(f"Returning dataset {dataset_id}")
     
     return dataset
@@ -159,16 +242,27 @@ def delete_dataset(
             detail="Not enough permissions"
         )
     
+    orphan = file_blobs.release(db, dataset)
     db.delete(dataset)
     db.commit()
+    spectral_storage.delete_dataset_storage(dataset)
+    dataset_export.delete_exports(dataset.id)
+    file_blobs.remove_file(orphan)
     return None
 
 
-@router.get("/{dataset_id}/samples", response_model=List[SpectralSampleResponse])
+@router.get("/{dataset_id}/samples", response_model=Union[List[SpectralSampleResponse], SampleFieldsPage])
 def get_dataset_samples(
     dataset_id: int,
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated sample fields; the response becomes a page envelope with a shared wavelength axis"
+    ),
+    selection: Optional[BandSelection] = Depends(band_selection.band_query),
     db: Session = Depends(get_db)
 ):
     dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
@@ -178,22 +272,247 @@ def get_dataset_samples(
             detail="Dataset not found"
         )
     
-    samples = db.query(SpectralSample).filter(
-        SpectralSample.dataset_id == dataset_id
-    ).offset(skip).limit(limit).all()
+    # 游标绑定数据集和排序键，存储模式转换后旧游标失效
+    pagination.check_paging(skip, after)
+    scope = f"samples:{dataset.id}:{spectral_storage.sample_sort_key(dataset)}"
+    after_key = pagination.decode_cursor(after, scope) if after is not None else None
+    
+    # Accept 为二进制类型时直接由存储的数组编码，不经过 Pydantic
+    response.headers["Vary"] = "Accept"
+    media_type = sample_transport.negotiate(request.headers.get("accept"))
+    if media_type is not None:
+        if fields is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="fields only applies to JSON responses"
+            )
+        arrays, last_key = spectral_storage.read_sample_arrays(db, dataset, after_key, limit, skip, selection)
+        binary = Response(
+            content=sample_transport.encode(media_type, arrays, dataset.id),
+            media_type=media_type,
+            headers={"Vary": "Accept"}
+        )
+        pagination.set_next_cursor(binary, scope, last_key)
+        return binary
+    
+    selected = projection.parse_fields(fields, spectral_storage.SAMPLE_FIELDS)
+    if selected is not None:
+        page, last_key = spectral_storage.read_sample_fields(
+            db, dataset, selected, after_key, limit, skip, selection
+        )
+        pagination.set_next_cursor(response, scope, last_key)
+        return page
     
+    samples, last_key = spectral_storage.read_samples_after(db, dataset, after_key, limit, skip, selection)
+    pagination.set_next_cursor(response, scope, last_key)
     return samples
 
 
+def _stream_sample_arrays(
+    dataset_id: int, media_type: str, after_key: Optional[int], max_rows: Optional[int],
+    selection: Optional[BandSelection], **kwargs
+):
+    """批量响应的生成器；响应发送期间请求的 session 已经关闭，这里使用自己的 session"""
+    db = SessionLocal()
+    try:
+        dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+        batches = spectral_storage.iter_sample_arrays(
+            db, dataset, after_key, settings.SAMPLE_BULK_BATCH_ROWS, max_rows, selection
+        ) if dataset else iter(())
+        yield from sample_transport.stream(media_type, batches, dataset_id, **kwargs)
+    finally:
+        db.close()
+
+
+@router.get("/{dataset_id}/samples/bulk")
+def get_dataset_samples_bulk(
+    dataset_id: int,
+    request: Request,
+    after: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of /samples"),
+    limit: Optional[int] = Query(None, ge=1, description="At most this many samples; all by default"),
+    selection: Optional[BandSelection] = Depends(band_selection.band_query),
+    db: Session = Depends(get_db)
+):
+    """
+    一次请求流式返回数据集的全部样本（或 after 之后的 limit 个），格式按 Accept 协商：
+    application/x-npy 只支持共享一条波长轴的 columnar / mmap 数据集
+    """
+    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found"
+        )
+    
+    media_type = sample_transport.negotiate(request.headers.get("accept"))
+    if media_type is None:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail=f"Accept one of {', '.join(sample_transport.MEDIA_TYPES)}; use /samples for JSON"
+        )
+    sample_transport.check_available(media_type)
+    
+    scope = f"samples:{dataset.id}:{spectral_storage.sample_sort_key(dataset)}"
+    after_key = pagination.decode_cursor(after, scope) if after is not None else None
+    
+    # 稠密数据集的所有批次共享一条波长轴
+    dense = spectral_storage.is_dense(dataset)
+    options = {"dtype": spectral_storage.value_dtype(dataset)}
+    if dense:
+        axis = spectral_storage.get_axis(db, dataset)
+        options.update({"grid_id": dataset.wavelength_grid_id, "wavelengths": axis})
+        if selection is not None:
+            options.update({"grid_id": None, "wavelengths": band_selection.AxisSlicer(selection).axis(axis).tolist()})
+    if media_type == sample_transport.NPY:
+        if not dense:
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail=f"{sample_transport.NPY} needs a dataset on a single wavelength axis; "
+                       f"request {sample_transport.RAW} or {sample_transport.ARROW}"
+            )
+        # .npy 头部需要先给出行数，之后追加的样本不读取
+        num_rows = spectral_storage.count_samples_after(db, dataset, after_key)
+        limit = options["num_rows"] = num_rows if limit is None else min(num_rows, limit)
+    
+    return StreamingResponse(
+        _stream_sample_arrays(dataset.id, media_type, after_key, limit, selection, **options),
+        media_type=media_type,
+        headers={
+            "Vary": "Accept",
+            "Content-Disposition": f'attachment; filename="dataset_{dataset.id}_samples{sample_transport.FILE_EXTENSIONS[media_type]}"'
+        }
+    )
+
+
+@router.get("/{dataset_id}/storage", response_model=DatasetStorageReport)
+def get_dataset_storage(dataset_id: int, db: Session = Depends(get_db)):
+    """样本存储模式、编码器和压缩比"""
+    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found"
+        )
+    
+    return spectral_storage.storage_report(db, dataset)
+
+
+@router.get("/{dataset_id}/summary", response_model=DatasetSummary)
+def get_dataset_summary(dataset_id: int, db: Session = Depends(get_db)):
+    """逐波段均值、标准差、最小/最大值和各标签的均值曲线（导入时增量维护）"""
+    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found"
+        )
+    
+    result = band_stats.summary(db, dataset)
+    db.commit()  # 旧数据集第一次读取时重建的统计量
+    return result
+
+
+@router.get("/{dataset_id}/density", response_model=DatasetDensityResponse)
+def get_dataset_density(
+    dataset_id: int,
+    width: int = Query(density.DEFAULT_WIDTH, ge=1, le=density.MAX_SIZE, description="Wavelength bins"),
+    height: int = Query(density.DEFAULT_HEIGHT, ge=1, le=density.MAX_SIZE, description="Intensity bins"),
+    label: Optional[str] = Query(None, description="Only samples with this label"),
+    db: Session = Depends(get_db)
+):
+    """
+    全部样本的波长 x 强度二维直方图，用于概览图
+    结果按尺寸和标签缓存，追加样本后下次请求时重新计算
+    """
+    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found"
+        )
+    
+    result = density.get_density(db, dataset, density.clamp_width(db, dataset, width), height, label)
+    db.commit()
+    return density.to_response(dataset, result)
+
+
+@router.get("/{dataset_id}/samples/{sample_id}/lod", response_model=SampleLODResponse)
+def get_sample_lod(
+    dataset_id: int,
+    sample_id: int,
+    wl_min: Optional[float] = Query(None, description="Start of the visible wavelength range"),
+    wl_max: Optional[float] = Query(None, description="End of the visible wavelength range"),
+    pixels: int = Query(1000, ge=16, le=8192, description="Chart width in pixels"),
+    db: Session = Depends(get_db)
+):
+    """
+    缩放图表用的抽稀曲线：可见范围内最多约 2 x pixels 个点（每箱的最小值和最大值）
+    长光谱使用导入时保存的金字塔，只读取所需的层
+    """
+    if wl_min is not None and wl_max is not None and wl_min > wl_max:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="wl_min must not be greater than wl_max"
+        )
+    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found"
+        )
+    # 光谱列只在需要原始数据时才加载
+    sample = db.query(SpectralSample).options(
+        defer(SpectralSample.wavelengths), defer(SpectralSample.intensities)
+    ).filter(
+        SpectralSample.id == sample_id,
+        SpectralSample.dataset_id == dataset_id
+    ).first()
+    if not sample:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sample not found"
+        )
+    
+    return lod.sample_lod(db, dataset, sample, wl_min, wl_max, pixels)
+
+
+def _stream_export(dataset_id: int, selection: Optional[BandSelection], artifact: str):
+    """导出下载的生成器，使用自己的 session（同 _stream_sample_arrays）；同时写入导出文件缓存"""
+    db = SessionLocal()
+    try:
+        dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+        if dataset:
+            yield from dataset_export.stream(db, dataset, selection, artifact)
+    finally:
+        db.close()
+
+
+def _send_export(path: str, media_type: str, headers: Dict[str, str]) -> Response:
+    """配置了 EXPORT_ACCEL_REDIRECT 时交给 nginx 用 sendfile 发送（同时处理 Range），否则由 FileResponse 发送"""
+    if settings.EXPORT_ACCEL_REDIRECT:
+        return Response(
+            media_type=media_type,
+            headers={**headers, "X-Accel-Redirect": settings.EXPORT_ACCEL_REDIRECT + os.path.basename(path)}
+        )
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
 @router.get("/{dataset_id}/download")
 def download_dataset(
     dataset_id: int,
+    request: Request,
+    selection: Optional[BandSelection] = Depends(band_selection.band_query),
+    format: str = Query("csv", pattern="^(csv|parquet|npz)$", description="csv, parquet or npz"),
+    compression: str = Query("none", pattern="^(none|gzip|zstd)$", description="Compress the CSV: none, gzip or zstd"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
-    下载数据集为CSV格式
+    下载数据集为CSV格式（或 format=parquet / npz）
     如果数据集有样本数据，导出为CSV；否则返回原始文件路径
+    wl_min / wl_max / bands / step 只导出选中的波段，compression 返回 .csv.gz / .csv.zst
+    ETag 随数据版本变化，支持 If-None-Match 和 Range / If-Range 断点续传
+    导出文件按数据版本缓存，未变化的数据集再次下载时不读取样本
     需要用户登录
     """
     dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
@@ -203,49 +522,46 @@ def download_dataset(
             detail="Dataset not found"
         )
     
-    # 获取数据集的所有样本
-    samples = db.query(SpectralSample).filter(
-        SpectralSample.dataset_id == dataset_id
-    ).all()
-    
-    if samples:
-        # 导出样本数据为CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
+    artifact = dataset_export.artifact_for(format, compression)
+    path = dataset_export.export_path(dataset, selection, artifact)
+    cached = os.path.exists(path)
+    if cached or dataset_export.has_samples(db, dataset):
+        dataset_export.check_available(artifact)
+        media_type = dataset_export.ARTIFACTS[artifact]
+        etag = dataset_export.export_etag(dataset, selection, artifact)
+        if http_cache.etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
         
-        # 写入表头 (波长)
-        if samples[0].wavelengths:
-            header = ['sample_name', 'label'] + [str(w) for w in samples[0].wavelengths]
-            writer.writerow(header)
-        
-        # 写入每个样本的数据
-        for sample in samples:
-            row = [
-                sample.sample_name or f'sample_{sample.id}',
-                sample.sample_label or ''
-            ] + sample.intensities
-            writer.writerow(row)
-        
-        # 增加下载计数
-        dataset.download_count += 1
-        db.commit()
+        # 续传和分段请求不重复计数
+        partial = "range" in request.headers
+        if not partial:
+            http_cache.increment_counter(db, dataset, Dataset.download_count)
+            db.commit()
         
         # URL编码文件名以支持中文
-        encoded_filename = quote(f"{dataset.name}.csv")
+        encoded_filename = quote(f"{dataset.name}.{artifact}")
+        headers = {
+            'ETag': etag,
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': 'private, no-cache',
+            'Content-Disposition': f'attachment; filename*=UTF-8\'\'\'{encoded_filename}'
+        }
+        
+        # 已缓存、按字节范围请求或不能边生成边发送的格式：先生成文件再发送，FileResponse 处理 Range / If-Range
+        if cached or partial or artifact not in dataset_export.STREAMABLE:
+            path = dataset_export.materialize(db, dataset, selection, artifact)
+            return _send_export(path, media_type, headers)
         
-        # 返回CSV文件
-        output.seek(0)
+        # 第一次下载：边读取样本边发送，同时写入导出文件
         return StreamingResponse(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),  # 使用 UTF-8 BOM 以便 Excel 正确识别中文
-            media_type='text/csv',
-            headers={
-                'Content-Disposition': f'attachment; filename*=UTF-8\'\'\'{encoded_filename}'
-            }
+            _stream_export(dataset.id, selection, artifact),
+            media_type=media_type,
+            headers=headers
         )
     
     # 如果没有样本但有原始文件
     elif dataset.file_path:
-        dataset.download_count += 1
+        http_cache.increment_counter(db, dataset, Dataset.download_count)
         db.commit()
         
         return {
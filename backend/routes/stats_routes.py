@@ -1,24 +1,33 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from database import get_db
 from models import Dataset, SpectralSample, Category, User
 from schemas import DatasetStats
+import http_cache
 
 router = APIRouter(prefix="/api/stats", tags=["statistics"])
 
 
 @router.get("/", response_model=DatasetStats)
-def get_statistics(db: Session = Depends(get_db)):
-    # Total datasets
-    total_datasets = db.query(func.count(Dataset.id)).scalar()
+def get_statistics(request: Request, response: Response, db: Session = Depends(get_db)):
+    # Total datasets and downloads
+    total_datasets, datasets_updated, _, total_downloads = http_cache.datasets_version(db)
+    
+    # 数据集、分类和下载量都没有变化时不执行分组统计
+    categories = http_cache.categories_version(db)
+    not_modified = http_cache.conditional(
+        request, response,
+        http_cache.weak_etag("stats", total_datasets, datasets_updated, total_downloads, *categories),
+        None,  # 下载量没有修改时间，只用 ETag
+        http_cache.STATS
+    )
+    if not_modified is not None:
+        return not_modified
     
     # Total samples
     total_samples = db.query(func.sum(Dataset.num_samples)).scalar() or 0
     
-    # Total downloads
-    total_downloads = db.query(func.sum(Dataset.download_count)).scalar() or 0
-    
     # Datasets by category
     category_stats = db.query(
         Category.name,
@@ -1,17 +1,21 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, File, HTTPException, status, Form, Request, Header
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import Optional, List
 import os
-import json
-import shutil
-import csv
-import pandas as pd
-import numpy as np
 from datetime import datetime
 from database import get_db
-from models import Dataset, User, SpectralSample
+from models import Dataset, User, SpectralSample, IngestJob, UploadSession, UploadChunk, FileBlob
+from schemas import IngestJobResponse, UploadSessionCreate, UploadSessionResponse
 from auth import get_current_active_user
 from config import settings
+import ingest
+import ingest_jobs
+import upload_sessions
+import spectral_formats
+import file_blobs
+import dataset_export
 
 router = APIRouter(prefix="/api/upload", tags=["upload"])
 
@@ -21,89 +25,427 @@ def ensure_upload_dir():
         os.makedirs(settings.UPLOAD_DIR)
 
 
+def _check_upload_permission(dataset: Optional[Dataset], current_user: User):
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found"
+        )
+    
+    # Check ownership - 只有超级用户或管理员或数据集所有者可以上传
+    if dataset.owner_id != current_user.id and not current_user.is_superuser and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+
+
+def _file_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large. Maximum size is {settings.MAX_UPLOAD_SIZE} bytes"
+    )
+
+
+def _attach_dataset_file(
+    db: Session, dataset: Dataset, blob: FileBlob, file_size: int, filename: str, extract_samples: bool = False
+) -> tuple:
+    """
+    Point the dataset at a stored blob; instrument formats are also imported as samples
+    extract_samples: hand CSV and instrument-format files to a background ingest job instead
+    Returns (extra response fields, (kind, params) of a job to enqueue after commit or None,
+             path of a no longer referenced blob to delete after commit)
+    """
+    file_extension = os.path.splitext(filename)[1]
+    already_attached = dataset.file_blob_id == blob.id
+    orphan = file_blobs.attach(db, dataset, blob)
+    dataset.file_size = file_size
+    dataset.file_format = file_extension.lstrip('.')
+    file_path = file_blobs.blob_abspath(blob)
+    is_csv = file_extension.lower() == '.csv'
+    file_format = spectral_formats.detect_format(filename)
+    
+    # Count CSV records line by line instead of loading the file (cached per content)
+    if is_csv:
+        if blob.num_records is None:
+            try:
+                blob.num_records = ingest.count_csv_records(file_path)
+            except Exception as e:
+                print(f"Could not parse CSV: {e}")
+        if blob.num_records is not None:
+            dataset.num_samples = blob.num_records
+        if not extract_samples:
+            return {}, None, orphan
+    elif file_format is None:
+        return {}, None, orphan
+    
+    if already_attached and blob.import_info:
+        # Same content was already imported into this dataset
+        return {"samples_extracted": 0, "already_ingested": True, "parse_error": None}, None, orphan
+    
+    if extract_samples:
+        # The job reads the blob in place and holds a reference to it until it finishes
+        file_blobs.retain(db, blob.id)
+        params = {"keep_file": True, "blob_id": blob.id}
+        if is_csv:
+            return {}, (ingest_jobs.KIND_SAMPLES, params), orphan
+        params.update(format=file_format, filename=os.path.basename(filename))
+        return {}, (ingest_jobs.KIND_FORMAT, params), orphan
+    
+    # HDF5 / MATLAB / JCAMP-DX / SPC: read the spectra into sample storage
+    savepoint = db.begin_nested()
+    try:
+        imported = spectral_formats.import_file(
+            db, dataset, file_path, file_format, filename=os.path.basename(filename)
+        )
+        savepoint.commit()
+    except Exception as e:
+        savepoint.rollback()
+        print(f"Could not import {file_format} file: {e}")
+        return {"samples_extracted": 0, "parse_error": str(e)}, None, orphan
+    
+    blob.import_info = imported
+    dataset.num_samples = db.query(SpectralSample).filter(SpectralSample.dataset_id == dataset.id).count()
+    dataset.num_bands = imported["num_bands"]
+    return {"samples_extracted": imported["num_samples"], "parse_error": None}, None, orphan
+
+
+def _store_and_attach(
+    db: Session,
+    dataset: Dataset,
+    current_user: User,
+    source_path: str,
+    sha256: str,
+    file_size: int,
+    filename: str,
+    extract_samples: bool = False,
+    background_tasks: Optional[BackgroundTasks] = None
+) -> dict:
+    """Move a hashed upload into blob storage, attach it and commit"""
+    blob, created = file_blobs.store_file(db, source_path, sha256, file_size, os.path.splitext(filename)[1])
+    try:
+        extracted, pending_job, orphan = _attach_dataset_file(
+            db, dataset, blob, file_size, filename, extract_samples
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        if created:
+            file_blobs.remove_file(file_blobs.blob_abspath(blob))
+        raise
+    file_blobs.remove_file(orphan)
+    if background_tasks is not None and extracted.get("samples_extracted"):
+        # Rebuild the cached downloads of the previous version after the response
+        background_tasks.add_task(dataset_export.warm_dataset, dataset.id)
+    
+    if pending_job is not None:
+        kind, params = pending_job
+        job = ingest_jobs.enqueue_job(
+            db, dataset, current_user.id, kind, file_blobs.blob_abspath(blob), file_size, params
+        )
+        extracted = {"job_id": job.id, "status_url": f"/api/upload/jobs/{job.id}"}
+    db.refresh(dataset)
+    
+    return {
+        "message": "File uploaded successfully",
+        "file_path": dataset.file_path,
+        "file_size": file_size,
+        "sha256": sha256,
+        "deduplicated": not created,
+        "dataset_id": dataset.id,
+        **extracted
+    }
+
+
 @router.post("/dataset")
 async def upload_dataset(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     dataset_id: int = Form(...),
+    extract_samples: bool = Form(False),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
+    """
+    Upload the dataset's raw file
+    extract_samples=true also queues a background job that imports the samples from it
+    (CSV and HDF5 / MATLAB / JCAMP-DX / SPC files), see GET /api/upload/jobs/{job_id}
+    """
     # Get dataset
     dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
-    if not dataset:
+    _check_upload_permission(dataset, current_user)
+    
+    ensure_upload_dir()
+    
+    # Save file, hashing it and enforcing the size limit while copying
+    try:
+        temp_path, file_size, sha256 = await file_blobs.save_upload(file)
+    except ValueError:
+        raise _file_too_large()
+    
+    try:
+        return _store_and_attach(
+            db, dataset, current_user, temp_path, sha256, file_size, file.filename, extract_samples,
+            background_tasks
+        )
+    except Exception as e:
+        file_blobs.remove_file(temp_path)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Upload failed: {str(e)}"
+        )
+
+
+# ---------------------------------------------------------------------------
+# Resumable chunked uploads (see upload_sessions)
+# ---------------------------------------------------------------------------
+
+def _get_session(db: Session, session_id: int, current_user: User) -> UploadSession:
+    session = db.query(UploadSession).filter(UploadSession.id == session_id).first()
+    if not session:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Dataset not found"
+            detail="Upload session not found"
         )
-    
-    # Check ownership - 只有超级用户或管理员或数据集所有者可以上传
-    if dataset.owner_id != current_user.id and not current_user.is_superuser and not current_user.is_admin:
+    if session.owner_id != current_user.id and not current_user.is_superuser and not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
         )
+    return session
+
+
+def _require_open(session: UploadSession):
+    if session.status != upload_sessions.SESSION_OPEN:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload session is {session.status}"
+        )
+
+
+@router.post("/sessions", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+def create_upload_session(
+    data: UploadSessionCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Start a resumable upload of a dataset file.
+    The declared size is checked against MAX_UPLOAD_SIZE before any bytes are sent.
+    """
+    dataset = db.query(Dataset).filter(Dataset.id == data.dataset_id).first()
+    _check_upload_permission(dataset, current_user)
     
-    ensure_upload_dir()
+    # 顺便清理长期没有新分块的会话
+    upload_sessions.expire_sessions(db)
+    
+    if data.total_size > settings.MAX_UPLOAD_SIZE:
+        raise _file_too_large()
+    
+    chunk_size = data.chunk_size or settings.UPLOAD_CHUNK_SIZE
+    if chunk_size > settings.UPLOAD_CHUNK_SIZE_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"chunk_size must be at most {settings.UPLOAD_CHUNK_SIZE_MAX} bytes"
+        )
+    
+    session = UploadSession(
+        dataset_id=dataset.id,
+        owner_id=current_user.id,
+        filename=os.path.basename(data.filename),
+        total_size=data.total_size,
+        chunk_size=chunk_size,
+        num_chunks=upload_sessions.num_chunks(data.total_size, chunk_size),
+        sha256=upload_sessions.normalize_checksum(data.sha256),
+        status=upload_sessions.SESSION_OPEN,
+    )
+    db.add(session)
+    db.flush()
+    upload_sessions.create_partial_file(session)
+    db.commit()
+    db.refresh(session)
+    
+    return upload_sessions.session_status(session)
+
+
+@router.get("/sessions/{session_id}", response_model=UploadSessionResponse)
+def get_upload_session(
+    session_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Session state, including the chunks still missing (for resuming)"""
+    session = _get_session(db, session_id, current_user)
+    return upload_sessions.session_status(session)
+
+
+@router.put("/sessions/{session_id}/chunks/{chunk_index}")
+async def upload_chunk(
+    session_id: int,
+    chunk_index: int,
+    request: Request,
+    x_chunk_sha256: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload one chunk as the raw request body.
+    Chunks may be sent in any order and in parallel; a re-sent chunk replaces the
+    stored one only after its size and checksum have been verified.
+    X-Chunk-SHA256 (hex, optionally prefixed with 'sha256=') is verified when given.
+    """
+    session = _get_session(db, session_id, current_user)
+    _require_open(session)
+    
+    if chunk_index < 0 or chunk_index >= session.num_chunks:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"chunk_index must be between 0 and {session.num_chunks - 1}"
+        )
     
-    # Create unique filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"dataset_{dataset_id}_{timestamp}{file_extension}"
-    file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
+    # 释放数据库连接上的读事务，写文件期间不占用 SQLite 锁
+    db.commit()
     
-    # Save file
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        file_size = os.path.getsize(file_path)
-        
-        # Check file size
-        if file_size > settings.MAX_UPLOAD_SIZE:
-            os.remove(file_path)
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"File too large. Maximum size is {settings.MAX_UPLOAD_SIZE} bytes"
-            )
-        
-        # Update dataset
-        dataset.file_path = unique_filename
-        dataset.file_size = file_size
-        dataset.file_format = file_extension.lstrip('.')
-        
-        # Try to parse file and extract samples (for CSV format)
-        if file_extension.lower() == '.csv':
-            try:
-                with open(file_path, 'r') as f:
-                    reader = csv.reader(f)
-                    rows = list(reader)
-                    dataset.num_samples = len(rows) - 1  # Exclude header
-            except Exception as e:
-                print(f"Could not parse CSV: {e}")
-        
+        temp_path, size, checksum = await upload_sessions.receive_chunk(session, chunk_index, request.stream())
+    except upload_sessions.ChunkTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    
+    # 校验失败的重传只删除自己的临时文件，之前收到的分块保持不变
+    expected = upload_sessions.chunk_length(session, chunk_index)
+    if size != expected:
+        upload_sessions.discard_chunk(temp_path)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Chunk {chunk_index} must be {expected} bytes, received {size}"
+        )
+    
+    expected_checksum = upload_sessions.normalize_checksum(x_chunk_sha256)
+    if expected_checksum and expected_checksum != checksum:
+        upload_sessions.discard_chunk(temp_path)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Checksum mismatch for chunk {chunk_index}"
+        )
+    
+    # 复制期间分块记为缺失，复制中断时客户端会重传，不会留下与记录不符的数据
+    db.query(UploadChunk).filter(
+        UploadChunk.session_id == session.id,
+        UploadChunk.chunk_index == chunk_index
+    ).delete(synchronize_session=False)
+    db.commit()
+    upload_sessions.store_chunk(session, chunk_index, temp_path)
+    
+    db.add(UploadChunk(
+        session_id=session.id, chunk_index=chunk_index, size=size, sha256=checksum,
+        received_at=datetime.utcnow()
+    ))
+    try:
         db.commit()
-        db.refresh(dataset)
-        
-        return {
-            "message": "File uploaded successfully",
-            "file_path": unique_filename,
-            "file_size": file_size,
-            "dataset_id": dataset.id
-        }
+    except IntegrityError:
+        # The same chunk was re-sent in parallel and recorded first
+        db.rollback()
     
-    except Exception as e:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    return {"session_id": session.id, "chunk_index": chunk_index, "size": size, "sha256": checksum}
+
+
+@router.post("/sessions/{session_id}/complete")
+def complete_upload_session(
+    session_id: int,
+    background_tasks: BackgroundTasks,
+    extract_samples: bool = False,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Attach the assembled file to the dataset once every chunk has arrived
+    extract_samples=true queues the sample import as in upload_dataset
+    """
+    session = _get_session(db, session_id, current_user)
+    _require_open(session)
+    
+    missing = upload_sessions.missing_chunks(session)
+    if missing:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Upload failed: {str(e)}"
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Upload is incomplete", "missing_chunks": missing}
         )
+    
+    partial = upload_sessions.partial_path(session.id)
+    sha256 = upload_sessions.file_sha256(partial)
+    if session.sha256 and sha256 != session.sha256:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Checksum mismatch for the assembled file"
+        )
+    
+    dataset = db.query(Dataset).filter(Dataset.id == session.dataset_id).first()
+    _check_upload_permission(dataset, current_user)
+    
+    ensure_upload_dir()
+    session.status = upload_sessions.SESSION_COMPLETE
+    session.completed_at = datetime.utcnow()
+    # The partial file is moved into blob storage (or dropped if the content already exists)
+    return _store_and_attach(
+        db, dataset, current_user, partial, sha256, session.total_size, session.filename, extract_samples,
+        background_tasks
+    )
+
+
+@router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+def abort_upload_session(
+    session_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Abort an upload and delete the partial file"""
+    session = _get_session(db, session_id, current_user)
+    _require_open(session)
+    
+    session.status = upload_sessions.SESSION_ABORTED
+    db.commit()
+    upload_sessions.discard(session.id)
+    return None
+
+
+async def _enqueue_upload(
+    db: Session,
+    dataset: Dataset,
+    current_user: User,
+    file: UploadFile,
+    kind: str,
+    params: dict
+) -> JSONResponse:
+    """保存上传文件并创建后台导入任务，返回 202 和任务 id"""
+    try:
+        file_path, size = await ingest_jobs.save_upload(file)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    job = ingest_jobs.enqueue_job(db, dataset, current_user.id, kind, file_path, size, params)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "message": "Upload queued for background processing",
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/api/upload/jobs/{job.id}"
+        }
+    )
 
 
 @router.post("/samples/{dataset_id}")
 async def upload_samples_csv(
     dataset_id: int,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    codec: Optional[str] = Form(None),
+    background: bool = Form(False),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -111,6 +453,10 @@ async def upload_samples_csv(
     Upload spectral samples from CSV file.
     Expected format: columns are wavelengths, rows are samples
     First column can be 'sample_name' or 'label'
+    codec selects how intensities are stored (see spectral_codecs) on the
+    dataset's first upload
+    background=true stores the file and returns a job id immediately
+    (see GET /api/upload/jobs/{job_id})
     """
     dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
     if not dataset:
@@ -126,84 +472,17 @@ async def upload_samples_csv(
             detail="Not enough permissions"
         )
     
+    if background:
+        return await _enqueue_upload(
+            db, dataset, current_user, file, ingest_jobs.KIND_SAMPLES, {"codec": codec}
+        )
+    
     try:
-        # Read CSV using standard library
-        content = await file.read()
-        # Remove BOM if present
-        content_str = content.decode('utf-8-sig')  # utf-8-sig automatically removes BOM
-        lines = content_str.splitlines()
-        reader = csv.reader(lines)
-        rows = list(reader)
-        
-        if len(rows) < 2:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="CSV file must have at least header and one data row"
-            )
-        
-        header = rows[0]
-        data_rows = rows[1:]
-        
-        # Identify label/name column
-        label_col_idx = None
-        if 'sample_name' in header:
-            label_col_idx = header.index('sample_name')
-        elif 'label' in header:
-            label_col_idx = header.index('label')
-        elif 'name' in header:
-            label_col_idx = header.index('name')
-        
-        # Get wavelength columns
-        if label_col_idx is not None:
-            wavelength_cols = [i for i in range(len(header)) if i != label_col_idx]
-        else:
-            wavelength_cols = list(range(len(header)))
-        
-        # Convert wavelengths to float
-        try:
-            wavelengths = [float(header[i]) for i in wavelength_cols]
-            print(f"Successfully parsed {len(wavelengths)} wavelengths")
-            print(f"First wavelength: {wavelengths[0] if wavelengths else 'None'}")
-            print(f"Last wavelength: {wavelengths[-1] if wavelengths else 'None'}")
-        except Exception as e:
-            print(f"Error parsing wavelengths: {e}")
-            print(f"Problem header value: {header}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Column headers (except label columns) must be numeric wavelengths. Error: {str(e)}"
-            )
-        
-        # Create samples
-        samples_created = 0
-        for idx, row in enumerate(data_rows):
-            if label_col_idx is not None:
-                sample_name = row[label_col_idx]
-                intensities = [float(row[i]) for i in wavelength_cols]
-            else:
-                sample_name = f"sample_{idx}"
-                intensities = [float(val) for val in row]
-            
-            sample = SpectralSample(
-                dataset_id=dataset_id,
-                sample_name=sample_name,
-                sample_label=sample_name if label_col_idx is not None else None,
-                wavelengths=wavelengths,
-                intensities=intensities
-            )
-            db.add(sample)
-            samples_created += 1
-        
-        # Update dataset
-        dataset.num_samples = samples_created
-        dataset.num_bands = len(wavelengths)
-        
+        # Stream and parse the CSV in bounded batches
+        result = await ingest.ingest_samples_csv(db, dataset, file, codec)
         db.commit()
-        
-        return {
-            "message": f"Successfully uploaded {samples_created} samples",
-            "num_samples": samples_created,
-            "num_bands": len(wavelengths)
-        }
+        background_tasks.add_task(dataset_export.warm_dataset, dataset.id)
+        return result
     
     except Exception as e:
         raise HTTPException(
@@ -215,14 +494,18 @@ async def upload_samples_csv(
 @router.post("/labeled/{dataset_id}")
 async def upload_labeled_file(
     dataset_id: int,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     label: str = Form(...),
+    codec: Optional[str] = Form(None),
+    background: bool = Form(False),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
     Upload CSV file with samples labeled with a specific label.
     All samples in this file will be assigned the given label.
+    background=true stores the file and returns a job id immediately
     """
     dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
     if not dataset:
@@ -238,73 +521,76 @@ async def upload_labeled_file(
             detail="Not enough permissions"
         )
     
+    if background:
+        return await _enqueue_upload(
+            db, dataset, current_user, file, ingest_jobs.KIND_LABELED,
+            {"label": label, "codec": codec}
+        )
+    
     try:
-        # Read CSV
-        content = await file.read()
-        # Remove BOM if present
-        content_str = content.decode('utf-8-sig')  # utf-8-sig automatically removes BOM
-        lines = content_str.splitlines()
-        reader = csv.reader(lines)
-        rows = list(reader)
-        
-        if len(rows) < 2:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="CSV file must have at least header and one data row"
-            )
-        
-        header = rows[0]
-        data_rows = rows[1:]
-        
-        # Assume all columns are wavelengths (no sample_name column)
-        try:
-            wavelengths = [float(h) for h in header]
-        except:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="All column headers must be numeric wavelengths"
-            )
-        
-        # Create samples
-        samples_created = 0
-        for idx, row in enumerate(data_rows):
-            try:
-                intensities = [float(val) for val in row]
-                
-                if len(intensities) != len(wavelengths):
-                    continue  # Skip invalid rows
-                
-                sample = SpectralSample(
-                    dataset_id=dataset_id,
-                    sample_name=f"{label}_{idx+1}",
-                    sample_label=label,
-                    wavelengths=wavelengths,
-                    intensities=intensities
-                )
-                db.add(sample)
-                samples_created += 1
-            except Exception as e:
-                print(f"Skipping row {idx}: {e}")
-                continue
-        
-        # Update dataset statistics
-        total_samples = db.query(SpectralSample).filter(
-            SpectralSample.dataset_id == dataset_id
-        ).count()
-        dataset.num_samples = total_samples
-        dataset.num_bands = len(wavelengths)
-        
+        # Stream and parse the CSV in bounded batches
+        result = await ingest.ingest_labeled_csv(db, dataset, file, label, codec)
         db.commit()
-        
-        return {
-            "message": f"Successfully uploaded {samples_created} samples with label '{label}'",
-            "num_samples": samples_created,
-            "label": label,
-            "total_dataset_samples": total_samples
-        }
+        background_tasks.add_task(dataset_export.warm_dataset, dataset.id)
+        return result
     
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Failed to process labeled file: {str(e)}"
         )
+
+
+@router.post("/labeled-batch/{dataset_id}")
+async def upload_labeled_batch(
+    dataset_id: int,
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    labels: List[str] = Form(...),
+    codec: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload many CSV files in one request, labels[i] applying to files[i].
+    Files are parsed in parallel and all samples are written in one transaction;
+    if any file fails nothing is stored.
+    """
+    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    _check_upload_permission(dataset, current_user)
+    
+    try:
+        result = await ingest.ingest_labeled_batch(db, dataset, files, labels, codec)
+        db.commit()
+        background_tasks.add_task(dataset_export.warm_dataset, dataset.id)
+        return result
+    
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to process labeled files: {str(e)}"
+        )
+
+
+@router.get("/jobs/{job_id}", response_model=IngestJobResponse)
+def get_ingest_job(
+    job_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """后台导入任务的状态、进度和吞吐量"""
+    job = db.query(IngestJob).filter(IngestJob.id == job_id).first()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ingest job not found"
+        )
+    
+    if job.owner_id != current_user.id and not current_user.is_superuser and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    
+    return ingest_jobs.job_status(job)
@@ -0,0 +1,297 @@
+"""
+样本的二进制传输格式，按 Accept 头协商
+application/x-npy                    稠密页的强度矩阵 (.npy)，dtype 与存储一致，np.load 读取
+application/vnd.apache.arrow.stream  Arrow IPC 流：id / sample_name / sample_label / intensities 列（需要 pyarrow），
+                                     强度类型与存储一致
+application/x-spectra-f32            长度前缀 JSON 头 + 小端 float32 数据：
+
+    uint32 LE   头部长度 h
+    h 字节      UTF-8 JSON 头（用空格补齐，数据从 8 字节对齐的位置开始）
+    float32 LE  强度：稠密页为 count x bands 矩阵，不等长页为所有样本拼接，第 i 行为 [offsets[i], offsets[i+1])
+    float64 LE  仅不等长页：与强度对齐的波长
+
+    客户端零拷贝读取：np.frombuffer(buf, "<f4", count=n, offset=4 + h)
+    批量接口返回多个这样的帧首尾相接，JSON 头的 data_bytes 是帧数据部分的长度
+
+所有格式都直接由存储中的数组编码，不经过 Pydantic，也不生成逐个浮点数的 Python 对象；
+只有 x-spectra-f32 固定转换为 float32
+"""
+from typing import Iterable, Iterator, List, Optional
+import io
+import json
+import struct
+import numpy as np
+from fastapi import HTTPException, status
+from spectral_storage import SampleArrays
+
+NPY = "application/x-npy"
+ARROW = "application/vnd.apache.arrow.stream"
+RAW = "application/x-spectra-f32"
+MEDIA_TYPES = (NPY, ARROW, RAW)
+
+_ALIASES = {
+    "application/octet-stream": RAW,
+    "application/vnd.apache.arrow.file": ARROW,
+}
+_JSON_TYPES = ("application/json", "application/*", "*/*")
+
+FILE_EXTENSIONS = {NPY: ".npy", ARROW: ".arrows", RAW: ".f32"}
+ARROW_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+FLOAT32 = np.dtype("<f4")
+FLOAT64 = np.dtype("<f8")
+
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """
+    返回 Accept 头中优先级最高的二进制类型；JSON 或通配符优先级更高、或根本没有二进制类型时返回 None
+    q 值相同时按出现顺序，*/* 让位于明确列出的二进制类型
+    """
+    if not accept:
+        return None
+    best, best_q = None, 0.0
+    json_q, json_first = 0.0, False
+    for part in accept.split(","):
+        media, _, params = part.partition(";")
+        media = media.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        media = _ALIASES.get(media, media)
+        if media in MEDIA_TYPES and q > best_q:
+            best, best_q = media, q
+        elif media in _JSON_TYPES and q > json_q:
+            json_q = q
+            json_first = media == "application/json" and best is None
+    if best is None or best_q < json_q or (best_q == json_q and json_first):
+        return None
+    return best
+
+
+def _not_acceptable(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=detail)
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        raise _not_acceptable("Arrow responses require the 'pyarrow' package on the server")
+    return pyarrow
+
+
+# ---------------------------------------------------------------------------
+# .npy
+# ---------------------------------------------------------------------------
+
+def _little_endian(dtype) -> np.dtype:
+    return np.dtype(dtype).newbyteorder("<")
+
+
+def npy_header(num_rows: int, num_bands: int, dtype) -> bytes:
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        buffer, {"descr": _little_endian(dtype).str, "fortran_order": False, "shape": (num_rows, num_bands)}
+    )
+    return buffer.getvalue()
+
+
+def encode_npy(arrays: SampleArrays) -> bytes:
+    if not arrays.dense:
+        raise _not_acceptable(
+            "Samples on this page use different wavelength axes; request "
+            f"{RAW} or {ARROW} instead of {NPY}"
+        )
+    matrix = np.ascontiguousarray(arrays.matrix, dtype=_little_endian(arrays.matrix.dtype))
+    return npy_header(*matrix.shape, matrix.dtype) + matrix.tobytes()
+
+
+# ---------------------------------------------------------------------------
+# 长度前缀 JSON 头 + float32
+# ---------------------------------------------------------------------------
+
+def _frame_header(header: dict) -> bytes:
+    data = json.dumps(header, separators=(",", ":")).encode()
+    data += b" " * (-(4 + len(data)) % 8)
+    return struct.pack("<I", len(data)) + data
+
+
+def encode_raw(arrays: SampleArrays, dataset_id: int) -> bytes:
+    header = {
+        "dataset_id": dataset_id,
+        "count": len(arrays.ids),
+        "dtype": FLOAT32.str,
+        "ids": arrays.ids.tolist(),
+        "sample_names": arrays.names,
+        "sample_labels": arrays.labels,
+    }
+    if arrays.dense:
+        values = np.ascontiguousarray(arrays.matrix, dtype=FLOAT32).tobytes()
+        header.update({
+            "shape": list(arrays.matrix.shape),
+            "wavelength_grid_id": arrays.grid_id,
+            "wavelengths": arrays.wavelengths.tolist(),
+            "data_bytes": len(values),
+        })
+        return _frame_header(header) + values
+
+    values = np.ascontiguousarray(arrays.values, dtype=FLOAT32).tobytes()
+    padding = b"\0" * (-len(values) % 8)
+    wavelengths = np.ascontiguousarray(arrays.row_wavelengths, dtype=FLOAT64).tobytes()
+    header.update({
+        "shape": None,
+        "offsets": arrays.offsets.tolist(),
+        "wavelength_grid_ids": arrays.row_grid_ids,
+        "wavelengths_dtype": FLOAT64.str,
+        "wavelengths_offset": len(values) + len(padding),
+        "data_bytes": len(values) + len(padding) + len(wavelengths),
+    })
+    return _frame_header(header) + values + padding + wavelengths
+
+
+# ---------------------------------------------------------------------------
+# Arrow IPC
+# ---------------------------------------------------------------------------
+
+def arrow_schema(pa, dataset_id: int, num_bands: Optional[int], grid_id=None, wavelengths=None, value_type=None):
+    """num_bands 为 None 时是不等长布局：intensities / wavelengths 为变长列表；强度默认为 float64"""
+    value_type = value_type or pa.float64()
+    fields = [
+        pa.field("id", pa.int64()),
+        pa.field("sample_name", pa.string()),
+        pa.field("sample_label", pa.string()),
+    ]
+    metadata = {"dataset_id": str(dataset_id)}
+    if num_bands is not None:
+        fields.append(pa.field("intensities", pa.list_(value_type, num_bands)))
+        metadata["wavelength_grid_id"] = json.dumps(grid_id)
+        metadata["wavelengths"] = json.dumps(wavelengths)
+    else:
+        fields += [
+            pa.field("intensities", pa.list_(value_type)),
+            pa.field("wavelength_grid_id", pa.int64()),
+            pa.field("wavelengths", pa.list_(pa.float64())),
+        ]
+    return pa.schema(fields, metadata=metadata)
+
+
+def as_ragged(arrays: SampleArrays) -> SampleArrays:
+    """稠密页改写为不等长布局（用于整体按不等长 schema 输出的批量流）"""
+    if not arrays.dense:
+        return arrays
+    num_rows, num_bands = arrays.matrix.shape
+    return arrays._replace(
+        matrix=None,
+        offsets=np.arange(num_rows + 1, dtype=np.int64) * num_bands,
+        values=arrays.matrix.reshape(-1),
+        row_grid_ids=[arrays.grid_id] * num_rows,
+        row_wavelengths=np.tile(arrays.wavelengths, num_rows),
+    )
+
+
+def arrow_batch(pa, schema, arrays: SampleArrays):
+    intensities = schema.field("intensities").type
+    dtype = np.dtype(intensities.value_type.to_pandas_dtype()).newbyteorder("<")
+    columns = [
+        pa.array(arrays.ids, pa.int64()),
+        pa.array(arrays.names, pa.string()),
+        pa.array(arrays.labels, pa.string()),
+    ]
+    if pa.types.is_fixed_size_list(intensities):
+        values = pa.array(np.ascontiguousarray(arrays.matrix, dtype=dtype).reshape(-1))
+        columns.append(pa.FixedSizeListArray.from_arrays(values, arrays.matrix.shape[1]))
+    else:
+        arrays = as_ragged(arrays)
+        offsets = pa.array(arrays.offsets.astype(np.int32))
+        columns += [
+            pa.ListArray.from_arrays(offsets, pa.array(arrays.values.astype(dtype, copy=False))),
+            pa.array(arrays.row_grid_ids, pa.int64()),
+            pa.ListArray.from_arrays(offsets, pa.array(arrays.row_wavelengths.astype(FLOAT64, copy=False))),
+        ]
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def encode_arrow(arrays: SampleArrays, dataset_id: int) -> bytes:
+    pa = require_pyarrow()
+    if arrays.dense:
+        value_type = pa.from_numpy_dtype(arrays.matrix.dtype)
+        schema = arrow_schema(
+            pa, dataset_id, arrays.matrix.shape[1], arrays.grid_id, arrays.wavelengths.tolist(), value_type
+        )
+    else:
+        schema = arrow_schema(pa, dataset_id, None, value_type=pa.from_numpy_dtype(arrays.values.dtype))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(arrow_batch(pa, schema, arrays))
+    return sink.getvalue().to_pybytes()
+
+
+def check_available(media_type: str):
+    """在开始发送响应之前检查可选依赖"""
+    if media_type == ARROW:
+        require_pyarrow()
+
+
+def encode(media_type: str, arrays: SampleArrays, dataset_id: int) -> bytes:
+    if media_type == NPY:
+        return encode_npy(arrays)
+    if media_type == ARROW:
+        return encode_arrow(arrays, dataset_id)
+    return encode_raw(arrays, dataset_id)
+
+
+# ---------------------------------------------------------------------------
+# 批量流
+# ---------------------------------------------------------------------------
+
+def stream(
+    media_type: str,
+    batches: Iterable[SampleArrays],
+    dataset_id: int,
+    num_rows: Optional[int] = None,
+    grid_id: Optional[int] = None,
+    wavelengths: Optional[List[float]] = None,
+    dtype=FLOAT64,
+) -> Iterator[bytes]:
+    """
+    批量接口的响应体，wavelengths 给定时表示所有批次共享这条轴（稠密数据集）
+    dtype 为存储读出的强度 dtype（spectral_storage.value_dtype），npy 和 Arrow 按它输出
+    npy 要求稠密并预先给出行数 num_rows；Arrow 对稠密数据集使用定长列表 schema，
+    否则使用不等长 schema；x-spectra-f32 为逐批的帧
+    """
+    dtype = _little_endian(dtype)
+    if media_type == NPY:
+        yield npy_header(num_rows, len(wavelengths), dtype)
+        written = 0
+        for arrays in batches:
+            matrix = arrays.matrix[:num_rows - written]
+            written += len(matrix)
+            yield np.ascontiguousarray(matrix, dtype=dtype).tobytes()
+            if written >= num_rows:
+                break
+        if written < num_rows:
+            # 头部已经声明了行数，不能用编造的数据补齐；中断响应，客户端收到不完整的响应体
+            raise RuntimeError(f"Dataset {dataset_id} lost samples while streaming ({written} of {num_rows} rows sent)")
+        return
+
+    if media_type == ARROW:
+        pa = require_pyarrow()
+        if wavelengths is not None:
+            schema = arrow_schema(pa, dataset_id, len(wavelengths), grid_id, wavelengths, pa.from_numpy_dtype(dtype))
+        else:
+            schema = arrow_schema(pa, dataset_id, None)
+        # IPC 流 = schema 消息 + 逐批的 record batch 消息 + 结束标记
+        yield schema.serialize().to_pybytes()
+        for arrays in batches:
+            yield arrow_batch(pa, schema, arrays).serialize().to_pybytes()
+        yield ARROW_EOS
+        return
+
+    for arrays in batches:
+        yield encode_raw(arrays, dataset_id)
@@ -131,12 +131,126 @@ class SpectralSampleCreate(SpectralSampleBase):
 class SpectralSampleResponse(SpectralSampleBase):
     id: int
     dataset_id: int
+    wavelength_grid_id: Optional[int] = None
     created_at: datetime
     
     class Config:
         from_attributes = True
 
 
+class SampleFieldsPage(BaseModel):
+    """?fields= 投影后的一页样本；整页共享波长轴时 wavelengths 只在这里出现一次"""
+    dataset_id: int
+    fields: List[str]
+    wavelength_grid_id: Optional[int] = None
+    wavelengths: Optional[List[float]] = None
+    samples: List[Dict[str, Any]]
+
+
+class WavelengthGridResponse(BaseModel):
+    id: int
+    content_hash: str
+    num_bands: int
+    wavelengths: List[float]
+
+
+class DatasetStorageReport(BaseModel):
+    dataset_id: int
+    storage_mode: str
+    storage_dtype: Optional[str] = None
+    codec: Optional[str] = None
+    raw_bytes: int
+    stored_bytes: int
+    compression_ratio: Optional[float] = None
+
+
+class LabelSummary(BaseModel):
+    label: Optional[str] = None
+    num_samples: int
+    mean: List[Optional[float]]
+
+
+class DatasetSummary(BaseModel):
+    dataset_id: int
+    num_samples: int
+    excluded_samples: int
+    wavelengths: List[float]
+    count: List[int]
+    mean: List[Optional[float]]
+    std: List[Optional[float]]
+    min: List[Optional[float]]
+    max: List[Optional[float]]
+    labels_tracked: bool  # False when the dataset has more than BAND_STATS_MAX_LABELS labels
+    labels: List[LabelSummary]
+
+
+class DatasetDensityResponse(BaseModel):
+    dataset_id: int
+    width: int
+    height: int
+    label: Optional[str] = None
+    num_samples: int
+    wavelength_min: Optional[float] = None
+    wavelength_max: Optional[float] = None
+    intensity_min: Optional[float] = None
+    intensity_max: Optional[float] = None
+    max_count: int
+    counts: List[List[int]]  # height rows x width columns, row 0 = lowest intensity
+
+
+class SampleLODResponse(BaseModel):
+    dataset_id: int
+    sample_id: int
+    level: int  # 0 = raw points
+    bin_size: int  # original points per bin, 2^level
+    total_points: int  # original points in the visible range
+    wavelengths: List[float]
+    intensities: List[Optional[float]]
+
+
+class IngestJobResponse(BaseModel):
+    id: int
+    dataset_id: int
+    kind: str
+    status: str
+    total_bytes: int
+    bytes_read: int
+    rows_parsed: int
+    rows_inserted: int
+    rows_skipped: int
+    elapsed_seconds: Optional[float] = None
+    bytes_per_second: Optional[int] = None
+    rows_per_second: Optional[int] = None
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class UploadSessionCreate(BaseModel):
+    dataset_id: int
+    filename: str = Field(..., min_length=1, max_length=255)
+    total_size: int = Field(..., ge=0)
+    chunk_size: Optional[int] = Field(None, gt=0)
+    sha256: Optional[str] = None
+
+
+class UploadSessionResponse(BaseModel):
+    id: int
+    dataset_id: int
+    filename: str
+    total_size: int
+    chunk_size: int
+    num_chunks: int
+    status: str
+    received_chunks: int
+    received_bytes: int
+    missing_chunks: List[int]
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+
 # Search and Filter
 class DatasetFilter(BaseModel):
     search: Optional[str] = None
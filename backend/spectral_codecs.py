@@ -0,0 +1,98 @@
+"""
+光谱强度矩阵的编码器
+raw:          按存储 dtype 直接打包
+shuffle-zlib: 按字节位置重排后 zlib 压缩（无损）
+delta-lzma:   对浮点数的位模式做波段方向差分后 lzma 压缩（无损）
+float16:      量化为半精度浮点（有损，适合预览）
+int16:        按块最小值/步长缩放为 16 位整数（有损，适合预览）
+"""
+import lzma
+import zlib
+import numpy as np
+
+RAW = "raw"
+SHUFFLE_ZLIB = "shuffle-zlib"
+DELTA_LZMA = "delta-lzma"
+FLOAT16 = "float16"
+INT16 = "int16"
+
+CODECS = (RAW, SHUFFLE_ZLIB, DELTA_LZMA, FLOAT16, INT16)
+LOSSY_CODECS = (FLOAT16, INT16)
+
+# 位模式差分使用与浮点宽度相同的无符号整数，溢出回绕保证可逆
+_UINT_VIEWS = {4: np.dtype("<u4"), 8: np.dtype("<u8")}
+
+# int16 中保留 -32768 表示 NaN
+_INT16_NAN = -32768
+_INT16_STEPS = 65534
+
+
+def validate_codec(codec: str) -> str:
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec '{codec}', expected one of: {', '.join(CODECS)}")
+    return codec
+
+
+def _shuffle(data: bytes, itemsize: int) -> bytes:
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, itemsize).T.tobytes()
+
+
+def _unshuffle(data: bytes, itemsize: int) -> bytes:
+    return np.frombuffer(data, dtype=np.uint8).reshape(itemsize, -1).T.tobytes()
+
+
+def encode(matrix: np.ndarray, codec: str, dtype: np.dtype) -> bytes:
+    """把 n x bands 的矩阵编码为字节串，dtype 为无损编码使用的存储精度"""
+    matrix = np.ascontiguousarray(matrix, dtype=dtype)
+
+    if codec == RAW:
+        return matrix.tobytes()
+
+    if codec == SHUFFLE_ZLIB:
+        return zlib.compress(_shuffle(matrix.tobytes(), dtype.itemsize), 6)
+
+    if codec == DELTA_LZMA:
+        bits = matrix.view(_UINT_VIEWS[dtype.itemsize])
+        delta = np.diff(bits, axis=1, prepend=np.zeros((bits.shape[0], 1), dtype=bits.dtype))
+        return lzma.compress(delta.tobytes(), preset=6)
+
+    if codec == FLOAT16:
+        return matrix.astype("<f2").tobytes()
+
+    if codec == INT16:
+        finite = matrix[np.isfinite(matrix)]
+        low = float(finite.min()) if finite.size else 0.0
+        high = float(finite.max()) if finite.size else 0.0
+        scale = (high - low) / _INT16_STEPS if high > low else 1.0
+        quantized = np.round((matrix - low) / scale) - 32767
+        quantized = np.where(np.isfinite(matrix), quantized, _INT16_NAN).astype("<i2")
+        return np.array([low, scale], dtype="<f8").tobytes() + quantized.tobytes()
+
+    raise ValueError(f"Unknown codec '{codec}'")
+
+
+def decode(data: bytes, codec: str, dtype: np.dtype, num_rows: int, num_bands: int) -> np.ndarray:
+    """encode 的逆过程，返回只读的 n x bands 矩阵"""
+    shape = (num_rows, num_bands)
+
+    if codec == RAW:
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
+
+    if codec == SHUFFLE_ZLIB:
+        raw = _unshuffle(zlib.decompress(data), dtype.itemsize)
+        return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+    if codec == DELTA_LZMA:
+        delta = np.frombuffer(lzma.decompress(data), dtype=_UINT_VIEWS[dtype.itemsize]).reshape(shape)
+        return np.cumsum(delta, axis=1, dtype=delta.dtype).view(dtype)
+
+    if codec == FLOAT16:
+        return np.frombuffer(data, dtype="<f2").reshape(shape)
+
+    if codec == INT16:
+        low, scale = np.frombuffer(data[:16], dtype="<f8")
+        quantized = np.frombuffer(data[16:], dtype="<i2").reshape(shape)
+        values = (quantized.astype(np.float64) + 32767) * scale + low
+        return np.where(quantized == _INT16_NAN, np.nan, values)
+
+    raise ValueError(f"Unknown codec '{codec}'")
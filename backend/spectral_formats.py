@@ -0,0 +1,637 @@
+"""
+仪器原生格式的光谱读取
+hdf5:   h5py，按行块切片读取 2D 数据集
+mat:    v5 使用 scipy.io（按变量加载），v7.3 本身是 HDF5，使用 h5py 按块读取
+jcamp:  JCAMP-DX 4.24 / 5.x 纯 Python 解析，支持 AFFN / ASDF (SQZ, DIF, DUP) 压缩和多块文件
+spc:    Galactic SPC 新格式（小端和大端），逐个子文件读取
+
+每个读取器产出 SpectraBlock：一条波长轴和若干共享这条轴的光谱，
+import_file 把它们按 INGEST_BATCH_ROWS 攒批写入 spectral_storage；
+轴相同的批次写成稠密矩阵，不同的写成不等长样本
+h5py / scipy 只在读取对应格式时导入
+"""
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+import os
+import re
+import struct
+import numpy as np
+from sqlalchemy.orm import Session
+from config import settings
+from models import Dataset
+import spectral_storage
+
+FORMAT_HDF5 = "hdf5"
+FORMAT_MAT = "mat"
+FORMAT_JCAMP = "jcamp"
+FORMAT_SPC = "spc"
+
+FORMAT_EXTENSIONS = {
+    ".h5": FORMAT_HDF5,
+    ".hdf5": FORMAT_HDF5,
+    ".hdf": FORMAT_HDF5,
+    ".he5": FORMAT_HDF5,
+    ".mat": FORMAT_MAT,
+    ".jdx": FORMAT_JCAMP,
+    ".dx": FORMAT_JCAMP,
+    ".jcamp": FORMAT_JCAMP,
+    ".jcm": FORMAT_JCAMP,
+    ".spc": FORMAT_SPC,
+}
+
+
+class SpectraBlock(NamedTuple):
+    wavelengths: np.ndarray  # 1D axis shared by every row
+    intensities: np.ndarray  # n x len(wavelengths)
+    names: List[str]
+    labels: List[Optional[str]]
+
+
+def detect_format(filename: str) -> Optional[str]:
+    return FORMAT_EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+
+
+def _require(module: str, fmt: str):
+    """按需导入可选依赖"""
+    try:
+        return __import__(module)
+    except ImportError:
+        raise ValueError(f"Reading {fmt} files requires the '{module}' package")
+
+
+def _batch_rows() -> int:
+    return max(1, settings.INGEST_BATCH_ROWS)
+
+
+# ---------------------------------------------------------------------------
+# 变量选择：在文件里找光谱矩阵、波长轴、标签和样本名
+# ---------------------------------------------------------------------------
+
+SPECTRA_NAMES = ("spectra", "spectrum", "intensities", "intensity", "reflectance", "absorbance",
+                 "transmittance", "data", "x")
+AXIS_NAMES = ("wavelengths", "wavelength", "wavenumbers", "wavenumber", "wl", "wave", "bands",
+              "axis", "x_axis", "xaxis")
+LABEL_NAMES = ("labels", "label", "y", "class", "classes", "target", "targets", "category")
+SAMPLE_NAME_NAMES = ("sample_names", "sample_name", "names", "name", "ids", "sample_ids")
+
+
+class _Variable(NamedTuple):
+    name: str  # full path / variable name
+    shape: Tuple[int, ...]
+    numeric: bool
+
+
+class _Layout(NamedTuple):
+    spectra: str
+    rows_first: bool  # True: spectra[i, :] is sample i
+    num_rows: int
+    num_bands: int
+    axis: Optional[str]
+    labels: Optional[str]
+    names: Optional[str]
+
+
+def _leaf(name: str) -> str:
+    return name.rstrip("/").rsplit("/", 1)[-1].lower()
+
+
+def _by_name(variables: Sequence[_Variable], wanted: Sequence[str]) -> List[_Variable]:
+    found = [v for v in variables if _leaf(v.name) in wanted]
+    return sorted(found, key=lambda v: wanted.index(_leaf(v.name)))
+
+
+def _vector_length(shape: Tuple[int, ...]) -> Optional[int]:
+    """1D 数组或 1xN / Nx1 矩阵的长度"""
+    dims = [d for d in shape if d != 1]
+    if len(dims) == 1:
+        return dims[0]
+    if len(shape) >= 1 and all(d == 1 for d in shape):
+        return 1
+    return None
+
+
+def _choose_layout(variables: Sequence[_Variable], column_major: bool = False) -> _Layout:
+    """
+    column_major: MATLAB v7.3 通过 h5py 看到的形状与 MATLAB 中相反，
+    没有波长轴可参考时默认每一列是一个样本
+    """
+    matrices = [v for v in variables if v.numeric and len(v.shape) == 2 and min(v.shape) > 1]
+    if not matrices:
+        raise ValueError("No 2D numeric spectra matrix found in the file")
+    named = _by_name(matrices, SPECTRA_NAMES)
+    spectra = named[0] if named else max(matrices, key=lambda v: v.shape[0] * v.shape[1])
+
+    vectors = [v for v in variables if v is not spectra and _vector_length(v.shape)]
+    numeric_vectors = [v for v in vectors if v.numeric]
+
+    axis = None
+    for candidate in _by_name(numeric_vectors, AXIS_NAMES) + numeric_vectors:
+        if _vector_length(candidate.shape) in spectra.shape and _leaf(candidate.name) not in LABEL_NAMES:
+            axis = candidate
+            break
+
+    if axis is not None:
+        bands = _vector_length(axis.shape)
+        if spectra.shape[1] == bands and (spectra.shape[0] != bands or not column_major):
+            rows_first = True
+        else:
+            rows_first = False
+    else:
+        rows_first = not column_major
+    num_rows, num_bands = spectra.shape if rows_first else spectra.shape[::-1]
+
+    def per_row(names):
+        for candidate in _by_name(vectors, names):
+            if candidate is not axis and _vector_length(candidate.shape) == num_rows:
+                return candidate.name
+        return None
+
+    return _Layout(
+        spectra=spectra.name,
+        rows_first=rows_first,
+        num_rows=num_rows,
+        num_bands=num_bands,
+        axis=axis.name if axis is not None else None,
+        labels=per_row(LABEL_NAMES),
+        names=per_row(SAMPLE_NAME_NAMES),
+    )
+
+
+def _default_axis(num_bands: int, filename: str) -> np.ndarray:
+    print(f"⚠️  {filename}: no wavelength axis found, using band indices")
+    return np.arange(num_bands, dtype=np.float64)
+
+
+def _as_text(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace").strip("\x00 ")
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind in "US":
+            return "".join(_as_text(v) for v in value.ravel())
+        if value.dtype.kind == "u" and value.dtype.itemsize == 2:
+            return "".join(chr(c) for c in value.ravel() if c)
+        if value.size == 1:
+            return _as_text(value.ravel()[0])
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _blocks_from_layout(
+    layout: _Layout,
+    filename: str,
+    axis: np.ndarray,
+    read_rows: Callable[[int, int], np.ndarray],
+    read_texts: Callable[[str, int, int], List[str]],
+) -> Iterator[SpectraBlock]:
+    stem = os.path.splitext(filename)[0]
+    step = _batch_rows()
+    for lo in range(0, layout.num_rows, step):
+        hi = min(lo + step, layout.num_rows)
+        matrix = np.asarray(read_rows(lo, hi), dtype=np.float64).reshape(hi - lo, layout.num_bands)
+        names = read_texts(layout.names, lo, hi) if layout.names else [f"{stem}_{i + 1}" for i in range(lo, hi)]
+        labels = read_texts(layout.labels, lo, hi) if layout.labels else [None] * (hi - lo)
+        yield SpectraBlock(axis, matrix, names, labels)
+
+
+# ---------------------------------------------------------------------------
+# HDF5 / MATLAB v7.3
+# ---------------------------------------------------------------------------
+
+def _hdf5_variables(h5file) -> List[_Variable]:
+    h5py = _require("h5py", "HDF5")
+    variables = []
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Dataset) and obj.shape:
+            kind = obj.dtype.kind
+            # MATLAB 字符数组以 uint16 保存，带 MATLAB_class='char' 属性
+            is_char = _matlab_class(obj) == "char"
+            variables.append(_Variable(name, tuple(obj.shape), kind in "fiu" and not is_char))
+
+    h5file.visititems(visit)
+    return variables
+
+
+def _matlab_class(obj) -> Optional[str]:
+    value = obj.attrs.get("MATLAB_class")
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _hdf5_vector_slice(dataset, lo: int, hi: int) -> np.ndarray:
+    """读取向量形变量（1D 或 1xN / Nx1）的第 lo..hi 个元素"""
+    index = []
+    sliced = False
+    for dim in dataset.shape:
+        if dim != 1 and not sliced:
+            index.append(slice(lo, hi))
+            sliced = True
+        else:
+            index.append(0)
+    if not sliced:
+        # 所有维度都为 1：只有一个元素
+        index[-1] = slice(lo, hi)
+    return np.asarray(dataset[tuple(index)]).ravel()
+
+
+def _hdf5_texts(h5file, name: str, lo: int, hi: int) -> List[str]:
+    h5py = _require("h5py", "HDF5")
+    dataset = h5file[name]
+    if _matlab_class(dataset) == "char":
+        # MATLAB char 矩阵：每个样本一行字符（h5py 中为一列）
+        # 只读取 [lo, hi) 对应的行/列，不把整个变量读入内存
+        chars = dataset[lo:hi] if dataset.shape[1] == 1 else dataset[:, lo:hi].T
+        return [_as_text(row) for row in chars]
+    values = _hdf5_vector_slice(dataset, lo, hi)
+    if dataset.dtype.kind == "O" and h5py.check_dtype(ref=dataset.dtype) is not None:
+        # MATLAB cell 数组：每个元素是指向字符数组的引用
+        return [_as_text(h5file[ref][()]) for ref in values]
+    return [_as_text(v) for v in values]
+
+
+def _iter_hdf5(path: str, filename: Optional[str] = None, column_major: bool = False) -> Iterator[SpectraBlock]:
+    h5py = _require("h5py", "HDF5")
+    filename = filename or os.path.basename(path)
+    with h5py.File(path, "r") as h5file:
+        layout = _choose_layout(_hdf5_variables(h5file), column_major)
+        spectra = h5file[layout.spectra]
+        if layout.axis:
+            axis = np.asarray(h5file[layout.axis][()], dtype=np.float64).ravel()
+        else:
+            axis = _default_axis(layout.num_bands, filename)
+
+        def read_rows(lo, hi):
+            # 只把需要的行块读入内存
+            return spectra[lo:hi, :] if layout.rows_first else spectra[:, lo:hi].T
+
+        yield from _blocks_from_layout(
+            layout, filename, axis, read_rows,
+            lambda name, lo, hi: _hdf5_texts(h5file, name, lo, hi)
+        )
+
+
+def iter_hdf5(path: str, filename: Optional[str] = None) -> Iterator[SpectraBlock]:
+    return _iter_hdf5(path, filename)
+
+
+# ---------------------------------------------------------------------------
+# MATLAB .mat
+# ---------------------------------------------------------------------------
+
+def _is_mat73(path: str) -> bool:
+    with open(path, "rb") as f:
+        header = f.read(128)
+    return b"MATLAB 7.3" in header
+
+
+def iter_mat(path: str, filename: Optional[str] = None) -> Iterator[SpectraBlock]:
+    if _is_mat73(path):
+        return _iter_hdf5(path, filename, column_major=True)
+    return _iter_mat5(path, filename)
+
+
+def _iter_mat5(path: str, filename: Optional[str] = None) -> Iterator[SpectraBlock]:
+    """v5 / v7 文件不支持部分读取，只加载选中的变量"""
+    scipy = _require("scipy", "MATLAB .mat")
+    import scipy.io
+    filename = filename or os.path.basename(path)
+
+    variables = [
+        _Variable(name, tuple(shape), mclass not in ("char", "cell", "struct", "object"))
+        for name, shape, mclass in scipy.io.whosmat(path)
+    ]
+    layout = _choose_layout(variables)
+    wanted = [n for n in (layout.spectra, layout.axis, layout.labels, layout.names) if n]
+    contents = scipy.io.loadmat(path, variable_names=wanted, chars_as_strings=True)
+
+    spectra = contents.pop(layout.spectra)
+    if not layout.rows_first:
+        spectra = spectra.T
+    if layout.axis:
+        axis = np.asarray(contents[layout.axis], dtype=np.float64).ravel()
+    else:
+        axis = _default_axis(layout.num_bands, filename)
+
+    def texts(name, lo, hi):
+        values = contents[name]
+        if values.dtype.kind == "U" and values.ndim == 1:
+            # char 矩阵在 chars_as_strings 下变为每行一个字符串
+            return [v.strip() for v in values[lo:hi]]
+        return [_as_text(v) for v in values.ravel()[lo:hi]]
+
+    return _blocks_from_layout(layout, filename, axis, lambda lo, hi: spectra[lo:hi], texts)
+
+
+# ---------------------------------------------------------------------------
+# JCAMP-DX
+# ---------------------------------------------------------------------------
+
+_SQZ = {"@": 0, **{c: i + 1 for i, c in enumerate("ABCDEFGHI")}, **{c: -(i + 1) for i, c in enumerate("abcdefghi")}}
+_DIF = {"%": 0, **{c: i + 1 for i, c in enumerate("JKLMNOPQR")}, **{c: -(i + 1) for i, c in enumerate("jklmnopqr")}}
+_DUP = {**{c: i + 1 for i, c in enumerate("STUVWXYZ")}, "s": 9}
+
+# 数据以外的标签名按规范忽略大小写、空格、连字符、斜线和下划线
+_LABEL_IGNORED = re.compile(r"[\s\-/_]")
+
+JCAMP_LABEL_KEYS = ("$LABEL", "CLASS", "$CLASS", "SAMPLEDESCRIPTION")
+
+
+def _jcamp_tokens(line: str) -> List[Tuple[str, str]]:
+    """把一行拆成 (类型, 数字文本)，类型为 abs / dif / dup"""
+    tokens: List[List[str]] = []
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if c in " \t,;":
+            tokens.append(None)
+        elif c in "+-":
+            tokens.append(["abs", c])
+        elif c.isdigit() or c == ".":
+            if tokens and tokens[-1] is not None:
+                tokens[-1][1] += c
+            else:
+                tokens.append(["abs", c])
+        elif c in "Ee" and tokens and tokens[-1] is not None and tokens[-1][0] == "abs" \
+                and i + 1 < len(line) and line[i + 1] in "+-":
+            # AFFN 指数形式，如 1.5E+03
+            tokens[-1][1] += "E" + line[i + 1]
+            i += 1
+        elif c in _SQZ:
+            tokens.append(["abs", str(_SQZ[c])])
+        elif c in _DIF:
+            tokens.append(["dif", str(_DIF[c])])
+        elif c in _DUP:
+            tokens.append(["dup", str(_DUP[c])])
+        elif c == "?":
+            tokens.append(["abs", "nan"])
+        else:
+            raise ValueError(f"Unexpected character '{c}' in JCAMP-DX data line")
+        i += 1
+    return [(t[0], t[1]) for t in tokens if t is not None and t[1] not in ("+", "-")]
+
+
+def _decode_xydata(lines: List[str]) -> List[float]:
+    """(X++(Y..Y)) 数据：每行第一个数是 X，其余为 Y；DIF 行之间的 Y 校验值去掉"""
+    ys: List[float] = []
+    previous_dif = False
+    for line in lines:
+        tokens = _jcamp_tokens(line)
+        if len(tokens) < 2:
+            continue
+        values: List[float] = []
+        last_kind, last_diff = None, 0.0
+        for kind, text in tokens[1:]:
+            if kind == "abs":
+                values.append(float(text))
+                last_kind = "abs"
+            elif kind == "dif":
+                base = values[-1] if values else (ys[-1] if ys else 0.0)
+                last_diff = float(text)
+                values.append(base + last_diff)
+                last_kind = "dif"
+            else:
+                for _ in range(int(text) - 1):
+                    values.append(values[-1] + last_diff if last_kind == "dif" else values[-1])
+        if previous_dif and values:
+            values = values[1:]
+        previous_dif = last_kind == "dif"
+        ys.extend(values)
+    return ys
+
+
+def _decode_xypoints(lines: List[str]) -> Tuple[List[float], List[float]]:
+    """(XY..XY) 或峰表：成对的 AFFN 数"""
+    numbers = [float(t) for line in lines for t in re.split(r"[\s,;]+", line.strip()) if t and t != "?"]
+    return numbers[0::2], numbers[1::2]
+
+
+def _jcamp_number(block: Dict[str, str], key: str, default: Optional[float] = None) -> Optional[float]:
+    value = block.get(key)
+    if value is None or not value.strip():
+        return default
+    return float(value.split()[0])
+
+
+def _jcamp_spectrum(block: Dict[str, str], kind: str, lines: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    xfactor = _jcamp_number(block, "XFACTOR", 1.0)
+    yfactor = _jcamp_number(block, "YFACTOR", 1.0)
+
+    if kind == "XYDATA":
+        ys = np.asarray(_decode_xydata(lines), dtype=np.float64) * yfactor
+        npoints = int(_jcamp_number(block, "NPOINTS", len(ys)))
+        ys = ys[:npoints]
+        firstx = _jcamp_number(block, "FIRSTX")
+        lastx = _jcamp_number(block, "LASTX")
+        if firstx is None or lastx is None:
+            first_line = _jcamp_tokens(lines[0])
+            firstx = float(first_line[0][1]) * xfactor
+            deltax = _jcamp_number(block, "DELTAX", 1.0)
+            lastx = firstx + deltax * (len(ys) - 1)
+        xs = np.linspace(firstx, lastx, len(ys)) if len(ys) > 1 else np.array([firstx])
+        return xs, ys
+
+    xs, ys = _decode_xypoints(lines)
+    return np.asarray(xs, dtype=np.float64) * xfactor, np.asarray(ys, dtype=np.float64) * yfactor
+
+
+def iter_jcamp(path: str, filename: Optional[str] = None) -> Iterator[SpectraBlock]:
+    """逐行读取，每个带数据的块（##TITLE 到 ##END）产出一条光谱"""
+    stem = os.path.splitext(filename or os.path.basename(path))[0]
+    block: Dict[str, str] = {}
+    data_kind: Optional[str] = None
+    data_lines: List[str] = []
+    collecting = False
+    count = 0
+
+    with open(path, "r", encoding="latin-1") as f:
+        for raw in f:
+            line = raw.split("$$", 1)[0].strip()
+            if not line:
+                continue
+            if not line.startswith("##"):
+                if collecting:
+                    data_lines.append(line)
+                continue
+
+            label, _, value = line[2:].partition("=")
+            label = _LABEL_IGNORED.sub("", label).upper()
+            value = value.strip()
+            # 数据记录在下一个标签处结束
+            collecting = False
+
+            if label in ("XYDATA", "XYPOINTS", "PEAKTABLE"):
+                data_kind, data_lines, collecting = label, [], True
+            elif label == "TITLE":
+                block, data_kind, data_lines = {"TITLE": value}, None, []
+            elif label == "END":
+                if data_kind and data_lines:
+                    xs, ys = _jcamp_spectrum(block, data_kind, data_lines)
+                    count += 1
+                    name = block.get("TITLE") or f"{stem}_{count}"
+                    sample_label = next((block[k] for k in JCAMP_LABEL_KEYS if block.get(k)), None)
+                    yield SpectraBlock(xs, ys[np.newaxis, :], [name], [sample_label])
+                block, data_kind, data_lines = {}, None, []
+            else:
+                block[label] = value
+
+    if count == 0:
+        raise ValueError("No spectra found in JCAMP-DX file")
+
+
+# ---------------------------------------------------------------------------
+# Galactic SPC
+# ---------------------------------------------------------------------------
+
+SPC_TSPREC = 0x01  # 16-bit Y values
+SPC_TMULTI = 0x04  # multiple subfiles
+SPC_TXYXYS = 0x40  # each subfile has its own X array
+SPC_TXVALS = 0x80  # one X array shared by all subfiles
+
+_SPC_HEADER = "BBBbiddiBBBBi9s9sH32s130s30siiBBHf48sfifB187s"
+_SPC_SUBHEADER = "BbHfffIIf4s"
+
+
+def iter_spc(path: str, filename: Optional[str] = None) -> Iterator[SpectraBlock]:
+    """新格式 SPC（版本字节 0x4B 小端 / 0x4C 大端），逐个子文件读取"""
+    stem = os.path.splitext(filename or os.path.basename(path))[0]
+    with open(path, "rb") as f:
+        head = f.read(512)
+        if len(head) < 512:
+            raise ValueError("File is too short to be an SPC file")
+        version = head[1]
+        if version == 0x4B:
+            order = "<"
+        elif version == 0x4C:
+            order = ">"
+        elif version == 0x4D:
+            raise ValueError("Old-format (pre-1996) SPC files are not supported")
+        else:
+            raise ValueError(f"Unknown SPC version byte 0x{version:02X}")
+
+        fields = struct.unpack(order + _SPC_HEADER, head)
+        flags, fexp, fnpts, ffirst, flast, fnsub = fields[0], fields[3], fields[4], fields[5], fields[6], fields[7]
+        fnsub = max(1, fnsub) if flags & SPC_TMULTI else 1
+
+        shared_x = None
+        if flags & SPC_TXVALS and not flags & SPC_TXYXYS:
+            shared_x = np.frombuffer(f.read(4 * fnpts), dtype=order + "f4").astype(np.float64)
+        elif not flags & SPC_TXYXYS:
+            shared_x = np.linspace(ffirst, flast, fnpts) if fnpts > 1 else np.array([ffirst])
+
+        for index in range(fnsub):
+            sub = f.read(32)
+            if len(sub) < 32:
+                break
+            subflgs, subexp, _, _, _, _, subnpts, _, _, _ = struct.unpack(order + _SPC_SUBHEADER, sub)
+            npts = subnpts if flags & SPC_TXYXYS else fnpts
+            if flags & SPC_TXYXYS:
+                xs = np.frombuffer(f.read(4 * npts), dtype=order + "f4").astype(np.float64)
+            else:
+                xs = shared_x
+
+            exponent = subexp if flags & SPC_TMULTI else fexp
+            if exponent == -128:
+                ys = np.frombuffer(f.read(4 * npts), dtype=order + "f4").astype(np.float64)
+            elif flags & SPC_TSPREC:
+                ys = np.frombuffer(f.read(2 * npts), dtype=order + "i2") * 2.0 ** (exponent - 16)
+            else:
+                ys = np.frombuffer(f.read(4 * npts), dtype=order + "i4") * 2.0 ** (exponent - 32)
+
+            if len(ys) != npts:
+                raise ValueError(f"SPC subfile {index} is truncated")
+            name = stem if fnsub == 1 else f"{stem}_{index + 1}"
+            yield SpectraBlock(xs, ys[np.newaxis, :], [name], [None])
+
+
+FORMAT_READERS: Dict[str, Callable[..., Iterator[SpectraBlock]]] = {
+    FORMAT_HDF5: iter_hdf5,
+    FORMAT_MAT: iter_mat,
+    FORMAT_JCAMP: iter_jcamp,
+    FORMAT_SPC: iter_spc,
+}
+
+
+# ---------------------------------------------------------------------------
+# 写入存储
+# ---------------------------------------------------------------------------
+
+class _BlockWriter:
+    """
+    攒够 INGEST_BATCH_ROWS 行后写入；轴都相同时写稠密矩阵，否则写不等长样本
+    checkpoint 同 ingest.SampleBatcher
+    """
+
+    def __init__(
+        self, db: Session, dataset: Dataset, codec: Optional[str],
+        checkpoint: Optional[Callable[[int], None]] = None
+    ):
+        self.db = db
+        self.dataset = dataset
+        self.codec = codec
+        self.checkpoint = checkpoint
+        self.blocks: List[SpectraBlock] = []
+        self.pending = 0
+        self.written = 0
+        self.num_bands = None
+
+    def add(self, block: SpectraBlock):
+        self.blocks.append(block)
+        self.pending += len(block.names)
+        if self.pending >= _batch_rows():
+            self.flush()
+
+    def flush(self):
+        if not self.blocks:
+            return
+        axis = self.blocks[0].wavelengths
+        shared = all(
+            b.wavelengths is axis or np.array_equal(b.wavelengths, axis) for b in self.blocks
+        )
+        names = [n for b in self.blocks for n in b.names]
+        labels = [l for b in self.blocks for l in b.labels]
+
+        if shared:
+            matrix = np.concatenate([b.intensities for b in self.blocks])
+            self.written += spectral_storage.append_samples(
+                self.db, self.dataset, axis.tolist(), matrix, names, labels, self.codec
+            )
+            self.num_bands = len(axis)
+        else:
+            axes = [b.wavelengths for b in self.blocks for _ in b.names]
+            rows = [row for b in self.blocks for row in b.intensities]
+            self.written += spectral_storage.append_ragged_samples(
+                self.db, self.dataset, axes, rows, names, labels, self.codec
+            )
+            self.num_bands = len(axes[-1])
+        if self.checkpoint is not None:
+            self.checkpoint(self.written)
+        else:
+            self.db.flush()
+        self.blocks, self.pending = [], 0
+
+
+def import_file(
+    db: Session,
+    dataset: Dataset,
+    path: str,
+    fmt: str,
+    codec: Optional[str] = None,
+    filename: Optional[str] = None,
+    checkpoint: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """
+    把仪器格式文件中的光谱写入数据集，返回写入的样本数和波段数
+    filename 是上传时的原始文件名，没有样本名时用它生成
+    不提交事务，由调用方 commit（checkpoint 见 ingest.SampleBatcher）
+    """
+    reader = FORMAT_READERS.get(fmt)
+    if reader is None:
+        raise ValueError(f"Unsupported spectral file format '{fmt}'")
+
+    writer = _BlockWriter(db, dataset, codec, checkpoint)
+    for block in reader(path, filename):
+        writer.add(block)
+    writer.flush()
+
+    if writer.written == 0:
+        raise ValueError("No spectra found in the file")
+    return {"format": fmt, "num_samples": writer.written, "num_bands": writer.num_bands}
@@ -0,0 +1,1147 @@
+"""
+光谱样本存储层
+json:     每个 SpectralSample 行保存自己的 wavelengths / intensities (旧格式)
+columnar: 数据集共享一条波长轴，强度按 SPECTRAL_CHUNK_ROWS 行打包成矩阵块，
+          SpectralSample 行只保存名称、标签和 row_index
+mmap:     强度矩阵保存在 SPECTRA_DIR/dataset_{id}.npy（不在公开的 /uploads 下），
+          读取时通过 numpy.memmap 切片，多个 worker 共享操作系统页缓存
+
+columnar 数据集中波长轴不同或长度不同的样本保存为不等长 (ragged) 块：
+所有样本的值拼接成一个缓冲区，第 i 行为 values[offsets[i]:offsets[i+1]]
+"""
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from functools import lru_cache
+import ast
+import os
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from sqlalchemy import func, cast, case, update, Text
+from sqlalchemy.orm import Session
+from config import settings
+from models import Dataset, SpectralSample, SpectralChunk, SpectralLOD
+import band_selection
+import band_stats
+import bulk_insert
+import lod
+import spectral_codecs
+import wavelength_grids
+
+STORAGE_JSON = "json"
+STORAGE_COLUMNAR = "columnar"
+STORAGE_MMAP = "mmap"
+STORAGE_MODES = (STORAGE_JSON, STORAGE_COLUMNAR, STORAGE_MMAP)
+
+# 存储的字节序固定为小端，跨平台读取结果一致
+DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float64": np.dtype("<f8"),
+}
+
+LAYOUT_DENSE = "dense"
+LAYOUT_RAGGED = "ragged"
+OFFSET_DTYPE = np.dtype("<i8")
+WAVELENGTH_DTYPE = np.dtype("<f8")
+
+# .npy 头部固定为 256 字节，追加样本时可以原地改写 shape
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+NPY_HEADER_SIZE = 256
+
+
+def get_storage_mode(dataset: Dataset) -> str:
+    return dataset.storage_mode or STORAGE_JSON
+
+
+def _count_rows(db: Session, dataset_id: int) -> int:
+    return db.query(func.count(SpectralSample.id)).filter(
+        SpectralSample.dataset_id == dataset_id
+    ).scalar() or 0
+
+
+def _lock_dataset(db: Session, dataset: Dataset):
+    """
+    分配 row_index 前锁住数据集行，同一数据集的并发追加依次进行，直到持有锁的事务提交
+    PostgreSQL 用 SELECT ... FOR UPDATE；SQLite 没有行锁，用一条不改变数据的 UPDATE 提前取得数据库写锁
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(
+            update(Dataset)
+            .where(Dataset.id == dataset.id)
+            .values({Dataset.updated_at: Dataset.updated_at})
+        )
+    else:
+        db.query(Dataset.id).filter(Dataset.id == dataset.id).with_for_update().one()
+
+
+def _next_row_index(db: Session, dataset_id: int) -> int:
+    last = db.query(func.max(SpectralSample.row_index)).filter(
+        SpectralSample.dataset_id == dataset_id
+    ).scalar()
+    return 0 if last is None else last + 1
+
+
+def _resolve_mode(db: Session, dataset: Dataset) -> str:
+    """数据集第一次写入样本时确定存储模式，已有旧 JSON 样本的数据集保持 json"""
+    if dataset.storage_mode:
+        return dataset.storage_mode
+    if _count_rows(db, dataset.id) > 0:
+        dataset.storage_mode = STORAGE_JSON
+    else:
+        if settings.SPECTRAL_STORAGE not in STORAGE_MODES:
+            raise ValueError(f"Unknown SPECTRAL_STORAGE '{settings.SPECTRAL_STORAGE}'")
+        dataset.storage_mode = settings.SPECTRAL_STORAGE
+    return dataset.storage_mode
+
+
+def _bind_storage(dataset: Dataset, codec: Optional[str] = None) -> str:
+    """第一次写入时确定 dtype 和编码器，返回存储 dtype"""
+    if dataset.storage_codec is None:
+        default_codec = settings.SPECTRAL_CODEC
+        if get_storage_mode(dataset) == STORAGE_MMAP:
+            default_codec = spectral_codecs.RAW
+        dataset.storage_dtype = settings.SPECTRAL_DTYPE
+        dataset.storage_codec = spectral_codecs.validate_codec(codec or default_codec)
+    elif codec and codec != dataset.storage_codec:
+        raise ValueError(f"Dataset already uses codec '{dataset.storage_codec}'")
+
+    if get_storage_mode(dataset) == STORAGE_MMAP and get_codec(dataset) != spectral_codecs.RAW:
+        # memmap 需要定长布局，只能存原始矩阵
+        raise ValueError("mmap storage only supports the 'raw' codec")
+
+    dtype = dataset.storage_dtype or settings.SPECTRAL_DTYPE
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported storage dtype '{dtype}'")
+    return dtype
+
+
+def _bind_axis(db: Session, dataset: Dataset, wavelengths: List[float], codec: Optional[str] = None) -> str:
+    """
+    第一次写入时记录共享波长轴，之后的追加必须使用同一条轴
+    返回存储 dtype
+    """
+    grid = wavelength_grids.get_or_create_grid(db, wavelengths)
+    if dataset.wavelength_grid_id is None:
+        dataset.wavelength_grid_id = grid.id
+    elif dataset.wavelength_grid_id != grid.id:
+        raise ValueError("Wavelength axis does not match the dataset's existing samples")
+    return _bind_storage(dataset, codec)
+
+
+def _matches_axis(db: Session, dataset: Dataset, wavelengths: List[float]) -> bool:
+    if dataset.wavelength_grid_id is None:
+        return True
+    return get_axis(db, dataset) == wavelengths
+
+
+def get_axis(db: Session, dataset: Dataset) -> List[float]:
+    """打包存储数据集的共享波长轴"""
+    return wavelength_grids.load_grid(db, dataset.wavelength_grid_id) or []
+
+
+def is_dense(dataset: Dataset) -> bool:
+    """columnar / mmap 数据集的所有样本共享一条波长轴（读取时得到 n x bands 矩阵）"""
+    return (
+        get_storage_mode(dataset) != STORAGE_JSON
+        and not dataset.is_ragged and dataset.wavelength_grid_id is not None
+    )
+
+
+def get_codec(dataset: Dataset) -> str:
+    return dataset.storage_codec or spectral_codecs.RAW
+
+
+def value_dtype(dataset: Dataset) -> np.dtype:
+    """读取出的强度数组的 dtype：稠密数据集为解码后的存储 dtype，json 和不等长数据集为 float64"""
+    if not is_dense(dataset):
+        return np.dtype("<f8")
+    codec = get_codec(dataset)
+    if codec == spectral_codecs.FLOAT16:
+        return np.dtype("<f2")
+    if codec == spectral_codecs.INT16:
+        return np.dtype("<f8")
+    return DTYPES.get(dataset.storage_dtype, np.dtype("<f8"))
+
+
+def bump_data_version(dataset: Dataset):
+    """样本内容变化时递增，依赖样本数据的缓存（密度图等）以它判断是否过期"""
+    dataset.data_version = (dataset.data_version or 0) + 1
+
+
+def append_samples(
+    db: Session,
+    dataset: Dataset,
+    wavelengths: Sequence[float],
+    intensities: np.ndarray,
+    sample_names: Sequence[str],
+    sample_labels: Sequence[Optional[str]],
+    codec: Optional[str] = None,
+) -> int:
+    """
+    追加一批共享同一波长轴的样本 (intensities: n x bands)
+    样本行通过 bulk_insert 批量写入；codec 只在数据集第一次写入时生效；
+    不提交事务，由调用方 commit
+    """
+    intensities = np.asarray(intensities, dtype=np.float64)
+    if intensities.ndim != 2 or intensities.shape[1] != len(wavelengths):
+        raise ValueError(
+            f"Intensity matrix shape {intensities.shape} does not match {len(wavelengths)} wavelengths"
+        )
+    num_rows = intensities.shape[0]
+    if num_rows == 0:
+        return 0
+
+    _lock_dataset(db, dataset)
+    mode = _resolve_mode(db, dataset)
+    row_start = _next_row_index(db, dataset.id)
+    wavelength_list = [float(w) for w in wavelengths]
+
+    if mode == STORAGE_COLUMNAR and not _matches_axis(db, dataset, wavelength_list):
+        # 与数据集波长轴不同的批次保存为不等长块
+        dtype = _bind_storage(dataset, codec)
+        offsets = np.arange(num_rows + 1, dtype=OFFSET_DTYPE) * len(wavelength_list)
+        _append_ragged_chunks(
+            db, dataset, dtype, offsets,
+            np.tile(np.asarray(wavelength_list, dtype=WAVELENGTH_DTYPE), num_rows),
+            intensities.ravel(), row_start
+        )
+    elif mode == STORAGE_COLUMNAR:
+        dtype = _bind_axis(db, dataset, wavelength_list, codec)
+        _append_chunks(db, dataset, dtype, intensities, row_start)
+    elif mode == STORAGE_MMAP:
+        dtype = _bind_axis(db, dataset, wavelength_list, codec)
+        _append_mmap(dataset, dtype, intensities, row_start)
+    else:
+        grid_id = wavelength_grids.get_or_create_grid(db, wavelength_list).id
+
+    rows = []
+    for i in range(num_rows):
+        row = {
+            "dataset_id": dataset.id,
+            "sample_name": sample_names[i],
+            "sample_label": sample_labels[i],
+            "row_index": row_start + i,
+        }
+        if mode == STORAGE_JSON:
+            row["wavelength_grid_id"] = grid_id
+            row["intensities"] = intensities[i].tolist()
+        rows.append(row)
+
+    lod.store_matrix(db, dataset, row_start, wavelength_list, intensities)
+    band_stats.update(db, dataset, wavelength_list, intensities, sample_labels)
+    bump_data_version(dataset)
+    return bulk_insert.insert_samples(db, rows)
+
+
+def append_ragged_samples(
+    db: Session,
+    dataset: Dataset,
+    wavelengths: Sequence[Sequence[float]],
+    intensities: Sequence[Sequence[float]],
+    sample_names: Sequence[str],
+    sample_labels: Sequence[Optional[str]],
+    codec: Optional[str] = None,
+) -> int:
+    """
+    追加一批各自带波长轴的样本，每个样本的长度可以不同
+    不提交事务，由调用方 commit
+    """
+    num_rows = len(intensities)
+    if len(wavelengths) != num_rows:
+        raise ValueError("Each sample needs its own wavelength axis")
+    if num_rows == 0:
+        return 0
+
+    wavelength_arrays = [np.asarray(w, dtype=WAVELENGTH_DTYPE).ravel() for w in wavelengths]
+    value_arrays = [np.asarray(v, dtype=np.float64).ravel() for v in intensities]
+    for i, (w, v) in enumerate(zip(wavelength_arrays, value_arrays)):
+        if w.size != v.size:
+            raise ValueError(f"Sample {i} has {v.size} values for {w.size} wavelengths")
+
+    _lock_dataset(db, dataset)
+    mode = _resolve_mode(db, dataset)
+    row_start = _next_row_index(db, dataset.id)
+
+    if mode == STORAGE_MMAP:
+        raise ValueError("mmap storage requires every sample to share one wavelength axis")
+
+    if mode == STORAGE_COLUMNAR:
+        dtype = _bind_storage(dataset, codec)
+        offsets = np.zeros(num_rows + 1, dtype=OFFSET_DTYPE)
+        np.cumsum([v.size for v in value_arrays], out=offsets[1:])
+        _append_ragged_chunks(
+            db, dataset, dtype, offsets,
+            np.concatenate(wavelength_arrays), np.concatenate(value_arrays), row_start
+        )
+
+    dataset.is_ragged = True
+    grid_ids = {}
+    rows = []
+    for i in range(num_rows):
+        row = {
+            "dataset_id": dataset.id,
+            "sample_name": sample_names[i],
+            "sample_label": sample_labels[i],
+            "row_index": row_start + i,
+        }
+        if mode == STORAGE_JSON:
+            key = wavelength_grids.grid_hash(wavelength_arrays[i])
+            if key not in grid_ids:
+                grid_ids[key] = wavelength_grids.get_or_create_grid(db, wavelength_arrays[i]).id
+            row["wavelength_grid_id"] = grid_ids[key]
+            row["intensities"] = value_arrays[i].tolist()
+        rows.append(row)
+
+    lod.store_rows(db, dataset, row_start, wavelength_arrays, value_arrays)
+    band_stats.exclude(db, dataset, num_rows)
+    bump_data_version(dataset)
+    return bulk_insert.insert_samples(db, rows)
+
+
+# ---------------------------------------------------------------------------
+# columnar: 数据库中的打包矩阵块
+# ---------------------------------------------------------------------------
+
+def _decode_chunk(chunk: SpectralChunk) -> np.ndarray:
+    """稠密块返回 num_rows x num_bands 矩阵，不等长块返回拼接后的一维值缓冲区"""
+    if chunk.layout == LAYOUT_RAGGED:
+        return spectral_codecs.decode(
+            chunk.data, chunk.codec or spectral_codecs.RAW, DTYPES[chunk.dtype],
+            1, chunk.num_bands
+        )[0]
+    return spectral_codecs.decode(
+        chunk.data, chunk.codec or spectral_codecs.RAW, DTYPES[chunk.dtype],
+        chunk.num_rows, chunk.num_bands
+    )
+
+
+def _chunk_offsets(chunk: SpectralChunk) -> np.ndarray:
+    return np.frombuffer(chunk.offsets, dtype=OFFSET_DTYPE)
+
+
+def _chunk_wavelengths(chunk: SpectralChunk) -> np.ndarray:
+    return np.frombuffer(chunk.wavelength_data, dtype=WAVELENGTH_DTYPE)
+
+
+def _encode_matrix(matrix: np.ndarray, dtype: str, codec: str = spectral_codecs.RAW) -> bytes:
+    return spectral_codecs.encode(matrix, codec, DTYPES[dtype])
+
+
+def _append_chunks(
+    db: Session,
+    dataset: Dataset,
+    dtype: str,
+    intensities: np.ndarray,
+    row_start: int,
+):
+    chunk_rows = max(1, settings.SPECTRAL_CHUNK_ROWS)
+    num_bands = intensities.shape[1]
+    codec = get_codec(dataset)
+
+    last = db.query(SpectralChunk).filter(
+        SpectralChunk.dataset_id == dataset.id
+    ).order_by(SpectralChunk.chunk_index.desc()).first()
+
+    offset = 0
+    # 先填满最后一个未满的块，避免小批量追加产生大量碎块
+    # 有损编码的块不重新编码，否则每次追加都会重复量化
+    if (last is not None and last.num_rows < chunk_rows
+            and last.layout != LAYOUT_RAGGED and last.num_bands == num_bands
+            and codec not in spectral_codecs.LOSSY_CODECS):
+        take = min(chunk_rows - last.num_rows, intensities.shape[0])
+        merged = np.vstack([_decode_chunk(last), intensities[:take]])
+        last.data = _encode_matrix(merged, last.dtype, codec)
+        last.codec = codec
+        last.num_rows = merged.shape[0]
+        offset = take
+
+    next_index = 0 if last is None else last.chunk_index + 1
+    while offset < intensities.shape[0]:
+        block = intensities[offset:offset + chunk_rows]
+        db.add(SpectralChunk(
+            dataset_id=dataset.id,
+            chunk_index=next_index,
+            row_start=row_start + offset,
+            num_rows=block.shape[0],
+            num_bands=num_bands,
+            dtype=dtype,
+            codec=codec,
+            data=_encode_matrix(block, dtype, codec),
+        ))
+        next_index += 1
+        offset += block.shape[0]
+
+
+def _append_ragged_chunks(
+    db: Session,
+    dataset: Dataset,
+    dtype: str,
+    offsets: np.ndarray,
+    wavelengths: np.ndarray,
+    values: np.ndarray,
+    row_start: int,
+):
+    """offsets 从 0 开始，长度为行数 + 1"""
+    chunk_rows = max(1, settings.SPECTRAL_CHUNK_ROWS)
+    codec = get_codec(dataset)
+    num_rows = len(offsets) - 1
+    dataset.is_ragged = True
+
+    last = db.query(SpectralChunk).filter(
+        SpectralChunk.dataset_id == dataset.id
+    ).order_by(SpectralChunk.chunk_index.desc()).first()
+
+    row = 0
+    if (last is not None and last.num_rows < chunk_rows
+            and last.layout == LAYOUT_RAGGED
+            and codec not in spectral_codecs.LOSSY_CODECS):
+        take = min(chunk_rows - last.num_rows, num_rows)
+        old_offsets = _chunk_offsets(last)
+        end = offsets[take]
+        merged_offsets = np.concatenate([old_offsets, old_offsets[-1] + offsets[1:take + 1]])
+        merged_values = np.concatenate([_decode_chunk(last), values[:end]])
+        last.offsets = merged_offsets.astype(OFFSET_DTYPE).tobytes()
+        last.wavelength_data = np.concatenate([_chunk_wavelengths(last), wavelengths[:end]]).tobytes()
+        last.data = _encode_matrix(merged_values[np.newaxis, :], last.dtype, codec)
+        last.codec = codec
+        last.num_rows += take
+        last.num_bands = int(merged_values.size)
+        row = take
+
+    next_index = 0 if last is None else last.chunk_index + 1
+    while row < num_rows:
+        end_row = min(row + chunk_rows, num_rows)
+        lo, hi = offsets[row], offsets[end_row]
+        block = values[lo:hi]
+        db.add(SpectralChunk(
+            dataset_id=dataset.id,
+            chunk_index=next_index,
+            row_start=row_start + row,
+            num_rows=end_row - row,
+            num_bands=int(block.size),
+            dtype=dtype,
+            codec=codec,
+            layout=LAYOUT_RAGGED,
+            offsets=(offsets[row:end_row + 1] - lo).astype(OFFSET_DTYPE).tobytes(),
+            wavelength_data=np.ascontiguousarray(wavelengths[lo:hi], dtype=WAVELENGTH_DTYPE).tobytes(),
+            data=_encode_matrix(block[np.newaxis, :], dtype, codec),
+        ))
+        next_index += 1
+        row = end_row
+
+
+def _query_chunks(db: Session, dataset: Dataset, row_lo: int, row_hi: int) -> List[SpectralChunk]:
+    return db.query(SpectralChunk).filter(
+        SpectralChunk.dataset_id == dataset.id,
+        SpectralChunk.row_start < row_hi,
+        SpectralChunk.row_start + SpectralChunk.num_rows > row_lo,
+    ).order_by(SpectralChunk.row_start).all()
+
+
+def _read_chunks(db: Session, dataset: Dataset, row_lo: int, row_hi: int) -> np.ndarray:
+    chunks = _query_chunks(db, dataset, row_lo, row_hi)
+
+    if not chunks:
+        return np.empty((0, len(get_axis(db, dataset))))
+
+    parts = []
+    for chunk in chunks:
+        if chunk.layout == LAYOUT_RAGGED:
+            raise ValueError("Dataset contains samples on different wavelength axes")
+        matrix = _decode_chunk(chunk)
+        lo = max(row_lo - chunk.row_start, 0)
+        hi = min(row_hi - chunk.row_start, chunk.num_rows)
+        parts.append(matrix[lo:hi])
+    return parts[0] if len(parts) == 1 else np.vstack(parts)
+
+
+def _read_ragged_rows(
+    db: Session, dataset: Dataset, row_lo: int, row_hi: int
+) -> List[Tuple[Optional[int], List[float], np.ndarray]]:
+    """逐行返回 (wavelength_grid_id, wavelengths, intensities)，同时支持稠密块和不等长块"""
+    rows = []
+    axis = None
+    for chunk in _query_chunks(db, dataset, row_lo, row_hi):
+        lo = max(row_lo - chunk.row_start, 0)
+        hi = min(row_hi - chunk.row_start, chunk.num_rows)
+        values = _decode_chunk(chunk)
+
+        if chunk.layout != LAYOUT_RAGGED:
+            if axis is None:
+                axis = get_axis(db, dataset)
+            rows.extend((dataset.wavelength_grid_id, axis, values[i]) for i in range(lo, hi))
+            continue
+
+        # 两次数组查找定位 [lo, hi) 行的值区间，再按偏移切分
+        offsets = _chunk_offsets(chunk)
+        start, end = offsets[lo], offsets[hi]
+        wavelengths = _chunk_wavelengths(chunk)[start:end]
+        segment = values[start:end]
+        bounds = offsets[lo:hi + 1] - start
+        for i in range(hi - lo):
+            a, b = bounds[i], bounds[i + 1]
+            rows.append((None, wavelengths[a:b].tolist(), segment[a:b]))
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# mmap: SPECTRA_DIR 下的定长头 .npy 文件
+# ---------------------------------------------------------------------------
+
+def spectra_dir() -> str:
+    return settings.SPECTRA_DIR
+
+
+def spectra_path(dataset_id: int) -> str:
+    return os.path.join(spectra_dir(), f"dataset_{dataset_id}.npy")
+
+
+def _npy_header(dtype: str, num_rows: int, num_bands: int) -> bytes:
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d, %d), }" % (
+        DTYPES[dtype].str, num_rows, num_bands
+    )
+    # magic(8) + header_len(2) + header，空格填充并以换行结尾
+    body_size = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2
+    header = header.ljust(body_size - 1) + "\n"
+    if len(header) != body_size:
+        raise ValueError("Spectra matrix shape does not fit into the .npy header")
+    return NPY_MAGIC + body_size.to_bytes(2, "little") + header.encode("latin1")
+
+
+def _read_npy_shape(path: str):
+    with open(path, "rb") as f:
+        prefix = f.read(NPY_HEADER_SIZE)
+    if not prefix.startswith(NPY_MAGIC):
+        raise ValueError(f"{path} is not a spectra matrix file")
+    header = ast.literal_eval(prefix[10:].decode("latin1").strip())
+    return header["shape"]
+
+
+def _append_mmap(dataset: Dataset, dtype: str, intensities: np.ndarray, row_start: int):
+    """
+    从 row_start 行的位置写入新行，再原地改写头部的行数
+    - 数据先于头部写入，并发读取者最多看到旧的行数
+    - 之前未提交的写入留下的多余行直接被覆盖，文件只会变长、从不截断：
+      其他进程缓存的 memmap 仍按旧的大小映射，文件变短后访问会触发 SIGBUS
+    - Web 进程和导入 worker 可能同时追加同一个数据集，用 fcntl 文件锁串行化（Windows 上没有锁）
+    """
+    os.makedirs(spectra_dir(), exist_ok=True)
+    path = spectra_path(dataset.id)
+    num_bands = intensities.shape[1]
+    row_bytes = num_bands * DTYPES[dtype].itemsize
+
+    # O_CREAT 不截断已有文件，两个进程同时创建时也不会互相覆盖
+    with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), "r+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)  # 关闭文件时释放
+        if os.fstat(f.fileno()).st_size < NPY_HEADER_SIZE:
+            f.write(_npy_header(dtype, 0, num_bands))
+        f.seek(NPY_HEADER_SIZE + row_start * row_bytes)
+        f.write(_encode_matrix(intensities, dtype))
+        f.flush()
+        f.seek(0)
+        f.write(_npy_header(dtype, row_start + intensities.shape[0], num_bands))
+
+
+@lru_cache(maxsize=64)
+def _open_memmap(path: str, size: int, mtime_ns: int) -> np.ndarray:
+    # size / mtime 参与缓存键，文件追加后会重新映射
+    return np.load(path, mmap_mode="r")
+
+
+def open_spectra_file(dataset_id: int) -> Optional[np.ndarray]:
+    """以只读 memmap 打开数据集的强度矩阵，文件不存在时返回 None"""
+    path = spectra_path(dataset_id)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return _open_memmap(path, stat.st_size, stat.st_mtime_ns)
+
+
+def _read_mmap(db: Session, dataset: Dataset, row_lo: int, row_hi: int) -> np.ndarray:
+    matrix = open_spectra_file(dataset.id)
+    if matrix is None:
+        return np.empty((0, len(get_axis(db, dataset))))
+    return matrix[row_lo:row_hi]
+
+
+def _mmap_stored_bytes(dataset: Dataset) -> int:
+    path = spectra_path(dataset.id)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def delete_dataset_storage(dataset: Dataset):
+    """删除数据库之外的样本存储（mmap 文件）"""
+    path = spectra_path(dataset.id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# ---------------------------------------------------------------------------
+# 存储统计
+# ---------------------------------------------------------------------------
+
+def storage_report(db: Session, dataset: Dataset) -> dict:
+    """
+    返回数据集的存储占用和压缩比
+    raw_bytes 为强度矩阵按存储 dtype 未压缩时的大小
+    """
+    mode = get_storage_mode(dataset)
+    report = {
+        "dataset_id": dataset.id,
+        "storage_mode": mode,
+        "storage_dtype": dataset.storage_dtype,
+        "codec": get_codec(dataset) if mode != STORAGE_JSON else None,
+        "raw_bytes": 0,
+        "stored_bytes": 0,
+        "compression_ratio": None,
+    }
+    itemsize = DTYPES[dataset.storage_dtype].itemsize if dataset.storage_dtype in DTYPES else 8
+
+    if mode == STORAGE_COLUMNAR:
+        values, stored = db.query(
+            func.sum(case(
+                (SpectralChunk.layout == LAYOUT_RAGGED, SpectralChunk.num_bands),
+                else_=SpectralChunk.num_rows * SpectralChunk.num_bands
+            )),
+            func.sum(func.length(SpectralChunk.data)),
+        ).filter(SpectralChunk.dataset_id == dataset.id).one()
+        report["raw_bytes"] = int(values or 0) * itemsize
+        report["stored_bytes"] = int(stored or 0)
+    elif mode == STORAGE_MMAP:
+        num_rows = _count_rows(db, dataset.id)
+        report["raw_bytes"] = num_rows * len(get_axis(db, dataset)) * itemsize
+        report["stored_bytes"] = _mmap_stored_bytes(dataset)
+    else:
+        # json 模式下以 float64 作为未压缩基准，stored_bytes 为 JSON 文本长度
+        stored, num_rows = db.query(
+            func.sum(func.length(cast(SpectralSample.intensities, Text))),
+            func.count(SpectralSample.id),
+        ).filter(SpectralSample.dataset_id == dataset.id).one()
+        report["stored_bytes"] = int(stored or 0)
+        report["raw_bytes"] = int(num_rows or 0) * (dataset.num_bands or 0) * 8
+
+    if report["stored_bytes"]:
+        report["compression_ratio"] = round(report["raw_bytes"] / report["stored_bytes"], 3)
+    return report
+
+
+# ---------------------------------------------------------------------------
+# 读取
+# ---------------------------------------------------------------------------
+
+def read_matrix(db: Session, dataset: Dataset, row_lo: int, row_hi: int) -> np.ndarray:
+    """
+    读取 [row_lo, row_hi) 行的强度矩阵 (columnar / mmap 数据集)
+    范围内含不等长块时抛出 ValueError
+    """
+    if get_storage_mode(dataset) == STORAGE_MMAP:
+        return _read_mmap(db, dataset, row_lo, row_hi)
+    return _read_chunks(db, dataset, row_lo, row_hi)
+
+
+def _sample_dict(sample, grid_id, wavelengths, intensities) -> dict:
+    return {
+        "id": sample.id,
+        "dataset_id": sample.dataset_id,
+        "sample_name": sample.sample_name,
+        "sample_label": sample.sample_label,
+        "wavelength_grid_id": grid_id,
+        "wavelengths": wavelengths,
+        "intensities": intensities,
+        "properties": sample.properties or {},
+        "created_at": sample.created_at,
+    }
+
+
+def _meta_query(db: Session, dataset: Dataset):
+    """只查询样本的元数据列，不加载 JSON 光谱列"""
+    return db.query(
+        SpectralSample.id,
+        SpectralSample.dataset_id,
+        SpectralSample.sample_name,
+        SpectralSample.sample_label,
+        SpectralSample.row_index,
+        SpectralSample.properties,
+        SpectralSample.created_at,
+    ).filter(SpectralSample.dataset_id == dataset.id)
+
+
+def _packed_rows(
+    db: Session, dataset: Dataset, rows, slicer: Optional[band_selection.AxisSlicer] = None
+) -> List[dict]:
+    """slicer 不为空时只返回选中的波段，裁剪后的波长不再对应原来的 wavelength_grid_id"""
+    if not rows:
+        return []
+    row_lo = rows[0].row_index
+    if dataset.is_ragged:
+        spectra = _read_ragged_rows(db, dataset, row_lo, rows[-1].row_index + 1)
+        result = []
+        for sample in rows:
+            grid_id, wavelengths, values = spectra[sample.row_index - row_lo]
+            if slicer is not None:
+                wavelengths, values = slicer.row(wavelengths, values, grid_id)
+                grid_id, wavelengths = None, wavelengths.tolist()
+            result.append(_sample_dict(sample, grid_id, wavelengths, values.tolist()))
+        return result
+
+    matrix = read_matrix(db, dataset, row_lo, rows[-1].row_index + 1)
+    wavelengths = get_axis(db, dataset)
+    grid_id = dataset.wavelength_grid_id
+    if slicer is not None:
+        axis, matrix = slicer.matrix(wavelengths, matrix, grid_id)
+        grid_id, wavelengths = None, axis.tolist()
+    return [
+        _sample_dict(
+            sample, grid_id, wavelengths,
+            matrix[sample.row_index - row_lo].tolist()
+        )
+        for sample in rows
+    ]
+
+
+def _row_wavelengths(db: Session, sample: SpectralSample) -> Optional[List[float]]:
+    """json 样本：旧数据自带波长数组，新数据引用共享波长轴"""
+    if sample.wavelengths is not None:
+        return sample.wavelengths
+    return wavelength_grids.load_grid(db, sample.wavelength_grid_id)
+
+
+def read_sample_row(db: Session, dataset: Dataset, sample: SpectralSample) -> Tuple[List[float], np.ndarray]:
+    """一个样本的完整 (wavelengths, intensities)"""
+    if get_storage_mode(dataset) == STORAGE_JSON:
+        return _row_wavelengths(db, sample) or [], np.asarray(sample.intensities or [], dtype=np.float64)
+    row = sample.row_index
+    if dataset.is_ragged:
+        _, wavelengths, values = _read_ragged_rows(db, dataset, row, row + 1)[0]
+        return wavelengths, values
+    return get_axis(db, dataset), read_matrix(db, dataset, row, row + 1)[0]
+
+
+def _json_row(db: Session, sample: SpectralSample, slicer: Optional[band_selection.AxisSlicer] = None) -> dict:
+    wavelengths = _row_wavelengths(db, sample)
+    if slicer is None:
+        return _sample_dict(sample, sample.wavelength_grid_id, wavelengths, sample.intensities)
+    wavelengths, values = slicer.row(wavelengths, sample.intensities or [], sample.wavelength_grid_id)
+    return _sample_dict(sample, None, wavelengths.tolist(), values.tolist())
+
+
+def read_samples(
+    db: Session, dataset: Dataset, skip: int = 0, limit: int = 100,
+    selection: Optional[band_selection.BandSelection] = None
+) -> List[dict]:
+    """按 SpectralSampleResponse 的字段返回一页样本"""
+    return read_samples_after(db, dataset, None, limit, skip, selection)[0]
+
+
+def sample_sort_key(dataset: Dataset) -> str:
+    """分页使用的排序键：打包存储按 row_index，json 按 id，两者都有 (dataset_id, key) 索引"""
+    return "id" if get_storage_mode(dataset) == STORAGE_JSON else "row_index"
+
+
+def read_samples_after(
+    db: Session, dataset: Dataset, after: Optional[int], limit: int = 100, skip: int = 0,
+    selection: Optional[band_selection.BandSelection] = None
+) -> Tuple[List[dict], Optional[int]]:
+    """
+    键集分页：返回排序键大于 after 的一页样本和这一页最后一行的键
+    （不足一页时为 None，表示没有下一页）；selection 为波段裁剪条件
+    """
+    slicer = band_selection.slicer(selection)
+    if get_storage_mode(dataset) != STORAGE_JSON:
+        query = _meta_query(db, dataset)
+        if after is not None:
+            query = query.filter(SpectralSample.row_index > after)
+        rows = query.order_by(SpectralSample.row_index).offset(skip).limit(limit).all()
+        samples = _packed_rows(db, dataset, rows, slicer)
+        last_key = rows[-1].row_index if rows else None
+    else:
+        query = db.query(SpectralSample).filter(SpectralSample.dataset_id == dataset.id)
+        if after is not None:
+            query = query.filter(SpectralSample.id > after)
+        rows = query.order_by(SpectralSample.id).offset(skip).limit(limit).all()
+        samples = [_json_row(db, s, slicer) for s in rows]
+        last_key = rows[-1].id if rows else None
+    return samples, (last_key if len(rows) == limit else None)
+
+
+SAMPLE_FIELDS = (
+    "id", "dataset_id", "sample_name", "sample_label", "wavelength_grid_id",
+    "wavelengths", "intensities", "properties", "created_at",
+)
+# 直接对应 SpectralSample 列的字段；光谱字段按存储模式另行读取
+_META_COLUMNS = ("id", "dataset_id", "sample_name", "sample_label", "properties", "created_at")
+
+
+def read_sample_fields(
+    db: Session, dataset: Dataset, fields: Sequence[str],
+    after: Optional[int], limit: int = 100, skip: int = 0,
+    selection: Optional[band_selection.BandSelection] = None
+) -> Tuple[dict, Optional[int]]:
+    """
+    只读取 fields 中的字段的一页样本，分页方式同 read_samples_after
+    SELECT 只包含请求的列；没有请求 wavelengths / intensities 时不读取光谱块、mmap 文件或 JSON 光谱列
+    一页样本共享同一条波长轴时，波长只在外层 wavelengths 返回一次，样本中不再重复
+    """
+    packed = get_storage_mode(dataset) != STORAGE_JSON
+    key = SpectralSample.row_index if packed else SpectralSample.id
+    slicer = band_selection.slicer(selection)
+    want_intensities = "intensities" in fields
+    # 裁剪强度时同样需要波长轴
+    want_wavelengths = "wavelengths" in fields or (slicer is not None and want_intensities)
+    want_grid = want_wavelengths or "wavelength_grid_id" in fields
+
+    columns = [key.label("sort_key")] + [getattr(SpectralSample, f) for f in fields if f in _META_COLUMNS]
+    if not packed:
+        if want_grid:
+            columns.append(SpectralSample.wavelength_grid_id.label("row_grid_id"))
+        if want_wavelengths:
+            columns.append(SpectralSample.wavelengths.label("row_wavelengths"))
+        if want_intensities:
+            columns.append(SpectralSample.intensities.label("row_intensities"))
+    query = db.query(*columns).filter(SpectralSample.dataset_id == dataset.id)
+    if after is not None:
+        query = query.filter(key > after)
+    rows = query.order_by(key).offset(skip).limit(limit).all()
+
+    # 每行的 (wavelength_grid_id, wavelengths, intensities)，未请求的部分为 None
+    spectra: List[tuple] = [(None, None, None)] * len(rows)
+    if rows and packed and (want_grid or want_intensities):
+        row_lo, row_hi = rows[0].sort_key, rows[-1].sort_key + 1
+        if dataset.is_ragged:
+            spectra = [
+                (grid_id, wavelengths if want_wavelengths else None, values)
+                for grid_id, wavelengths, values in _read_ragged_rows(db, dataset, row_lo, row_hi)
+            ]
+            spectra = [spectra[row.sort_key - row_lo] for row in rows]
+        else:
+            matrix = read_matrix(db, dataset, row_lo, row_hi) if want_intensities else None
+            axis = get_axis(db, dataset) if want_wavelengths else None
+            if slicer is not None and matrix is not None:
+                # 共享轴只解析一次，整块矩阵按列切片
+                axis, matrix = slicer.matrix(axis, matrix)
+            elif slicer is not None and axis is not None:
+                axis = slicer.axis(axis)
+            spectra = [
+                (dataset.wavelength_grid_id, axis,
+                 matrix[row.sort_key - row_lo] if matrix is not None else None)
+                for row in rows
+            ]
+    elif rows and not packed:
+        spectra = [
+            (
+                row.row_grid_id if want_grid else None,
+                (row.row_wavelengths if row.row_wavelengths is not None
+                 else wavelength_grids.load_grid(db, row.row_grid_id)) if want_wavelengths else None,
+                row.row_intensities if want_intensities else None,
+            )
+            for row in rows
+        ]
+    if slicer is not None and want_wavelengths and (not packed or dataset.is_ragged):
+        spectra = [
+            (grid_id,) + slicer.row(wavelengths, values, grid_id)
+            for grid_id, wavelengths, values in spectra
+        ]
+
+    # 同一 grid 的行裁剪结果相同，仍然可以共享一条轴；裁剪后的轴不再对应 grid id
+    grid_ids = {grid_id for grid_id, _, _ in spectra}
+    shared_grid = grid_ids.pop() if len(grid_ids) == 1 and rows else None
+    shared_axis = None
+    if "wavelengths" in fields and shared_grid is not None:
+        shared_axis = spectra[0][1]
+        if isinstance(shared_axis, np.ndarray):
+            shared_axis = shared_axis.tolist()
+
+    samples = []
+    for row, (grid_id, wavelengths, values) in zip(rows, spectra):
+        sample = {f: getattr(row, f) for f in fields if f in _META_COLUMNS}
+        if "wavelength_grid_id" in fields:
+            sample["wavelength_grid_id"] = grid_id if slicer is None else None
+        if "wavelengths" in fields and shared_axis is None:
+            sample["wavelengths"] = wavelengths.tolist() if isinstance(wavelengths, np.ndarray) else wavelengths
+        if want_intensities:
+            sample["intensities"] = values.tolist() if isinstance(values, np.ndarray) else values
+        if "properties" in sample:
+            sample["properties"] = sample["properties"] or {}
+        samples.append(sample)
+
+    page = {
+        "dataset_id": dataset.id,
+        "fields": list(fields),
+        "wavelength_grid_id": shared_grid if slicer is None else None,
+        "wavelengths": shared_axis,
+        "samples": samples,
+    }
+    last_key = rows[-1].sort_key if rows else None
+    return page, (last_key if len(rows) == limit else None)
+
+
+class SampleArrays(NamedTuple):
+    """
+    一页样本的数组形式，二进制响应直接由这些数组编码，不生成逐个浮点数的 Python 对象
+    稠密页: matrix 为 n x bands，wavelengths 为共享波长轴
+    不等长页: 第 i 行为 values[offsets[i]:offsets[i+1]]，波长为 row_wavelengths 的同一区间
+    """
+    ids: np.ndarray
+    names: List[str]
+    labels: List[Optional[str]]
+    grid_id: Optional[int] = None
+    wavelengths: Optional[np.ndarray] = None
+    matrix: Optional[np.ndarray] = None
+    offsets: Optional[np.ndarray] = None
+    values: Optional[np.ndarray] = None
+    row_grid_ids: Optional[List[Optional[int]]] = None
+    row_wavelengths: Optional[np.ndarray] = None
+
+    @property
+    def dense(self) -> bool:
+        return self.matrix is not None
+
+
+def _pack_rows(ids, names, labels, spectra) -> SampleArrays:
+    """逐行的 (grid_id, wavelengths, intensities) 合并为数组；全部共享一个波长轴时为稠密页"""
+    grid_ids = [grid_id for grid_id, _, _ in spectra]
+    if spectra and grid_ids[0] is not None and grid_ids.count(grid_ids[0]) == len(grid_ids):
+        return SampleArrays(
+            ids, names, labels, grid_ids[0], np.asarray(spectra[0][1], dtype=WAVELENGTH_DTYPE),
+            np.asarray([values for _, _, values in spectra], dtype=np.float64)
+        )
+    offsets = np.zeros(len(spectra) + 1, dtype=OFFSET_DTYPE)
+    np.cumsum([len(values) for _, _, values in spectra], out=offsets[1:])
+    return SampleArrays(
+        ids, names, labels,
+        offsets=offsets,
+        values=np.concatenate([np.asarray(v, dtype=np.float64) for _, _, v in spectra] or [np.zeros(0)]),
+        row_grid_ids=grid_ids,
+        row_wavelengths=np.concatenate(
+            [np.asarray(w, dtype=WAVELENGTH_DTYPE) for _, w, _ in spectra] or [np.zeros(0, WAVELENGTH_DTYPE)]
+        ),
+    )
+
+
+def read_sample_arrays(
+    db: Session, dataset: Dataset, after: Optional[int], limit: int = 100, skip: int = 0,
+    selection: Optional[band_selection.BandSelection] = None
+) -> Tuple[SampleArrays, Optional[int]]:
+    """
+    一页样本的数组形式，分页方式同 read_samples_after
+    columnar / mmap 的稠密数据集直接切片存储的矩阵（mmap 连续行时为文件视图，不复制）
+    有 selection 时按列切片，结果的 grid id 为 None
+    """
+    slicer = band_selection.slicer(selection)
+    packed = get_storage_mode(dataset) != STORAGE_JSON
+    key = SpectralSample.row_index if packed else SpectralSample.id
+    columns = [key.label("sort_key"), SpectralSample.id, SpectralSample.sample_name, SpectralSample.sample_label]
+    if not packed:
+        columns += [SpectralSample.wavelength_grid_id, SpectralSample.wavelengths, SpectralSample.intensities]
+    query = db.query(*columns).filter(SpectralSample.dataset_id == dataset.id)
+    if after is not None:
+        query = query.filter(key > after)
+    rows = query.order_by(key).offset(skip).limit(limit).all()
+
+    ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+    names = [row.sample_name for row in rows]
+    labels = [row.sample_label for row in rows]
+    last_key = rows[-1].sort_key if len(rows) == limit else None
+
+    if packed and not dataset.is_ragged and dataset.wavelength_grid_id is not None:
+        axis = np.asarray(get_axis(db, dataset), dtype=WAVELENGTH_DTYPE)
+        if not rows:
+            matrix = np.zeros((0, len(axis)))
+        else:
+            row_lo, row_hi = rows[0].sort_key, rows[-1].sort_key + 1
+            matrix = read_matrix(db, dataset, row_lo, row_hi)
+            if row_hi - row_lo != len(rows):
+                matrix = matrix[np.array([row.sort_key for row in rows]) - row_lo]
+        if slicer is not None:
+            axis, matrix = slicer.matrix(axis, matrix)
+            return SampleArrays(ids, names, labels, None, axis, matrix), last_key
+        return SampleArrays(ids, names, labels, dataset.wavelength_grid_id, axis, matrix), last_key
+
+    if packed:
+        spectra = []
+        if rows:
+            row_lo = rows[0].sort_key
+            ragged = _read_ragged_rows(db, dataset, row_lo, rows[-1].sort_key + 1)
+            spectra = [ragged[row.sort_key - row_lo] for row in rows]
+    else:
+        spectra = [
+            (row.wavelength_grid_id,
+             row.wavelengths if row.wavelengths is not None else wavelength_grids.load_grid(db, row.wavelength_grid_id),
+             row.intensities or [])
+            for row in rows
+        ]
+    if slicer is None:
+        return _pack_rows(ids, names, labels, spectra), last_key
+
+    # 同一 grid 的行裁剪结果相同，仍按 grid 判断能否合并为稠密页，之后去掉 grid id
+    spectra = [(grid_id,) + slicer.row(w, v, grid_id) for grid_id, w, v in spectra]
+    arrays = _pack_rows(ids, names, labels, spectra)
+    if arrays.dense:
+        return arrays._replace(grid_id=None), last_key
+    return arrays._replace(row_grid_ids=[None] * len(rows)), last_key
+
+
+def iter_sample_arrays(
+    db: Session, dataset: Dataset, after: Optional[int] = None,
+    batch_size: int = 1000, max_rows: Optional[int] = None,
+    selection: Optional[band_selection.BandSelection] = None
+) -> Iterator[SampleArrays]:
+    """从 after 之后按批读取样本数组，最多 max_rows 行"""
+    remaining = max_rows
+    while remaining is None or remaining > 0:
+        limit = batch_size if remaining is None else min(batch_size, remaining)
+        arrays, after = read_sample_arrays(db, dataset, after, limit, selection=selection)
+        if len(arrays.ids):
+            yield arrays
+        if after is None:
+            return
+        if remaining is not None:
+            remaining -= len(arrays.ids)
+
+
+def count_samples_after(db: Session, dataset: Dataset, after: Optional[int]) -> int:
+    key = SpectralSample.id if get_storage_mode(dataset) == STORAGE_JSON else SpectralSample.row_index
+    query = db.query(func.count(SpectralSample.id)).filter(SpectralSample.dataset_id == dataset.id)
+    if after is not None:
+        query = query.filter(key > after)
+    return query.scalar() or 0
+
+
+def iter_samples(
+    db: Session, dataset: Dataset, batch_size: int = 1000,
+    selection: Optional[band_selection.BandSelection] = None, skip: int = 0
+) -> Iterator[dict]:
+    """按存储顺序遍历数据集的全部样本，selection 为波段裁剪条件，skip 跳过前面的样本"""
+    slicer = band_selection.slicer(selection)
+    if get_storage_mode(dataset) != STORAGE_JSON:
+        row_lo = 0
+        while True:
+            rows = _meta_query(db, dataset).filter(
+                SpectralSample.row_index >= row_lo
+            ).order_by(SpectralSample.row_index).offset(skip).limit(batch_size).all()
+            if not rows:
+                return
+            yield from _packed_rows(db, dataset, rows, slicer)
+            row_lo = rows[-1].row_index + 1
+            skip = 0
+
+    query = db.query(SpectralSample).filter(
+        SpectralSample.dataset_id == dataset.id
+    ).order_by(SpectralSample.id).offset(skip).yield_per(batch_size)
+    for s in query:
+        yield _json_row(db, s, slicer)
+
+
+# ---------------------------------------------------------------------------
+# 迁移
+# ---------------------------------------------------------------------------
+
+def convert_dataset(
+    db: Session,
+    dataset: Dataset,
+    target_mode: str,
+    codec: Optional[str] = None,
+    batch_size: int = 1000,
+) -> int:
+    """
+    把 json 数据集的样本行转换为 columnar / mmap 存储，返回转换的样本数
+    mmap 要求所有样本共享同一条波长轴；不提交事务，由调用方 commit
+    """
+    if target_mode not in (STORAGE_COLUMNAR, STORAGE_MMAP):
+        raise ValueError(f"Cannot convert to storage mode '{target_mode}'")
+    if get_storage_mode(dataset) != STORAGE_JSON:
+        raise ValueError(f"Dataset {dataset.id} is already stored as '{dataset.storage_mode}'")
+
+    _lock_dataset(db, dataset)
+    dataset.storage_mode = target_mode
+    dataset.wavelength_grid_id = None
+    # 转换会重新编号 row_index：先清空旧编号，逐批赋值时不会与 (dataset_id, row_index) 唯一索引冲突；
+    # 金字塔随每批样本重建
+    db.query(SpectralSample).filter(SpectralSample.dataset_id == dataset.id).update(
+        {SpectralSample.row_index: None}
+    )
+    db.query(SpectralLOD).filter(SpectralLOD.dataset_id == dataset.id).delete(synchronize_session=False)
+    converted = 0
+    last_id = 0
+    while True:
+        rows = db.query(SpectralSample).filter(
+            SpectralSample.dataset_id == dataset.id,
+            SpectralSample.id > last_id
+        ).order_by(SpectralSample.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        axes = [[float(w) for w in (_row_wavelengths(db, s) or [])] for s in rows]
+        values = [s.intensities or [] for s in rows]
+        uniform = all(axis == axes[0] for axis in axes) and all(len(v) == len(axes[0]) for v in values)
+
+        if uniform and _matches_axis(db, dataset, axes[0]):
+            dtype = _bind_axis(db, dataset, axes[0], codec)
+            matrix = np.array(values, dtype=np.float64).reshape(len(rows), len(axes[0]))
+            if target_mode == STORAGE_COLUMNAR:
+                _append_chunks(db, dataset, dtype, matrix, converted)
+            else:
+                _append_mmap(dataset, dtype, matrix, converted)
+            lod.store_matrix(db, dataset, converted, axes[0], matrix)
+        elif target_mode == STORAGE_COLUMNAR:
+            dtype = _bind_storage(dataset, codec)
+            offsets = np.zeros(len(rows) + 1, dtype=OFFSET_DTYPE)
+            np.cumsum([len(v) for v in values], out=offsets[1:])
+            _append_ragged_chunks(
+                db, dataset, dtype, offsets,
+                np.concatenate([np.asarray(a, dtype=WAVELENGTH_DTYPE) for a in axes]),
+                np.concatenate([np.asarray(v, dtype=np.float64) for v in values]),
+                converted
+            )
+            lod.store_rows(db, dataset, converted, axes, values)
+        else:
+            raise ValueError(f"Dataset {dataset.id} has samples on different wavelength axes")
+
+        for i, s in enumerate(rows):
+            s.row_index = converted + i
+            s.wavelengths = None
+            s.wavelength_grid_id = None
+            s.intensities = None
+
+        converted += len(rows)
+        last_id = rows[-1].id
+        db.flush()
+
+    if converted:
+        # 有损编码或 float32 转换后数据不再相同，导出、密度图和 ETag 都要失效
+        bump_data_version(dataset)
+    return converted
+
+
+def dedupe_wavelengths(db: Session, dataset: Dataset, batch_size: int = 1000) -> int:
+    """
+    json 数据集保留原存储方式，只把每行自带的波长数组替换为共享波长轴引用
+    返回处理的样本数；不提交事务，由调用方 commit
+    """
+    updated = 0
+    last_id = 0
+    grid_ids = {}
+    while True:
+        rows = db.query(SpectralSample).filter(
+            SpectralSample.dataset_id == dataset.id,
+            SpectralSample.id > last_id
+        ).order_by(SpectralSample.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        for s in rows:
+            if s.wavelengths is not None:
+                key = wavelength_grids.grid_hash(s.wavelengths)
+                if key not in grid_ids:
+                    grid_ids[key] = wavelength_grids.get_or_create_grid(db, s.wavelengths).id
+                s.wavelength_grid_id = grid_ids[key]
+                s.wavelengths = None
+                updated += 1
+
+        last_id = rows[-1].id
+        db.flush()
+
+    return updated
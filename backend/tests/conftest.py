@@ -0,0 +1,76 @@
+"""
+测试环境：导入后端模块之前把数据库、上传和导出目录指向临时目录
+"""
+import os
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="spectranet-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_TMP, "test.db")
+os.environ["UPLOAD_DIR"] = os.path.join(_TMP, "uploads")
+os.environ["EXPORT_DIR"] = os.path.join(_TMP, "exports")
+os.environ["SPECTRA_DIR"] = os.path.join(_TMP, "spectra")
+os.environ["UPLOAD_PARTIAL_DIR"] = os.path.join(_TMP, "partial")
+os.environ["INGEST_WORKERS"] = "0"
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main  # 建表并执行迁移
+import spectral_storage
+from auth import get_password_hash
+from database import SessionLocal
+from models import Dataset, User
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_dataset(db):
+    """在指定存储模式下创建空数据集"""
+    def make(storage_mode: str, name: str = "test") -> Dataset:
+        dataset = Dataset(name=name, storage_mode=storage_mode)
+        db.add(dataset)
+        db.commit()
+        return dataset
+    return make
+
+
+@pytest.fixture(scope="session")
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    """超级用户的 Authorization 头"""
+    session = SessionLocal()
+    session.add(User(
+        username="admin", email="admin@example.com",
+        hashed_password=get_password_hash("secret1"), is_superuser=True, is_admin=True
+    ))
+    session.commit()
+    session.close()
+    token = client.post("/api/auth/login", data={"username": "admin", "password": "secret1"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def filled_dataset(db, make_dataset):
+    """创建数据集并写入 num_samples 个样本（第 i 行为 i*bands .. (i+1)*bands-1），返回数据集 id"""
+    def make(wavelengths, num_samples: int, storage_mode: str = spectral_storage.STORAGE_COLUMNAR) -> int:
+        dataset = make_dataset(storage_mode, name="routes")
+        matrix = np.arange(num_samples * len(wavelengths), dtype=np.float64).reshape(num_samples, -1)
+        names = [f"s{i}" for i in range(num_samples)]
+        spectral_storage.append_samples(db, dataset, wavelengths, matrix, names, [None] * num_samples)
+        dataset.num_samples = num_samples
+        db.commit()
+        return dataset.id
+    return make
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import spectral_storage
+from band_selection import MAX_BANDS, BandSelection, _parse_bands
+
+ASCENDING = [400.0, 410.0, 420.0, 430.0, 440.0, 450.0]
+
+
+def _picked(selector, axis):
+    return np.asarray(axis)[selector].tolist()
+
+
+def test_ascending_range():
+    selector = BandSelection(wl_min=410, wl_max=440).resolve(ASCENDING)
+    assert selector == slice(1, 5, 1)
+    assert _picked(selector, ASCENDING) == [410.0, 420.0, 430.0, 440.0]
+
+
+def test_ascending_open_range_and_step():
+    selector = BandSelection(wl_min=415, step=2).resolve(ASCENDING)
+    assert _picked(selector, ASCENDING) == [420.0, 440.0]
+
+
+def test_descending_range():
+    axis = ASCENDING[::-1]
+    selector = BandSelection(wl_min=410, wl_max=440).resolve(axis)
+    assert isinstance(selector, slice)
+    assert _picked(selector, axis) == [440.0, 430.0, 420.0, 410.0]
+
+
+def test_non_monotonic_range():
+    axis = [420.0, 400.0, 450.0, 410.0, 430.0]
+    selector = BandSelection(wl_min=405, wl_max=435).resolve(axis)
+    assert _picked(selector, axis) == [420.0, 410.0, 430.0]
+
+
+def test_non_monotonic_with_bands():
+    axis = [420.0, 400.0, 450.0, 410.0, 430.0]
+    selector = BandSelection(wl_min=405, wl_max=435, bands=(0, 1, 4)).resolve(axis)
+    assert _picked(selector, axis) == [420.0, 430.0]
+
+
+def test_bands_within_range():
+    selector = BandSelection(wl_max=430, bands=(0, 2, 5)).resolve(ASCENDING)
+    assert _picked(selector, ASCENDING) == [400.0, 420.0]
+
+
+def test_empty_range():
+    selector = BandSelection(wl_min=500).resolve(ASCENDING)
+    assert _picked(selector, ASCENDING) == []
+
+
+def test_parse_bands():
+    assert _parse_bands("5, 0,2-4,3") == (0, 2, 3, 4, 5)
+    assert _parse_bands(f"0-{MAX_BANDS - 1}") == tuple(range(MAX_BANDS))
+
+
+@pytest.mark.parametrize("value", ["0-1000000000000", f"0-{MAX_BANDS}", f"1,0-{MAX_BANDS - 1}", "a-b", "-3"])
+def test_parse_bands_rejects(value):
+    with pytest.raises(HTTPException) as info:
+        _parse_bands(value)
+    assert info.value.status_code == 400
+
+
+def test_samples_route_slicing(client, filled_dataset):
+    axis = [400.0 + 10 * i for i in range(8)]
+    url = f"/api/datasets/{filled_dataset(axis, 2)}/samples"
+
+    samples = client.get(url, params={"wl_min": 415, "wl_max": 450, "step": 2}).json()
+    assert samples[0]["wavelengths"] == [420.0, 440.0]
+    assert samples[1]["intensities"] == [10.0, 12.0]
+
+    samples = client.get(url, params={"bands": "0,6-7"}).json()
+    assert samples[0]["wavelengths"] == [400.0, 460.0, 470.0]
+
+    assert client.get(url, params={"bands": "0-1000000000000"}).status_code == 400
+    assert client.get(url, params={"wl_min": 500, "wl_max": 400}).status_code == 400
+
+
+@pytest.mark.parametrize("mode", spectral_storage.STORAGE_MODES)
+def test_sliced_fields_page(client, filled_dataset, mode):
+    axis = [400.0 + 10 * i for i in range(8)]
+    url = f"/api/datasets/{filled_dataset(axis, 2, mode)}/samples"
+    page = client.get(url, params={"fields": "wavelengths,intensities", "wl_max": 420}).json()
+
+    # 裁剪后的轴仍在外层共享，但不再对应 grid id
+    assert page["wavelengths"] == [400.0, 410.0, 420.0]
+    assert page["wavelength_grid_id"] is None
+    assert [s["intensities"] for s in page["samples"]] == [[0.0, 1.0, 2.0], [8.0, 9.0, 10.0]]
@@ -0,0 +1,77 @@
+import gzip
+
+import numpy as np
+
+import spectral_storage
+from models import Dataset
+
+WAVELENGTHS = [400.0 + 10 * i for i in range(8)]
+NUM_SAMPLES = 5
+
+
+def test_download_etag_and_range(client, auth_headers, filled_dataset, db):
+    did = filled_dataset(WAVELENGTHS, NUM_SAMPLES)
+    url = f"/api/datasets/{did}/download"
+
+    # 第一次下载边生成边发送，第二次从缓存的导出文件发送
+    first = client.get(url, headers=auth_headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    body = first.content
+    assert body.count(b"\n") >= NUM_SAMPLES
+    cached = client.get(url, headers=auth_headers)
+    assert cached.status_code == 200 and cached.content == body and cached.headers["etag"] == etag
+
+    not_modified = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == etag
+
+    partial = client.get(url, headers={**auth_headers, "Range": "bytes=10-29"})
+    assert partial.status_code == 206
+    assert partial.content == body[10:30]
+    assert partial.headers["content-range"] == f"bytes 10-29/{len(body)}"
+
+    resumed = client.get(url, headers={**auth_headers, "Range": "bytes=10-", "If-Range": etag})
+    assert resumed.status_code == 206 and resumed.content == body[10:]
+    stale = client.get(url, headers={**auth_headers, "Range": "bytes=10-", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and stale.content == body
+
+    # 带 Range 的请求不计下载次数
+    db.expire_all()
+    assert db.get(Dataset, did).download_count == 2
+
+
+def test_download_etag_changes_with_data(client, auth_headers, filled_dataset, db):
+    did = filled_dataset(WAVELENGTHS, NUM_SAMPLES)
+    url = f"/api/datasets/{did}/download"
+    etag = client.get(url, headers=auth_headers).headers["etag"]
+
+    dataset = db.get(Dataset, did)
+    spectral_storage.append_samples(db, dataset, WAVELENGTHS, np.ones((1, len(WAVELENGTHS))), ["extra"], [None])
+    db.commit()
+
+    response = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert b"extra" in response.content
+
+
+def test_gzip_download(client, auth_headers, filled_dataset):
+    url = f"/api/datasets/{filled_dataset(WAVELENGTHS, NUM_SAMPLES)}/download"
+    plain = client.get(url, headers=auth_headers)
+    compressed = client.get(url, params={"compression": "gzip"}, headers=auth_headers)
+
+    assert compressed.status_code == 200
+    assert compressed.headers["etag"] != plain.headers["etag"]
+    assert gzip.decompress(compressed.content) == plain.content
+
+    # 缓存的 .csv.gz 同样支持续传
+    resumed = client.get(url, params={"compression": "gzip"}, headers={**auth_headers, "Range": "bytes=5-"})
+    assert resumed.status_code == 206 and resumed.content == compressed.content[5:]
+
+
+def test_download_requires_login_and_data(client, auth_headers, filled_dataset, make_dataset):
+    url = f"/api/datasets/{filled_dataset(WAVELENGTHS, NUM_SAMPLES)}/download"
+    assert client.get(url).status_code == 401
+    empty = make_dataset(spectral_storage.STORAGE_JSON)
+    assert client.get(f"/api/datasets/{empty.id}/download", headers=auth_headers).status_code == 404
@@ -0,0 +1,97 @@
+import pytest
+
+import http_cache
+from models import Dataset, User
+
+
+@pytest.fixture
+def dataset(db, auth_headers):
+    owner = db.query(User).filter(User.username == "admin").one()
+    dataset = Dataset(name="cached", description="http-cache", owner_id=owner.id)
+    db.add(dataset)
+    db.commit()
+    return dataset
+
+
+def _revalidate(client, url, response):
+    return client.get(url, headers={"If-None-Match": response.headers["etag"]})
+
+
+def test_detail_revalidation_does_not_count_views(client, db, dataset):
+    url = f"/api/datasets/{dataset.id}"
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.json()["view_count"] == 1
+    assert "last-modified" not in first.headers
+
+    not_modified = _revalidate(client, url, first)
+    assert not_modified.status_code == 304
+    db.expire_all()
+    assert db.get(Dataset, dataset.id).view_count == 1
+
+    # 别人的浏览让缓存的浏览量过期
+    client.get(url)
+    again = _revalidate(client, url, first)
+    assert again.status_code == 200
+    assert again.json()["view_count"] == 3
+
+
+def test_detail_etag_follows_downloads_and_owner(client, db, dataset):
+    url = f"/api/datasets/{dataset.id}"
+    first = client.get(url)
+
+    http_cache.increment_counter(db, dataset, Dataset.download_count)
+    db.commit()
+    after_download = _revalidate(client, url, first)
+    assert after_download.status_code == 200
+    assert after_download.json()["download_count"] == 1
+
+    owner = db.query(User).filter(User.username == "admin").one()
+    owner.full_name = "Renamed Owner"
+    db.commit()
+    after_owner = _revalidate(client, url, after_download)
+    assert after_owner.status_code == 200
+    assert after_owner.json()["owner"]["full_name"] == "Renamed Owner"
+
+
+def test_list_etag_follows_counters(client, db, dataset):
+    url = "/api/datasets/?search=http-cache"
+    first = client.get(url)
+    assert first.status_code == 200
+    assert "last-modified" not in first.headers
+    assert _revalidate(client, url, first).status_code == 304
+
+    # 计数不改变 updated_at，但列表里的计数变了
+    client.get(f"/api/datasets/{dataset.id}")
+    after_view = _revalidate(client, url, first)
+    assert after_view.status_code == 200
+    assert after_view.json()[-1]["view_count"] == 1
+
+
+def test_stats_etag_follows_downloads(client, db, dataset):
+    first = client.get("/api/stats/")
+    assert _revalidate(client, "/api/stats/", first).status_code == 304
+
+    http_cache.increment_counter(db, dataset, Dataset.download_count)
+    db.commit()
+    after = _revalidate(client, "/api/stats/", first)
+    assert after.status_code == 200
+    assert after.json()["total_downloads"] == first.json()["total_downloads"] + 1
+
+
+def test_category_tree_last_modified(client):
+    first = client.get("/api/categories/tree")
+    assert first.status_code == 200
+    assert _revalidate(client, "/api/categories/tree", first).status_code == 304
+    since = client.get("/api/categories/tree", headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert since.status_code == 304
+
+
+def test_etag_matches():
+    etag = http_cache.weak_etag("datasets", 3, None, 1, 2)
+    assert etag == 'W/"datasets-3-0-1-2"'
+    assert http_cache.etag_matches(etag, etag)
+    assert http_cache.etag_matches('"datasets-3-0-1-2"', etag)
+    assert http_cache.etag_matches('"other", *', etag)
+    assert not http_cache.etag_matches('W/"datasets-3-0-1-3"', etag)
+    assert not http_cache.etag_matches(None, etag)
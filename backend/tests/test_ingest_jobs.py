@@ -0,0 +1,115 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+import ingest_jobs
+import spectral_storage
+from database import SessionLocal
+from models import Dataset, IngestJob, SpectralSample
+
+HEADER = "sample_name,400,410,420\n"
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(ingest_jobs.settings, "INGEST_BATCH_ROWS", 2)
+    monkeypatch.setattr(ingest_jobs.settings, "INGEST_READ_SIZE", 32)
+
+
+def _rows(start, count):
+    return "".join(f"s{i},{i},{i + 0.5},{i + 1}\n" for i in range(start, start + count))
+
+
+def _enqueue(db, dataset, text):
+    os.makedirs(ingest_jobs.jobs_dir(), exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=".csv", dir=ingest_jobs.jobs_dir())
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    return ingest_jobs.enqueue_job(db, dataset, None, ingest_jobs.KIND_SAMPLES, path, len(text))
+
+
+def _count(db, dataset):
+    return db.query(SpectralSample).filter(SpectralSample.dataset_id == dataset.id).count()
+
+
+def test_job_imports_samples(db, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_COLUMNAR)
+    job = _enqueue(db, dataset, HEADER + _rows(0, 5))
+    assert ingest_jobs.claim_job(db, "w1") == job.id
+    ingest_jobs.run_job(job.id, "w1")
+
+    db.expire_all()
+    job = db.get(IngestJob, job.id)
+    assert job.status == ingest_jobs.JOB_DONE
+    assert job.rows_inserted == 5 and job.result["num_samples"] == 5
+    assert not os.path.exists(job.file_path)
+    assert db.get(Dataset, dataset.id).num_samples == 5
+    assert ingest_jobs.job_status(job)["rows_parsed"] == 5
+
+
+def test_batches_commit_while_job_runs(db, make_dataset, monkeypatch):
+    dataset = make_dataset(spectral_storage.STORAGE_COLUMNAR)
+    job = _enqueue(db, dataset, HEADER + _rows(0, 6))
+    ingest_jobs.claim_job(db, "w1")
+
+    # 每批提交后，另一个连接可以立即写入并看到已提交的行和心跳
+    seen = []
+    commit_batch = ingest_jobs._Checkpoint.__call__
+
+    def checkpoint(self, rows_written):
+        commit_batch(self, rows_written)
+        other = SessionLocal()
+        try:
+            other.execute(update(Dataset).where(Dataset.id == dataset.id).values(view_count=Dataset.view_count + 1))
+            other.commit()
+            seen.append((_count(other, dataset), other.get(IngestJob, job.id).rows_inserted))
+        finally:
+            other.close()
+
+    monkeypatch.setattr(ingest_jobs._Checkpoint, "__call__", checkpoint)
+    ingest_jobs.run_job(job.id, "w1")
+    assert seen == [(2, 2), (4, 4), (6, 6)]
+
+
+def test_failed_job_keeps_committed_batches(db, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_COLUMNAR)
+    job = _enqueue(db, dataset, HEADER + _rows(0, 4) + "bad,row\n")
+    ingest_jobs.claim_job(db, "w1")
+    ingest_jobs.run_job(job.id, "w1")
+
+    db.expire_all()
+    job = db.get(IngestJob, job.id)
+    assert job.status == ingest_jobs.JOB_FAILED and job.error
+    assert job.rows_inserted == _count(db, dataset) > 0
+    assert db.get(Dataset, dataset.id).num_samples == job.rows_inserted
+
+
+def test_stale_job_is_failed_once(db, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_COLUMNAR)
+    job = _enqueue(db, dataset, HEADER + _rows(0, 3))
+    ingest_jobs.claim_job(db, "w1")
+    # worker 没有心跳超过 INGEST_JOB_TIMEOUT
+    stale = datetime.utcnow() - timedelta(seconds=ingest_jobs.settings.INGEST_JOB_TIMEOUT + 1)
+    db.execute(update(IngestJob).where(IngestJob.id == job.id).values(heartbeat_at=stale, started_at=stale))
+    db.commit()
+
+    assert ingest_jobs.fail_stale_jobs(db) == 1
+    assert ingest_jobs.fail_stale_jobs(db) == 0
+
+    # 原 worker 继续运行时第一批的提交就不再匹配，什么都不写入
+    ingest_jobs.run_job(job.id, "w1")
+    db.expire_all()
+    job = db.get(IngestJob, job.id)
+    assert job.status == ingest_jobs.JOB_FAILED and job.error == "Job timed out"
+    assert _count(db, dataset) == 0
+
+
+def test_one_running_job_per_dataset(db, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_COLUMNAR)
+    first = _enqueue(db, dataset, HEADER + _rows(0, 1))
+    _enqueue(db, dataset, HEADER + _rows(1, 1))
+    assert ingest_jobs.claim_job(db, "w1") == first.id
+    assert ingest_jobs.claim_job(db, "w2") is None
@@ -0,0 +1,64 @@
+import pytest
+
+import pagination
+import spectral_storage
+from models import Dataset, User
+
+WAVELENGTHS = [400.0 + 10 * i for i in range(8)]
+NUM_SAMPLES = 5
+
+
+def _pages(client, url, limit, **params):
+    """按 X-Next-Cursor 依次读取所有页"""
+    pages, after = [], None
+    while True:
+        query = {"limit": limit, **params}
+        if after is not None:
+            query["after"] = after
+        response = client.get(url, params=query)
+        assert response.status_code == 200
+        pages.append(response.json())
+        after = response.headers.get(pagination.NEXT_CURSOR_HEADER)
+        if after is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    cursor = pagination.encode_cursor("datasets", 42)
+    assert pagination.decode_cursor(cursor, "datasets") == 42
+
+
+@pytest.mark.parametrize("mode", spectral_storage.STORAGE_MODES)
+def test_sample_cursor_pagination(client, filled_dataset, mode):
+    url = f"/api/datasets/{filled_dataset(WAVELENGTHS, NUM_SAMPLES, mode)}/samples"
+    pages = _pages(client, url, limit=2)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [s["sample_name"] for page in pages for s in page] == [f"s{i}" for i in range(NUM_SAMPLES)]
+
+
+def test_skip_still_works(client, filled_dataset):
+    url = f"/api/datasets/{filled_dataset(WAVELENGTHS, NUM_SAMPLES)}/samples"
+    samples = client.get(url, params={"skip": 3}).json()
+    assert [s["sample_name"] for s in samples] == ["s3", "s4"]
+
+
+def test_dataset_cursor_pagination(client, auth_headers, db):
+    owner = db.query(User).filter(User.username == "admin").one()
+    db.add_all([Dataset(name=f"paged-{i}", description="cursor-list", owner_id=owner.id) for i in range(3)])
+    db.add(Dataset(name="paged-private", description="cursor-list", owner_id=owner.id, is_public=False))
+    db.commit()
+
+    pages = _pages(client, "/api/datasets/", limit=2, search="cursor-list")
+    names = [d["name"] for page in pages for d in page]
+    assert names == ["paged-0", "paged-1", "paged-2"]
+
+
+def test_cursor_errors(client, filled_dataset):
+    url = f"/api/datasets/{filled_dataset(WAVELENGTHS, NUM_SAMPLES)}/samples"
+    assert client.get(url, params={"after": "not-a-cursor"}).status_code == 400
+    # 其他列表的游标不能用在这里
+    other = pagination.encode_cursor("samples:0:row_index", 1)
+    assert client.get(url, params={"after": other}).status_code == 400
+    assert client.get("/api/datasets/", params={"after": other}).status_code == 400
+    cursor = client.get(url, params={"limit": 1}).headers[pagination.NEXT_CURSOR_HEADER]
+    assert client.get(url, params={"after": cursor, "skip": 1}).status_code == 400
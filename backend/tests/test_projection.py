@@ -0,0 +1,63 @@
+import pytest
+
+import spectral_storage
+from models import Dataset, User
+
+WAVELENGTHS = [400.0 + 10 * i for i in range(8)]
+NUM_SAMPLES = 3
+
+
+@pytest.mark.parametrize("mode", spectral_storage.STORAGE_MODES)
+def test_sample_fields_share_wavelengths(client, filled_dataset, mode):
+    url = f"/api/datasets/{filled_dataset(WAVELENGTHS, NUM_SAMPLES, mode)}/samples"
+    page = client.get(url, params={"fields": "sample_name,wavelengths,intensities"}).json()
+
+    assert page["fields"] == ["id", "sample_name", "wavelengths", "intensities"]
+    # 整页共享的波长轴只在外层返回一次
+    assert page["wavelengths"] == WAVELENGTHS
+    assert page["wavelength_grid_id"] is not None
+    for sample in page["samples"]:
+        assert set(sample) == {"id", "sample_name", "intensities"}
+    assert [s["sample_name"] for s in page["samples"]] == ["s0", "s1", "s2"]
+    assert page["samples"][1]["intensities"] == [float(v) for v in range(8, 16)]
+
+
+@pytest.mark.parametrize("mode", spectral_storage.STORAGE_MODES)
+def test_sample_fields_without_spectra(client, filled_dataset, mode):
+    url = f"/api/datasets/{filled_dataset(WAVELENGTHS, NUM_SAMPLES, mode)}/samples"
+    page = client.get(url, params={"fields": "sample_name,properties"}).json()
+
+    assert page["wavelengths"] is None
+    assert page["samples"][0] == {"id": page["samples"][0]["id"], "sample_name": "s0", "properties": {}}
+
+
+def test_ragged_rows_keep_their_own_axis(client, db, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_JSON)
+    spectral_storage.append_ragged_samples(
+        db, dataset, [[1.0, 2.0], [1.0, 2.0, 3.0]], [[5.0, 6.0], [7.0, 8.0, 9.0]], ["a", "b"], [None, None]
+    )
+    db.commit()
+
+    page = client.get(
+        f"/api/datasets/{dataset.id}/samples", params={"fields": "wavelengths,intensities"}
+    ).json()
+    assert page["wavelengths"] is None
+    assert [s["wavelengths"] for s in page["samples"]] == [[1.0, 2.0], [1.0, 2.0, 3.0]]
+
+
+def test_dataset_list_fields(client, auth_headers, db):
+    owner = db.query(User).filter(User.username == "admin").one()
+    db.add(Dataset(name="projected", description="fields-list", owner_id=owner.id, extra_metadata={"a": 1}))
+    db.commit()
+
+    rows = client.get("/api/datasets/", params={"fields": "name,num_samples", "search": "fields-list"}).json()
+    assert len(rows) == 1
+    assert set(rows[0]) == {"id", "name", "num_samples"}
+    assert rows[0]["name"] == "projected"
+
+
+def test_unknown_fields(client, filled_dataset):
+    url = f"/api/datasets/{filled_dataset(WAVELENGTHS, NUM_SAMPLES)}/samples"
+    assert client.get(url, params={"fields": "sample_name,bogus"}).status_code == 400
+    assert client.get(url, params={"fields": ","}).status_code == 400
+    assert client.get("/api/datasets/", params={"fields": "password"}).status_code == 400
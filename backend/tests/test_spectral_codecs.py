@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+import spectral_codecs
+import spectral_storage
+
+WAVELENGTHS = [400.0 + 10 * i for i in range(64)]
+
+
+def _matrix(dtype):
+    rng = np.random.default_rng(0)
+    return (rng.random((5, len(WAVELENGTHS))) * 100).astype(dtype)
+
+
+@pytest.mark.parametrize("dtype", [np.dtype("<f4"), np.dtype("<f8")])
+@pytest.mark.parametrize("codec", [spectral_codecs.RAW, spectral_codecs.SHUFFLE_ZLIB, spectral_codecs.DELTA_LZMA])
+def test_lossless_round_trip(codec, dtype):
+    matrix = _matrix(dtype)
+    matrix[1, 3] = np.nan
+    data = spectral_codecs.encode(matrix, codec, dtype)
+    decoded = spectral_codecs.decode(data, codec, dtype, *matrix.shape)
+    assert decoded.dtype == dtype
+    np.testing.assert_array_equal(decoded, matrix)
+
+
+def test_float16_round_trip():
+    dtype = np.dtype("<f8")
+    matrix = _matrix(dtype)
+    matrix[0, 0] = np.nan
+    data = spectral_codecs.encode(matrix, spectral_codecs.FLOAT16, dtype)
+    decoded = spectral_codecs.decode(data, spectral_codecs.FLOAT16, dtype, *matrix.shape)
+    assert decoded.dtype == np.dtype("<f2")
+    np.testing.assert_allclose(decoded, matrix, rtol=1e-3)
+    assert np.isnan(decoded[0, 0])
+
+
+def test_int16_round_trip_keeps_nan():
+    dtype = np.dtype("<f8")
+    matrix = _matrix(dtype)
+    matrix[2, 5] = np.nan
+    matrix[4, 0] = np.inf
+    data = spectral_codecs.encode(matrix, spectral_codecs.INT16, dtype)
+    decoded = spectral_codecs.decode(data, spectral_codecs.INT16, dtype, *matrix.shape)
+    finite = np.isfinite(matrix)
+    step = (matrix[finite].max() - matrix[finite].min()) / 65534
+    np.testing.assert_allclose(decoded[finite], matrix[finite], atol=step)
+    assert np.isnan(decoded[2, 5]) and np.isnan(decoded[4, 0])
+
+
+@pytest.mark.parametrize("value", [0.0, 7.5, np.nan])
+def test_int16_constant_matrix(value):
+    dtype = np.dtype("<f8")
+    matrix = np.full((2, 8), value)
+    data = spectral_codecs.encode(matrix, spectral_codecs.INT16, dtype)
+    decoded = spectral_codecs.decode(data, spectral_codecs.INT16, dtype, *matrix.shape)
+    np.testing.assert_array_equal(decoded, matrix)
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        spectral_codecs.validate_codec("lz4")
+
+
+@pytest.mark.parametrize("codec", spectral_codecs.CODECS)
+def test_columnar_dataset_codec(db, make_dataset, codec):
+    dataset = make_dataset(spectral_storage.STORAGE_COLUMNAR)
+    matrix = _matrix(np.float64)
+    spectral_storage.append_samples(db, dataset, WAVELENGTHS, matrix, ["a"] * 5, [None] * 5, codec=codec)
+    db.commit()
+
+    assert dataset.storage_codec == codec
+    stored = spectral_storage.read_matrix(db, dataset, 0, 5)
+    if codec in spectral_codecs.LOSSY_CODECS:
+        np.testing.assert_allclose(stored, matrix, rtol=1e-3, atol=1e-2)
+    else:
+        np.testing.assert_array_equal(stored, matrix)
+
+    # 编码器在第一次写入时确定
+    with pytest.raises(ValueError):
+        other = spectral_codecs.RAW if codec != spectral_codecs.RAW else spectral_codecs.INT16
+        spectral_storage.append_samples(db, dataset, WAVELENGTHS, matrix, ["b"] * 5, [None] * 5, codec=other)
+    db.rollback()
+
+
+def test_mmap_rejects_lossy_codec(db, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_MMAP)
+    with pytest.raises(ValueError):
+        spectral_storage.append_samples(db, dataset, WAVELENGTHS, _matrix(np.float64), ["a"] * 5, [None] * 5, codec="int16")
+    db.rollback()
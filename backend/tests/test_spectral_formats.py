@@ -0,0 +1,127 @@
+import struct
+
+import numpy as np
+import pytest
+
+import spectral_formats
+import spectral_storage
+
+
+JCAMP = """##TITLE=first
+##JCAMP-DX=4.24
+##FIRSTX=400
+##LASTX=403
+##NPOINTS=4
+##XFACTOR=1
+##YFACTOR=0.5
+##$LABEL=a
+##XYDATA=(X++(Y..Y))
+400 10 12 14 16
+##END=
+##TITLE=second
+##XYPOINTS=(XY..XY)
+400, 1; 401, 2; 402, 3; 403, 4
+##END=
+"""
+
+
+def _spc(path, ys, first=1000.0, last=1002.0):
+    """单个子文件、等间隔 X、float32 Y 的新格式 SPC"""
+    fields = list(struct.unpack("<" + spectral_formats._SPC_HEADER, bytes(512)))
+    fields[1] = 0x4B
+    fields[3] = -128
+    fields[4] = len(ys)
+    fields[5] = first
+    fields[6] = last
+    header = struct.pack("<" + spectral_formats._SPC_HEADER, *fields)
+    subheader = struct.pack("<" + spectral_formats._SPC_SUBHEADER, 0, -128, 0, 0, 0, 0, len(ys), 0, 0, b"")
+    with open(path, "wb") as f:
+        f.write(header + subheader + np.asarray(ys, dtype="<f4").tobytes())
+
+
+def test_jcamp_blocks(tmp_path):
+    path = tmp_path / "run.jdx"
+    path.write_text(JCAMP)
+    blocks = list(spectral_formats.iter_jcamp(str(path)))
+
+    assert [b.names for b in blocks] == [["first"], ["second"]]
+    assert [b.labels for b in blocks] == [["a"], [None]]
+    assert blocks[0].wavelengths.tolist() == [400.0, 401.0, 402.0, 403.0]
+    assert blocks[0].intensities.tolist() == [[5.0, 6.0, 7.0, 8.0]]
+    assert blocks[1].intensities.tolist() == [[1.0, 2.0, 3.0, 4.0]]
+
+
+def test_jcamp_without_data(tmp_path):
+    path = tmp_path / "empty.jdx"
+    path.write_text("##TITLE=nothing\n##END=\n")
+    with pytest.raises(ValueError):
+        list(spectral_formats.iter_jcamp(str(path)))
+
+
+def test_spc_single_subfile(tmp_path):
+    path = tmp_path / "scan.spc"
+    _spc(path, [0.5, 1.5, 2.5])
+    blocks = list(spectral_formats.iter_spc(str(path)))
+
+    assert len(blocks) == 1
+    assert blocks[0].names == ["scan"]
+    assert blocks[0].wavelengths.tolist() == [1000.0, 1001.0, 1002.0]
+    assert blocks[0].intensities.tolist() == [[0.5, 1.5, 2.5]]
+
+
+def test_spc_rejects_truncated_and_old_files(tmp_path):
+    path = tmp_path / "short.spc"
+    path.write_bytes(b"\x00\x4b" + bytes(100))
+    with pytest.raises(ValueError):
+        list(spectral_formats.iter_spc(str(path)))
+
+    path = tmp_path / "old.spc"
+    path.write_bytes(b"\x00\x4d" + bytes(600))
+    with pytest.raises(ValueError, match="Old-format"):
+        list(spectral_formats.iter_spc(str(path)))
+
+
+def test_import_file_writes_samples(db, make_dataset, tmp_path):
+    path = tmp_path / "run.jdx"
+    path.write_text(JCAMP)
+    dataset = make_dataset(spectral_storage.STORAGE_JSON)
+
+    result = spectral_formats.import_file(db, dataset, str(path), spectral_formats.FORMAT_JCAMP)
+    db.commit()
+
+    assert result == {"format": "jcamp", "num_samples": 2, "num_bands": 4}
+    samples = spectral_storage.read_samples(db, dataset)
+    assert [s["sample_name"] for s in samples] == ["first", "second"]
+    assert samples[0]["intensities"] == [5.0, 6.0, 7.0, 8.0]
+
+
+def test_import_file_unknown_format(db, make_dataset, tmp_path):
+    dataset = make_dataset(spectral_storage.STORAGE_JSON)
+    with pytest.raises(ValueError):
+        spectral_formats.import_file(db, dataset, str(tmp_path / "x.bin"), "bin")
+
+
+def test_hdf5_reads_label_slices(tmp_path, monkeypatch):
+    h5py = pytest.importorskip("h5py")
+    monkeypatch.setattr(spectral_formats.settings, "INGEST_BATCH_ROWS", 2)
+    path = tmp_path / "cube.h5"
+    with h5py.File(path, "w") as f:
+        f["spectra"] = np.arange(15, dtype=np.float64).reshape(5, 3)
+        f["wavelengths"] = np.array([400.0, 500.0, 600.0])
+        f["labels"] = np.array([[1], [2], [3], [4], [5]])
+        f["names"] = np.array([b"a", b"b", b"c", b"d", b"e"])
+
+    blocks = list(spectral_formats.iter_hdf5(str(path)))
+
+    assert [len(b.names) for b in blocks] == [2, 2, 1]
+    assert sum((b.names for b in blocks), []) == ["a", "b", "c", "d", "e"]
+    assert sum((b.labels for b in blocks), []) == ["1", "2", "3", "4", "5"]
+    assert blocks[2].intensities.tolist() == [[12.0, 13.0, 14.0]]
+
+
+def test_hdf5_vector_slice_shapes():
+    # numpy 数组与 h5py Dataset 的切片语义相同
+    values = np.arange(6)
+    for shaped in (values, values.reshape(1, 6), values.reshape(6, 1), values.reshape(1, 6, 1)):
+        assert spectral_formats._hdf5_vector_slice(shaped, 2, 5).tolist() == [2, 3, 4]
+    assert spectral_formats._hdf5_vector_slice(np.array([[7]]), 0, 1).tolist() == [7]
@@ -0,0 +1,153 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import spectral_storage
+from database import SessionLocal
+from models import Dataset, SpectralSample
+
+WAVELENGTHS = [400.0 + 10 * i for i in range(16)]
+MODES = spectral_storage.STORAGE_MODES
+
+
+def _batch(start, count):
+    matrix = np.arange(start, start + count)[:, None] + np.linspace(0, 1, len(WAVELENGTHS))[None, :]
+    names = [f"s{i}" for i in range(start, start + count)]
+    labels = ["odd" if i % 2 else None for i in range(start, start + count)]
+    return matrix, names, labels
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_append_and_read_round_trip(db, make_dataset, mode):
+    dataset = make_dataset(mode)
+    for start, count in [(0, 3), (3, 4)]:
+        matrix, names, labels = _batch(start, count)
+        assert spectral_storage.append_samples(db, dataset, WAVELENGTHS, matrix, names, labels) == count
+        db.commit()
+
+    expected, names, labels = _batch(0, 7)
+    samples = spectral_storage.read_samples(db, dataset, limit=10)
+    assert [s["sample_name"] for s in samples] == names
+    assert [s["sample_label"] for s in samples] == labels
+    for sample, row in zip(samples, expected):
+        assert sample["wavelengths"] == WAVELENGTHS
+        np.testing.assert_array_equal(sample["intensities"], row)
+    assert dataset.storage_mode == mode
+
+    rows = spectral_storage.read_samples(db, dataset, skip=2, limit=3)
+    assert [s["sample_name"] for s in rows] == names[2:5]
+
+
+def test_columnar_chunk_boundaries(db, make_dataset, monkeypatch):
+    monkeypatch.setattr(spectral_storage.settings, "SPECTRAL_CHUNK_ROWS", 3)
+    dataset = make_dataset(spectral_storage.STORAGE_COLUMNAR)
+    matrix, names, labels = _batch(0, 8)
+    spectral_storage.append_samples(db, dataset, WAVELENGTHS, matrix, names, labels)
+    db.commit()
+
+    np.testing.assert_array_equal(spectral_storage.read_matrix(db, dataset, 2, 7), matrix[2:7])
+
+
+def test_rejects_mismatched_shape(db, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_COLUMNAR)
+    with pytest.raises(ValueError):
+        spectral_storage.append_samples(db, dataset, WAVELENGTHS, np.zeros((2, 3)), ["a", "b"], [None, None])
+
+
+def test_mmap_file_is_not_public(db, make_dataset, client):
+    dataset = make_dataset(spectral_storage.STORAGE_MMAP)
+    matrix, names, labels = _batch(0, 2)
+    spectral_storage.append_samples(db, dataset, WAVELENGTHS, matrix, names, labels)
+    db.commit()
+
+    path = spectral_storage.spectra_path(dataset.id)
+    assert os.path.exists(path)
+    upload_dir = os.path.abspath(spectral_storage.settings.UPLOAD_DIR)
+    assert not os.path.abspath(path).startswith(upload_dir + os.sep)
+    assert client.get(f"/uploads/spectra/dataset_{dataset.id}.npy").status_code == 404
+
+
+def test_mmap_rollback_never_shrinks_file(db, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_MMAP)
+    matrix, names, labels = _batch(0, 4)
+    spectral_storage.append_samples(db, dataset, WAVELENGTHS, matrix, names, labels)
+    db.rollback()
+    size = os.path.getsize(spectral_storage.spectra_path(dataset.id))
+
+    # 回滚留下的行被下一次追加覆盖，文件不会变短
+    matrix, names, labels = _batch(10, 2)
+    spectral_storage.append_samples(db, dataset, WAVELENGTHS, matrix, names, labels)
+    db.commit()
+    assert os.path.getsize(spectral_storage.spectra_path(dataset.id)) == size
+    np.testing.assert_array_equal(spectral_storage.read_matrix(db, dataset, 0, 2), matrix)
+
+
+def test_row_index_is_unique(db, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_COLUMNAR)
+    db.add_all([
+        SpectralSample(dataset_id=dataset.id, sample_name="a", row_index=0),
+        SpectralSample(dataset_id=dataset.id, sample_name="b", row_index=0),
+    ])
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+
+
+@pytest.mark.parametrize("mode", [spectral_storage.STORAGE_COLUMNAR, spectral_storage.STORAGE_MMAP])
+def test_concurrent_appends_get_distinct_rows(db, make_dataset, mode):
+    dataset = make_dataset(mode)
+    first, names, labels = _batch(0, 3)
+    spectral_storage.append_samples(db, dataset, WAVELENGTHS, first, names, labels)
+
+    # 第一个事务提交前，另一个 session 的追加要等待数据集锁
+    second = _batch(3, 2)
+    errors = []
+
+    def append_other():
+        other = SessionLocal()
+        try:
+            spectral_storage.append_samples(other, other.get(Dataset, dataset.id), WAVELENGTHS, *second)
+            other.commit()
+        except Exception as e:  # pragma: no cover - 失败时在主线程断言
+            errors.append(e)
+        finally:
+            other.close()
+
+    thread = threading.Thread(target=append_other)
+    thread.start()
+    thread.join(0.3)
+    assert thread.is_alive()
+    db.commit()
+    thread.join()
+    assert not errors
+
+    db.expire_all()
+    expected = np.vstack([first, second[0]])
+    np.testing.assert_array_equal(spectral_storage.read_matrix(db, dataset, 0, 5), expected)
+    rows = db.query(SpectralSample.row_index).filter(SpectralSample.dataset_id == dataset.id).all()
+    assert sorted(r.row_index for r in rows) == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("mode", [spectral_storage.STORAGE_COLUMNAR, spectral_storage.STORAGE_MMAP])
+def test_convert_dataset(db, make_dataset, mode):
+    dataset = make_dataset(spectral_storage.STORAGE_JSON)
+    matrix, names, labels = _batch(0, 5)
+    spectral_storage.append_samples(db, dataset, WAVELENGTHS, matrix, names, labels)
+    db.commit()
+    # 删除一行后剩余行的 row_index 有空缺，转换时重新编号
+    db.query(SpectralSample).filter(
+        SpectralSample.dataset_id == dataset.id, SpectralSample.row_index == 0
+    ).delete()
+    db.commit()
+    version = dataset.data_version
+
+    assert spectral_storage.convert_dataset(db, dataset, mode) == 4
+    db.commit()
+    assert dataset.storage_mode == mode
+    assert dataset.data_version == version + 1
+    samples = spectral_storage.read_samples(db, dataset, limit=10)
+    assert [s["sample_name"] for s in samples] == names[1:]
+    np.testing.assert_array_equal([s["intensities"] for s in samples], matrix[1:])
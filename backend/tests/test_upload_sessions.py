@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import spectral_storage
+import upload_sessions
+from models import Dataset, UploadSession
+
+CONTENT = b"wavelength,a\n400,1\n410,2\n420,3\n"  # 32 bytes
+CHUNK = 12
+
+
+@pytest.fixture
+def session_id(client, auth_headers, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_JSON)
+    response = client.post("/api/upload/sessions", json={
+        "dataset_id": dataset.id, "filename": "data.csv",
+        "total_size": len(CONTENT), "chunk_size": CHUNK,
+    }, headers=auth_headers)
+    assert response.status_code == 201
+    assert response.json()["num_chunks"] == 3
+    return response.json()["id"]
+
+
+def _put(client, auth_headers, session_id, index, body, checksum=None):
+    headers = dict(auth_headers)
+    if checksum:
+        headers["X-Chunk-SHA256"] = checksum
+    return client.put(f"/api/upload/sessions/{session_id}/chunks/{index}", content=body, headers=headers)
+
+
+def _chunk(index):
+    return CONTENT[index * CHUNK:(index + 1) * CHUNK]
+
+
+def test_chunks_assemble_in_any_order(client, auth_headers, session_id, db):
+    for index in (2, 0):
+        assert _put(client, auth_headers, session_id, index, _chunk(index)).status_code == 200
+    state = client.get(f"/api/upload/sessions/{session_id}", headers=auth_headers).json()
+    assert state["missing_chunks"] == [1]
+    assert client.post(f"/api/upload/sessions/{session_id}/complete", headers=auth_headers).status_code == 409
+
+    assert _put(client, auth_headers, session_id, 1, _chunk(1)).status_code == 200
+    response = client.post(f"/api/upload/sessions/{session_id}/complete", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+    assert not os.path.exists(upload_sessions.partial_path(session_id))
+
+
+def test_bad_resend_keeps_verified_chunk(client, auth_headers, session_id):
+    good = _chunk(0)
+    assert _put(client, auth_headers, session_id, 0, good, hashlib.sha256(good).hexdigest()).status_code == 200
+
+    garbage = b"x" * CHUNK
+    assert _put(client, auth_headers, session_id, 0, garbage, "sha256=" + "0" * 64).status_code == 400
+    assert _put(client, auth_headers, session_id, 0, garbage + b"y").status_code == 413
+    assert _put(client, auth_headers, session_id, 0, garbage[:5]).status_code == 400
+
+    for index in (1, 2):
+        _put(client, auth_headers, session_id, index, _chunk(index))
+    response = client.post(f"/api/upload/sessions/{session_id}/complete", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+    assert not [name for name in os.listdir(upload_sessions.partial_dir()) if name.startswith(f"session_{session_id}.")]
+
+
+def test_interrupted_body_leaves_part_file_untouched(db, client, auth_headers, session_id):
+    good = _chunk(0)
+    _put(client, auth_headers, session_id, 0, good)
+    session = db.get(UploadSession, session_id)
+
+    async def dropped():
+        yield b"zzzz"
+        raise ConnectionResetError("client went away")
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(upload_sessions.receive_chunk(session, 0, dropped()))
+    with open(upload_sessions.partial_path(session_id), "rb") as f:
+        assert f.read(CHUNK) == good
+    assert [name for name in os.listdir(upload_sessions.partial_dir()) if name.endswith(".tmp")] == []
+
+
+def test_partial_files_are_not_public(client, session_id):
+    path = os.path.abspath(upload_sessions.partial_path(session_id))
+    assert os.path.exists(path)
+    assert not path.startswith(os.path.abspath(upload_sessions.settings.UPLOAD_DIR) + os.sep)
+    assert client.get(f"/uploads/partial/session_{session_id}.part").status_code == 404
+
+
+def test_idle_sessions_expire(db, client, auth_headers, session_id, make_dataset):
+    active = client.post("/api/upload/sessions", json={
+        "dataset_id": make_dataset(spectral_storage.STORAGE_JSON).id, "filename": "b.csv",
+        "total_size": len(CONTENT), "chunk_size": CHUNK,
+    }, headers=auth_headers).json()["id"]
+    old = datetime.utcnow() - timedelta(seconds=upload_sessions.settings.UPLOAD_SESSION_TTL + 60)
+    for sid in (session_id, active):
+        db.get(UploadSession, sid).created_at = old
+    db.commit()
+    # 最近收到过分块的会话不算空闲
+    assert _put(client, auth_headers, active, 0, _chunk(0)).status_code == 200
+
+    assert upload_sessions.expire_sessions(db) == 1
+    db.expire_all()
+    assert db.get(UploadSession, session_id).status == upload_sessions.SESSION_ABORTED
+    assert not os.path.exists(upload_sessions.partial_path(session_id))
+    assert db.get(UploadSession, active).status == upload_sessions.SESSION_OPEN
+    assert _put(client, auth_headers, session_id, 0, _chunk(0)).status_code == 409
@@ -0,0 +1,45 @@
+import numpy as np
+
+import spectral_storage
+import wavelength_grids
+from models import SpectralSample, WavelengthGrid
+
+
+def test_identical_axes_share_one_grid(db):
+    axis = [400.0, 410.5, 421.0]
+    first = wavelength_grids.get_or_create_grid(db, axis)
+    second = wavelength_grids.get_or_create_grid(db, np.asarray(axis, dtype=np.float32).astype(np.float64))
+    db.commit()
+    assert first.id == second.id
+    assert db.query(WavelengthGrid).filter(WavelengthGrid.content_hash == wavelength_grids.grid_hash(axis)).count() == 1
+    assert wavelength_grids.load_grid(db, first.id) == axis
+    assert wavelength_grids.get_or_create_grid(db, axis + [431.0]).id != first.id
+    assert wavelength_grids.load_grid(db, None) is None
+
+
+def test_json_rows_reference_grid(db, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_JSON)
+    axis = [500.0, 510.0, 520.0, 530.0]
+    spectral_storage.append_samples(db, dataset, axis, np.ones((3, 4)), ["a", "b", "c"], [None] * 3)
+    db.commit()
+
+    rows = db.query(SpectralSample).filter(SpectralSample.dataset_id == dataset.id).all()
+    assert {row.wavelength_grid_id for row in rows} == {wavelength_grids.get_or_create_grid(db, axis).id}
+    assert all(row.wavelengths is None for row in rows)
+    assert spectral_storage.read_samples(db, dataset)[0]["wavelengths"] == axis
+
+
+def test_dedupe_wavelengths(db, make_dataset):
+    dataset = make_dataset(spectral_storage.STORAGE_JSON)
+    axis = [600.0, 610.0]
+    db.add_all([
+        SpectralSample(dataset_id=dataset.id, sample_name=f"s{i}", wavelengths=axis, intensities=[1.0, 2.0])
+        for i in range(3)
+    ])
+    db.commit()
+
+    assert spectral_storage.dedupe_wavelengths(db, dataset) == 3
+    db.commit()
+    rows = db.query(SpectralSample).filter(SpectralSample.dataset_id == dataset.id).all()
+    assert all(row.wavelengths is None and row.wavelength_grid_id is not None for row in rows)
+    assert [s["wavelengths"] for s in spectral_storage.read_samples(db, dataset)] == [axis] * 3
@@ -0,0 +1,186 @@
+"""
+可续传的分块上传
+1. 创建会话时声明文件大小，超过 MAX_UPLOAD_SIZE 直接拒绝，并在 UPLOAD_PARTIAL_DIR（不公开）预分配稀疏文件
+2. 每个分块按编号 PUT，请求体边读边写到该分块自己的临时文件，超出分块长度立即中止；
+   长度和 SHA-256 校验通过后才复制到 .part 文件中 chunk_index * chunk_size 的位置，
+   校验失败或连接中断的重传不会覆盖已经校验过的数据；各分块可以并行上传
+3. 所有分块到齐后计算整个文件的 SHA-256，rename 到 file_blobs 的存储位置，不再复制文件
+连接中断后查询会话即可得到缺失的分块编号，只重传缺失部分
+超过 UPLOAD_SESSION_TTL 没有新分块的未完成会话标记为 aborted，删除其临时文件
+"""
+from typing import AsyncIterator, List, Optional
+from datetime import datetime, timedelta
+import glob
+import hashlib
+import os
+import uuid
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from config import settings
+from models import UploadChunk, UploadSession
+
+SESSION_OPEN = "open"
+SESSION_COMPLETE = "complete"
+SESSION_ABORTED = "aborted"
+
+
+class ChunkTooLarge(Exception):
+    pass
+
+
+def partial_dir() -> str:
+    return settings.UPLOAD_PARTIAL_DIR
+
+
+def partial_path(session_id: int) -> str:
+    return os.path.join(partial_dir(), f"session_{session_id}.part")
+
+
+def _chunk_temp_path(session_id: int, chunk_index: int) -> str:
+    return os.path.join(partial_dir(), f"session_{session_id}.chunk_{chunk_index}.{uuid.uuid4().hex}.tmp")
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def num_chunks(total_size: int, chunk_size: int) -> int:
+    return max(1, -(-total_size // chunk_size))
+
+
+def chunk_length(session: UploadSession, chunk_index: int) -> int:
+    """第 chunk_index 块应有的字节数，最后一块可以更短"""
+    start = chunk_index * session.chunk_size
+    return max(0, min(session.chunk_size, session.total_size - start))
+
+
+def create_partial_file(session: UploadSession):
+    os.makedirs(partial_dir(), exist_ok=True)
+    with open(partial_path(session.id), "wb") as f:
+        f.truncate(session.total_size)
+
+
+def _pwrite(fd: int, data: bytes, offset: int):
+    if hasattr(os, "pwrite"):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+    else:  # Windows: 每个请求有自己的文件描述符，seek + write 同样互不干扰
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+
+async def receive_chunk(session: UploadSession, chunk_index: int, body: AsyncIterator[bytes]) -> tuple:
+    """
+    把请求体写入分块的临时文件，返回 (临时文件路径, 字节数, SHA-256)
+    超出分块长度时抛出 ChunkTooLarge，不再读取剩余数据；出错或连接中断时删除临时文件
+    """
+    expected = chunk_length(session, chunk_index)
+    path = _chunk_temp_path(session.id, chunk_index)
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(path, "wb") as f:
+            async for data in body:
+                if not data:
+                    continue
+                size += len(data)
+                if size > expected:
+                    raise ChunkTooLarge(
+                        f"Chunk {chunk_index} must be {expected} bytes, received more"
+                    )
+                f.write(data)
+                digest.update(data)
+    except BaseException:
+        _remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
+
+def store_chunk(session: UploadSession, chunk_index: int, temp_path: str):
+    """把校验通过的分块从临时文件复制到 .part 文件中它的位置，然后删除临时文件"""
+    offset = chunk_index * session.chunk_size
+    fd = os.open(partial_path(session.id), os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        with open(temp_path, "rb") as f:
+            for block in iter(lambda: f.read(settings.INGEST_READ_SIZE), b""):
+                _pwrite(fd, block, offset)
+                offset += len(block)
+    finally:
+        os.close(fd)
+        _remove(temp_path)
+
+
+def discard_chunk(temp_path: str):
+    _remove(temp_path)
+
+
+def missing_chunks(session: UploadSession) -> List[int]:
+    received = {chunk.chunk_index for chunk in session.chunks}
+    return [i for i in range(session.num_chunks) if i not in received]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(settings.INGEST_READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def discard(session_id: int):
+    """删除会话的 .part 文件和残留的分块临时文件"""
+    _remove(partial_path(session_id))
+    for path in glob.glob(os.path.join(partial_dir(), f"session_{session_id}.chunk_*.tmp")):
+        _remove(path)
+
+
+def expire_sessions(db: Session) -> int:
+    """超过 UPLOAD_SESSION_TTL 没有新分块的未完成会话标记为 aborted 并删除其文件，返回处理的会话数"""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    last_chunk = db.query(func.max(UploadChunk.received_at)).filter(
+        UploadChunk.session_id == UploadSession.id
+    ).scalar_subquery()
+    stale = db.query(UploadSession).filter(
+        UploadSession.status == SESSION_OPEN,
+        func.coalesce(last_chunk, UploadSession.created_at) < cutoff
+    ).all()
+    for session in stale:
+        session.status = SESSION_ABORTED
+    db.commit()
+    for session in stale:
+        discard(session.id)
+    return len(stale)
+
+
+def session_status(session: UploadSession) -> dict:
+    missing = missing_chunks(session)
+    return {
+        "id": session.id,
+        "dataset_id": session.dataset_id,
+        "filename": session.filename,
+        "total_size": session.total_size,
+        "chunk_size": session.chunk_size,
+        "num_chunks": session.num_chunks,
+        "status": session.status,
+        "received_chunks": session.num_chunks - len(missing),
+        "received_bytes": sum(chunk.size for chunk in session.chunks),
+        "missing_chunks": missing,
+        "created_at": session.created_at,
+        "completed_at": session.completed_at,
+    }
+
+
+def normalize_checksum(value: Optional[str]) -> Optional[str]:
+    """接受 'hex' 或 'sha256=hex' 形式"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.lower().startswith("sha256="):
+        value = value[7:]
+    return value.lower()
@@ -0,0 +1,74 @@
+"""
+共享波长轴字典
+相同的波长轴（按 float64 小端字节的 SHA-256 计算）在 wavelength_grids 表中只存一份，
+数据集和样本通过 wavelength_grid_id 引用；解码后的波长轴缓存在进程内
+"""
+from typing import List, Optional, Sequence
+from collections import OrderedDict
+import hashlib
+import threading
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import WavelengthGrid
+
+GRID_DTYPE = np.dtype("<f8")
+_CACHE_SIZE = 256
+
+# 波长轴写入后不可变，按 id 缓存不需要失效
+_cache: "OrderedDict[int, List[float]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def grid_hash(wavelengths: Sequence[float]) -> str:
+    return hashlib.sha256(np.asarray(wavelengths, dtype=GRID_DTYPE).tobytes()).hexdigest()
+
+
+def get_or_create_grid(db: Session, wavelengths: Sequence[float]) -> WavelengthGrid:
+    """按内容查找波长轴，不存在时创建（不提交事务）"""
+    values = np.asarray(wavelengths, dtype=GRID_DTYPE)
+    content_hash = grid_hash(values)
+
+    grid = db.query(WavelengthGrid).filter(WavelengthGrid.content_hash == content_hash).first()
+    if grid is not None:
+        return grid
+
+    grid = WavelengthGrid(
+        content_hash=content_hash,
+        num_bands=int(values.size),
+        data=values.tobytes(),
+    )
+    try:
+        # 并发上传同一波长轴时只有一个能插入成功，另一个回到查询
+        with db.begin_nested():
+            db.add(grid)
+            db.flush()
+    except IntegrityError:
+        grid = db.query(WavelengthGrid).filter(WavelengthGrid.content_hash == content_hash).one()
+    return grid
+
+
+def load_grid(db: Session, grid_id: Optional[int]) -> Optional[List[float]]:
+    """
+    返回波长轴列表，同一进程内的多次调用共享同一个列表对象
+    调用方不要修改返回值
+    """
+    if grid_id is None:
+        return None
+
+    with _cache_lock:
+        cached = _cache.get(grid_id)
+        if cached is not None:
+            _cache.move_to_end(grid_id)
+            return cached
+
+    grid = db.query(WavelengthGrid).filter(WavelengthGrid.id == grid_id).first()
+    if grid is None:
+        return None
+    values = np.frombuffer(grid.data, dtype=GRID_DTYPE).tolist()
+
+    with _cache_lock:
+        _cache[grid_id] = values
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return values
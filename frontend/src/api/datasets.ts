@@ -1,9 +1,11 @@
 import api from './axios';
-import type { Dataset, DatasetDetail, SpectralSample } from '../types';
+import type { Dataset, DatasetDensity, DatasetDetail, SampleFieldsPage, SampleLOD, SpectralSample } from '../types';
 
 export interface DatasetFilters {
   skip?: number;
   limit?: number;
+  after?: string; // X-Next-Cursor of the previous page
+  fields?: string; // e.g. 'id,name,num_samples'
   search?: string;
   category_id?: number;
   spectral_type?: string;
@@ -42,6 +44,79 @@ export const datasetApi = {
     return response.data;
   },
 
+  // 游标分页：nextCursor 为空表示已经是最后一页
+  getSamplesPage: async (
+    datasetId: number,
+    limit = 1000,
+    after?: string
+  ): Promise<{ samples: SpectralSample[]; nextCursor: string | null }> => {
+    const response = await api.get<SpectralSample[]>(`/api/datasets/${datasetId}/samples`, {
+      params: { limit, ...(after ? { after } : {}) },
+    });
+    return { samples: response.data, nextCursor: response.headers['x-next-cursor'] ?? null };
+  },
+
+  // 只取需要的字段，例如 ['intensities', 'wavelengths']：整页共享的波长轴只返回一次
+  getSampleFields: async (
+    datasetId: number,
+    fields: string[],
+    limit = 1000,
+    after?: string
+  ): Promise<{ page: SampleFieldsPage; nextCursor: string | null }> => {
+    const response = await api.get<SampleFieldsPage>(`/api/datasets/${datasetId}/samples`, {
+      params: { limit, fields: fields.join(','), ...(after ? { after } : {}) },
+    });
+    return { page: response.data, nextCursor: response.headers['x-next-cursor'] ?? null };
+  },
+
+  // application/x-spectra-f32：长度前缀 JSON 头 + float32 强度，强度直接是响应缓冲区上的视图
+  getSamplesBinary: async (
+    datasetId: number,
+    limit = 1000,
+    after?: string
+  ): Promise<{ header: Record<string, any>; intensities: Float32Array; nextCursor: string | null }> => {
+    const response = await api.get<ArrayBuffer>(`/api/datasets/${datasetId}/samples`, {
+      params: { limit, ...(after ? { after } : {}) },
+      headers: { Accept: 'application/x-spectra-f32' },
+      responseType: 'arraybuffer',
+    });
+    const buffer = response.data;
+    const headerLength = new DataView(buffer).getUint32(0, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+    const count = header.shape ? header.shape[0] * header.shape[1] : header.offsets[header.offsets.length - 1];
+    return {
+      header,
+      intensities: new Float32Array(buffer, 4 + headerLength, count),
+      nextCursor: response.headers['x-next-cursor'] ?? null,
+    };
+  },
+
+  // 全部样本的密度图（服务端缓存），用于大数据集的概览
+  getDensity: async (datasetId: number, width = 200, height = 100, label?: string): Promise<DatasetDensity> => {
+    const response = await api.get<DatasetDensity>(`/api/datasets/${datasetId}/density`, {
+      params: { width, height, ...(label ? { label } : {}) },
+    });
+    return response.data;
+  },
+
+  // 长光谱的抽稀曲线：可见范围内最多约 2 x pixels 个点
+  getSampleLod: async (
+    datasetId: number,
+    sampleId: number,
+    pixels = 1000,
+    wlMin?: number,
+    wlMax?: number
+  ): Promise<SampleLOD> => {
+    const response = await api.get<SampleLOD>(`/api/datasets/${datasetId}/samples/${sampleId}/lod`, {
+      params: {
+        pixels,
+        ...(wlMin !== undefined ? { wl_min: wlMin } : {}),
+        ...(wlMax !== undefined ? { wl_max: wlMax } : {}),
+      },
+    });
+    return response.data;
+  },
+
   downloadDataset: async (id: number): Promise<any> => {
     const response = await api.post(`/api/datasets/${id}/download`);
     return response.data;
@@ -1,12 +1,89 @@
 import api from './axios';
 
+// 分块上传：每块单独 PUT，最多同时上传 PARALLEL_CHUNKS 块，失败的块重试 CHUNK_RETRIES 次
+const PARALLEL_CHUNKS = 4;
+const CHUNK_RETRIES = 3;
+
+type UploadProgress = (uploadedBytes: number, totalBytes: number) => void;
+
+// crypto.subtle 只在 https / localhost 下可用，不可用时不发送校验和
+const sha256Hex = async (data: ArrayBuffer): Promise<string | undefined> => {
+  if (!window.crypto?.subtle) return undefined;
+  const digest = await window.crypto.subtle.digest('SHA-256', data);
+  return Array.from(new Uint8Array(digest))
+    .map((b) => b.toString(16).padStart(2, '0'))
+    .join('');
+};
+
+const uploadChunk = async (sessionId: number, index: number, data: ArrayBuffer): Promise<void> => {
+  const checksum = await sha256Hex(data);
+  for (let attempt = 1; ; attempt++) {
+    try {
+      await api.put(`/api/upload/sessions/${sessionId}/chunks/${index}`, data, {
+        headers: {
+          'Content-Type': 'application/octet-stream',
+          ...(checksum ? { 'X-Chunk-SHA256': checksum } : {}),
+        },
+      });
+      return;
+    } catch (error) {
+      if (attempt >= CHUNK_RETRIES) throw error;
+    }
+  }
+};
+
+// 只上传会话中缺失的块，连接中断后可以用同一个 sessionId 继续
+// extractSamples: 上传完成后由后台任务从文件中导入样本
+const resumeDatasetUpload = async (
+  sessionId: number,
+  file: File,
+  onProgress?: UploadProgress,
+  extractSamples: boolean = false
+): Promise<any> => {
+  const { data: session } = await api.get(`/api/upload/sessions/${sessionId}`);
+  const queue: number[] = [...session.missing_chunks];
+  let uploaded: number = session.received_bytes;
+
+  const worker = async () => {
+    while (queue.length > 0) {
+      const index = queue.shift()!;
+      const start = index * session.chunk_size;
+      const data = await file.slice(start, start + session.chunk_size).arrayBuffer();
+      await uploadChunk(sessionId, index, data);
+      uploaded += data.byteLength;
+      onProgress?.(uploaded, file.size);
+    }
+  };
+  await Promise.all(Array.from({ length: PARALLEL_CHUNKS }, worker));
+
+  const response = await api.post(`/api/upload/sessions/${sessionId}/complete`, null, {
+    params: extractSamples ? { extract_samples: true } : undefined,
+  });
+  return response.data;
+};
+
 export const uploadApi = {
-  uploadDatasetFile: async (datasetId: number, file: File): Promise<any> => {
+  uploadDatasetFile: async (
+    datasetId: number,
+    file: File,
+    onProgress?: UploadProgress,
+    extractSamples: boolean = false
+  ): Promise<any> => {
+    const { data: session } = await api.post('/api/upload/sessions', {
+      dataset_id: datasetId,
+      filename: file.name,
+      total_size: file.size,
+    });
+    return resumeDatasetUpload(session.id, file, onProgress, extractSamples);
+  },
+
+  resumeDatasetUpload,
+
+  uploadSamplesCSV: async (datasetId: number, file: File): Promise<any> => {
     const formData = new FormData();
     formData.append('file', file);
-    formData.append('dataset_id', datasetId.toString());
 
-    const response = await api.post('/api/upload/dataset', formData, {
+    const response = await api.post(`/api/upload/samples/${datasetId}`, formData, {
       headers: {
         'Content-Type': 'multipart/form-data',
       },
@@ -14,11 +91,12 @@ export const uploadApi = {
     return response.data;
   },
 
-  uploadSamplesCSV: async (datasetId: number, file: File): Promise<any> => {
+  uploadLabeledFile: async (datasetId: number, file: File, label: string): Promise<any> => {
     const formData = new FormData();
     formData.append('file', file);
+    formData.append('label', label);
 
-    const response = await api.post(`/api/upload/samples/${datasetId}`, formData, {
+    const response = await api.post(`/api/upload/labeled/${datasetId}`, formData, {
       headers: {
         'Content-Type': 'multipart/form-data',
       },
@@ -26,12 +104,15 @@ export const uploadApi = {
     return response.data;
   },
 
-  uploadLabeledFile: async (datasetId: number, file: File, label: string): Promise<any> => {
+  // 一次请求上传多个带标签的文件，后端并行解析并在一个事务中写入
+  uploadLabeledFiles: async (datasetId: number, items: { file: File; label: string }[]): Promise<any> => {
     const formData = new FormData();
-    formData.append('file', file);
-    formData.append('label', label);
+    items.forEach(({ file, label }) => {
+      formData.append('files', file);
+      formData.append('labels', label);
+    });
 
-    const response = await api.post(`/api/upload/labeled/${datasetId}`, formData, {
+    const response = await api.post(`/api/upload/labeled-batch/${datasetId}`, formData, {
       headers: {
         'Content-Type': 'multipart/form-data',
       },
@@ -139,7 +139,7 @@ export default function MultiFileUpload({ onFilesChange, availableLabels = [] }:
       {files.length > 0 && (
         <div className="bg-blue-50 border border-blue-200 rounded-lg p-4">
           <p className="text-sm text-blue-800">
-            💡 提示：每个文件将被标记为对应的标签，CSV 格式应为：波长作为列，样本作为行
+            💡 提示：每个文件将被标记为对应的标签，CSV 格式应为：波长作为列，样本作为行。所有文件会一起上传，任一文件格式错误时整批不会写入
           </p>
         </div>
       )}
@@ -22,7 +22,7 @@ ChartJS.register(
 
 interface SpectralChartProps {
   wavelengths: number[];
-  intensities: number[];
+  intensities: (number | null)[];
   label?: string;
   color?: string;
 }
@@ -7,6 +7,8 @@ import { Download, Eye, Calendar, User, Tag, Trash2 } from 'lucide-react';
 import SpectralChart from '../components/SpectralChart';
 import type { SpectralSample } from '../types';
 
+const LOD_MIN_POINTS = 2000;
+
 export default function DatasetDetail() {
   const { id } = useParams<{ id: string }>();
   const navigate = useNavigate();
@@ -14,6 +16,7 @@ export default function DatasetDetail() {
   const { isAuthenticated, user } = useAuthStore();
   const [samples, setSamples] = useState<SpectralSample[]>([]);
   const [selectedSample, setSelectedSample] = useState<SpectralSample | null>(null);
+  const [chartSeries, setChartSeries] = useState<{ wavelengths: number[]; intensities: (number | null)[] } | null>(null);
 
   useEffect(() => {
     if (id) {
@@ -22,6 +25,22 @@ export default function DatasetDetail() {
     }
   }, [id]);
 
+  // 长光谱改用服务端抽稀的曲线，图表只绘制约 2 x 1000 个点
+  useEffect(() => {
+    if (!selectedSample || selectedSample.wavelengths.length <= LOD_MIN_POINTS) {
+      setChartSeries(selectedSample);
+      return;
+    }
+    let cancelled = false;
+    datasetApi
+      .getSampleLod(selectedSample.dataset_id, selectedSample.id, 1000)
+      .then((lod) => !cancelled && setChartSeries(lod))
+      .catch(() => !cancelled && setChartSeries(selectedSample));
+    return () => {
+      cancelled = true;
+    };
+  }, [selectedSample]);
+
   const loadSamples = async () => {
     if (!id) return;
     try {
@@ -247,11 +266,11 @@ export default function DatasetDetail() {
           <div className="bg-white rounded-lg shadow-md p-6 mb-6">
             <h2 className="text-xl font-bold text-gray-900 mb-4">Spectral Visualization</h2>
             
-            {selectedSample && (
+            {selectedSample && chartSeries && (
               <div className="mb-4">
                 <SpectralChart
-                  wavelengths={selectedSample.wavelengths}
-                  intensities={selectedSample.intensities}
+                  wavelengths={chartSeries.wavelengths}
+                  intensities={chartSeries.intensities}
                   label={selectedSample.sample_name}
                 />
               </div>
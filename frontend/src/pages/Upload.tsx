@@ -339,23 +339,22 @@ export default function Upload() {
       if (uploadMode === 'single') {
         // 单文件上传模式
         if (dataFile) {
-          await uploadApi.uploadDatasetFile(datasetId, dataFile);
+          // 没有单独的样本 CSV 时，由后台任务从数据文件中导入样本
+          await uploadApi.uploadDatasetFile(datasetId, dataFile, undefined, !samplesFile);
         }
         if (samplesFile) {
           await uploadApi.uploadSamplesCSV(datasetId, samplesFile);
         }
       } else {
         // 多文件上传模式
-        for (const fileItem of multipleFiles) {
-          if (!fileItem.label) {
-            setError('请为所有文件指定标签');
-            setIsLoading(false);
-            return;
-          }
-          // 上传文件并与标签关联
-          console.log(`Uploading file: ${fileItem.file.name} with label: ${fileItem.label}`);
-          await uploadApi.uploadLabeledFile(datasetId, fileItem.file, fileItem.label);
+        if (multipleFiles.some((fileItem) => !fileItem.label)) {
+          setError('请为所有文件指定标签');
+          setIsLoading(false);
+          return;
         }
+        // 所有文件和标签在一次请求中上传
+        console.log(`Uploading ${multipleFiles.length} labeled files`);
+        await uploadApi.uploadLabeledFiles(datasetId, multipleFiles);
       }
 
       console.log('Upload completed successfully'); // 添加日志
@@ -57,6 +57,40 @@ export interface SpectralSample {
   created_at: string;
 }
 
+// ?fields= 投影后的一页样本，共享波长轴时 wavelengths 只出现在外层
+export interface SampleFieldsPage {
+  dataset_id: number;
+  fields: string[];
+  wavelength_grid_id: number | null;
+  wavelengths: number[] | null;
+  samples: Partial<SpectralSample>[];
+}
+
+// 波长 x 强度二维直方图，counts[row][col]，row 0 为最低强度
+export interface DatasetDensity {
+  dataset_id: number;
+  width: number;
+  height: number;
+  label: string | null;
+  num_samples: number;
+  wavelength_min: number | null;
+  wavelength_max: number | null;
+  intensity_min: number | null;
+  intensity_max: number | null;
+  max_count: number;
+  counts: number[][];
+}
+
+export interface SampleLOD {
+  dataset_id: number;
+  sample_id: number;
+  level: number;
+  bin_size: number;
+  total_points: number;
+  wavelengths: number[];
+  intensities: (number | null)[];
+}
+
 export interface LoginRequest {
   username: string;
   password: string;